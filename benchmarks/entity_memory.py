@@ -0,0 +1,45 @@
+"""
+Measures the memory held by each Entity and MetadataEntity kept for a spreadsheet row.
+
+Run from the repository root:
+
+    python -m benchmarks.entity_memory [entity count]
+"""
+import sys
+import tracemalloc
+
+from ingest.importer.conversion.metadata_entity import MetadataEntity
+from ingest.importer.submission import Entity
+
+DEFAULT_ENTITY_COUNT = 100000
+
+
+def measure_footprint(create_entity, entity_count):
+    tracemalloc.start()
+    try:
+        baseline, _ = tracemalloc.get_traced_memory()
+        entities = [create_entity(index) for index in range(entity_count)]
+        current, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    del entities
+    return (current - baseline) / entity_count
+
+
+def create_submission_entity(index):
+    return Entity('biomaterial', f'biomaterial_{index}', {'biomaterial_core': {}})
+
+
+def create_metadata_entity(index):
+    return MetadataEntity(concrete_type='donor_organism', domain_type='biomaterial',
+                          object_id=f'biomaterial_{index}')
+
+
+def main(entity_count=DEFAULT_ENTITY_COUNT):
+    print(f'Bytes per entity over {entity_count} entities:')
+    print(f'  Entity:         {measure_footprint(create_submission_entity, entity_count):.0f}')
+    print(f'  MetadataEntity: {measure_footprint(create_metadata_entity, entity_count):.0f}')
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_ENTITY_COUNT)
@@ -0,0 +1,83 @@
+"""
+Times the conversion of worksheet rows into metadata entities, from the row template to the
+dictionaries handed over for submission, both a row at a time and a column at a time.
+
+Run from the repository root:
+
+    python -m benchmarks.row_conversion [row count]
+"""
+import sys
+import timeit
+from collections import namedtuple
+
+from ingest.importer.conversion import data_converter
+from ingest.importer.conversion.conversion_strategy import DirectCellConversion, \
+    ListElementCellConversion, IdentityCellConversion, LinkedIdentityCellConversion, \
+    LinkingDetailCellConversion
+from ingest.importer.conversion.metadata_entity import MetadataEntity
+from ingest.importer.conversion.template_manager import RowTemplate
+
+DEFAULT_ROW_COUNT = 20000
+
+Cell = namedtuple('Cell', ['value'])
+
+DEFAULT_VALUES = {
+    'describedBy': 'https://schema.humancellatlas.org/type/biomaterial/5.1.0/donor_organism',
+    'schema_type': 'biomaterial',
+    'biomaterial_core': {'ncbi_taxon_id': [9606]},
+    'provenance': {'submitter': 'benchmark', 'history': [{'event': 'created'}]}
+}
+
+
+def create_row_template():
+    integer_converter = data_converter.CONVERTER_MAP[data_converter.DataType.INTEGER]
+    cell_conversions = [
+        IdentityCellConversion('donor_organism.biomaterial_core.biomaterial_id', data_converter.DEFAULT),
+        DirectCellConversion('donor_organism.biomaterial_core.biomaterial_name', data_converter.DEFAULT),
+        DirectCellConversion('donor_organism.organism_age', integer_converter),
+        DirectCellConversion('donor_organism.genus_species.text', data_converter.DEFAULT),
+        ListElementCellConversion('donor_organism.publications.title', data_converter.DEFAULT),
+        LinkedIdentityCellConversion('project.project_core.project_shortname', 'project'),
+        LinkingDetailCellConversion('process.process_core.process_id', data_converter.DEFAULT)
+    ]
+    return RowTemplate('biomaterial', 'donor_organism', cell_conversions, default_values=DEFAULT_VALUES)
+
+
+def create_rows(row_count):
+    return [[Cell(f'donor_{index}'), Cell(f'Donor {index}'), Cell(str(index % 90)),
+             Cell('Homo sapiens'), Cell('first paper||second paper'), Cell('project_0'),
+             Cell(f'process_{index}')] for index in range(row_count)]
+
+
+def convert_rows(row_template, rows):
+    return _prepare_submission([row_template.do_import(row) for row in rows])
+
+
+def convert_columns(row_template, rows, batch_size=500):
+    rows_values = [tuple(cell.value for cell in row) for row in rows]
+    metadata_entities = []
+    for start in range(0, len(rows_values), batch_size):
+        metadata_entities.extend(row_template.import_rows(rows_values[start:start + batch_size]))
+    return _prepare_submission(metadata_entities)
+
+
+def _prepare_submission(metadata_entities):
+    for metadata in metadata_entities:
+        module = MetadataEntity(domain_type='biomaterial', concrete_type='donor_organism',
+                                object_id=metadata.object_id,
+                                content={'familial_relationship': {'relationship': 'parent'}})
+        metadata.add_module_entity(module)
+    return [metadata.map_for_submission() for metadata in metadata_entities]
+
+
+def main(row_count=DEFAULT_ROW_COUNT):
+    row_template = create_row_template()
+    rows = create_rows(row_count)
+    for engine, convert in [('row', convert_rows), ('column', convert_columns)]:
+        elapsed = min(timeit.repeat(lambda: convert(row_template, rows), number=1, repeat=3))
+        print(f'[{engine}] Converted {row_count} rows in {elapsed:.3f}s '
+              f'({elapsed / row_count * 1e6:.1f}us per row)')
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_ROW_COUNT)
@@ -8,7 +8,18 @@ import sys
 
 from optparse import OptionParser
 
-from ingest.exporter.ingestexportservice import IngestExporter
+from ingest.exporter.ingestexportservice import IngestExporter, DEFAULT_EXPORT_WORKERS
+
+
+def read_process_uuids(options):
+    process_uuids = []
+    if options.processUuids:
+        process_uuids.extend(uuid.strip() for uuid in options.processUuids.split(','))
+    if options.processUuidFile:
+        with open(options.processUuidFile) as process_uuid_file:
+            process_uuids.extend(line.strip() for line in process_uuid_file)
+    return [uuid for uuid in process_uuids if uuid and not uuid.startswith('#')]
+
 
 if __name__ == '__main__':
     format = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
@@ -19,6 +30,12 @@ if __name__ == '__main__':
                       help="Submission envelope UUID for which to generate the bundle")
     parser.add_option("-p", "--processUuid",
                       help="Process UUID")
+    parser.add_option("-P", "--processUuids",
+                      help="comma separated process UUIDs to export as a batch")
+    parser.add_option("-f", "--processUuidFile", metavar="FILE",
+                      help="file listing the process UUIDs to export as a batch, one per line")
+    parser.add_option("-w", "--workers", type="int", default=DEFAULT_EXPORT_WORKERS,
+                      help="the number of bundles exported at a time in a batch")
     parser.add_option("-D", "--dry", help="do a dry run without submitting to ingest", action="store_true",
                       default=False)
     parser.add_option("-o", "--output", dest="output",
@@ -35,7 +52,8 @@ if __name__ == '__main__':
         print ("You must supply a Submission Envelope UUID")
         exit(2)
 
-    if not options.processUuid:
+    process_uuids = read_process_uuids(options)
+    if not options.processUuid and not process_uuids:
         print ("You must supply a process UUID.")
         exit(2)
 
@@ -45,4 +63,9 @@ if __name__ == '__main__':
         exit(2)
 
     exporter = IngestExporter(options)
-    exporter.export_bundle(options.submissionEnvelopeUuid, options.processUuid)
+    if process_uuids:
+        if options.processUuid:
+            process_uuids.insert(0, options.processUuid)
+        exporter.export_bundles(options.submissionEnvelopeUuid, process_uuids, max_workers=options.workers)
+    else:
+        exporter.export_bundle(options.submissionEnvelopeUuid, options.processUuid)
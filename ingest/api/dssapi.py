@@ -7,6 +7,7 @@ import hca
 import json
 import logging
 import os
+import random
 import time
 from ingest.utils.s2s_token_client import S2STokenClient
 from ingest.utils.token_manager import TokenManager
@@ -17,6 +18,20 @@ __date__ = "12/09/2017"
 
 AUTH_INFO_ENV_VAR = "EXPORTER_AUTH_INFO"
 
+env_retry_base_delay = os.environ.get('DSS_RETRY_BASE_DELAY')
+DEFAULT_RETRY_BASE_DELAY = float(env_retry_base_delay) if env_retry_base_delay else 2.0
+
+env_retry_max_delay = os.environ.get('DSS_RETRY_MAX_DELAY')
+DEFAULT_RETRY_MAX_DELAY = float(env_retry_max_delay) if env_retry_max_delay else 60.0
+
+
+def backoff_delay(attempt, base_delay=DEFAULT_RETRY_BASE_DELAY, max_delay=DEFAULT_RETRY_MAX_DELAY):
+    """
+    Returns how long to wait after the given failed attempt: a random time up to an exponentially
+    growing, capped limit, so that files failing together do not retry in lock step.
+    """
+    return random.uniform(0, min(max_delay, base_delay * 2 ** (attempt - 1)))
+
 
 class DssApi:
     def __init__(self, url=None):
@@ -39,7 +54,11 @@ class DssApi:
         self.hca_client.host = self.url + "/v1"
         self.creator_uid = 8008
 
-    def put_file(self, bundle_uuid, file):
+    def put_file(self, bundle_uuid, file, deadline=None):
+        """
+        Creates the file in DSS, retrying failed attempts after a jittered exponential backoff.
+        No retry is made that would start after the deadline, a time.time() value, if given.
+        """
         url = file["url"]
         uuid = file["dss_uuid"]
 
@@ -88,10 +107,14 @@ class DssApi:
                         str(e))
                 )
 
+                delay = backoff_delay(tries)
                 if not tries < max_retries:
                     raise Error(e)
+                elif deadline is not None and time.time() + delay > deadline:
+                    self.logger.error(f'Giving up on file {file["name"]}, not enough time left before the deadline to retry.')
+                    raise Error(e)
                 else:
-                    time.sleep(60)
+                    time.sleep(delay)
 
     def put_bundle(self, bundle_uuid, bundle_files):
         bundle = None
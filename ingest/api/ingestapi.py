@@ -12,11 +12,13 @@ from urllib.parse import urljoin, quote
 import requests
 from requests import HTTPError
 
-from ingest.api.requests_utils import optimistic_session
+from ingest.api.requests_utils import pooled_session
+
+DEFAULT_LINK_CHUNK_SIZE = 100
 
 
 class IngestApi:
-    def __init__(self, url=None, ingest_api_root=None):
+    def __init__(self, url=None, ingest_api_root=None, session=None):
         format = '[%(filename)s:%(lineno)s - %(funcName)20s() ] %(asctime)s - %(name)s - %(levelname)s - %(message)s'
         logging.basicConfig(format=format)
         logging.getLogger("requests").setLevel(logging.WARNING)
@@ -32,17 +34,20 @@ class IngestApi:
         self.headers = {'Content-type': 'application/json'}
         self.submission_links = {}
         self.token = None
+
+        # a single pooled session is shared by every call so that connections are reused
+        self.session = session if session is not None else pooled_session()
         self.ingest_api_root = ingest_api_root if ingest_api_root is not None else self.get_root_url()
 
     def set_token(self, token):
         self.token = token
 
     def get_root_url(self):
-        reply = requests.get(self.url, headers=self.headers)
+        reply = self.session.get(self.url, headers=self.headers)
         return reply.json()["_links"]
 
     def get_link_from_resource_url(self, resource_url, link_name):
-        r = requests.get(resource_url, headers=self.headers)
+        r = self.session.get(resource_url, headers=self.headers)
         r.raise_for_status()
         links = r.json().get('_links', {})
         return links.get(link_name, {}).get('href')
@@ -58,7 +63,7 @@ class IngestApi:
 
         if latest_only:
             search_url = self.get_link_from_resource_url(schema_url, "search")
-            r = requests.get(search_url, headers=self.headers)
+            r = self.session.get(search_url, headers=self.headers)
             if r.status_code == requests.codes.ok:
                 response_j = json.loads(r.text)
                 all_schemas = list(self.getRelatedEntities("latestSchemas", response_j, "schemas"))
@@ -83,8 +88,8 @@ class IngestApi:
 
     def getSubmissions(self):
         params = {'sort': 'submissionDate,desc'}
-        r = requests.get(self.ingest_api_root["submissionEnvelopes"]["href"].rsplit("{")[0], params=params,
-                         headers=self.headers)
+        r = self.session.get(self.ingest_api_root["submissionEnvelopes"]["href"].rsplit("{")[0], params=params,
+                             headers=self.headers)
         if r.status_code == requests.codes.ok:
             return json.loads(r.text)["_embedded"]["submissionEnvelopes"]
 
@@ -96,7 +101,7 @@ class IngestApi:
             headers = {'If-Modified-Since': datetimeUTC}
 
         self.logger.info('headers:' + str(headers))
-        r = requests.get(submissionUrl, headers=headers)
+        r = self.session.get(submissionUrl, headers=headers)
 
         if r.status_code == requests.codes.ok:
             submission = json.loads(r.text)
@@ -106,7 +111,7 @@ class IngestApi:
 
     def getProjects(self, id):
         submissionUrl = self.url + '/submissionEnvelopes/' + id + '/projects'
-        r = requests.get(submissionUrl, headers=self.headers)
+        r = self.session.get(submissionUrl, headers=self.headers)
         projects = []
         if r.status_code == requests.codes.ok:
             projects = json.loads(r.text)
@@ -114,7 +119,7 @@ class IngestApi:
 
     def getProjectById(self, id):
         submissionUrl = self.url + '/projects/' + id
-        r = requests.get(submissionUrl, headers=self.headers)
+        r = self.session.get(submissionUrl, headers=self.headers)
         if r.status_code == requests.codes.ok:
             project = json.loads(r.text)
             return project
@@ -131,20 +136,20 @@ class IngestApi:
         if entity_type == 'submissionEnvelopes':
             url = self.url + f'/{entity_type}/search/findByUuidUuid?uuid=' + uuid
 
-        r = requests.get(url, headers=self.headers)
+        r = self.session.get(url, headers=self.headers)
         r.raise_for_status()
         return r.json()
 
     def getFileBySubmissionUrlAndFileName(self, submissionUrl, fileName):
         searchUrl = self._get_url_for_link(self.url + '/files/search', 'findBySubmissionEnvelopesInAndFileName')
         searchUrl = searchUrl.replace('{?submissionEnvelope,fileName}', '')
-        r = requests.get(searchUrl, params={'submissionEnvelope': submissionUrl, 'fileName': fileName})
+        r = self.session.get(searchUrl, params={'submissionEnvelope': submissionUrl, 'fileName': fileName})
         if r.status_code == requests.codes.ok:
             return r.json()
         return None
 
     def getSubmissionEnvelope(self, submissionUrl):
-        r = requests.get(submissionUrl, headers=self.headers)
+        r = self.session.get(submissionUrl, headers=self.headers)
         if r.status_code == requests.codes.ok:
             submissionEnvelope = json.loads(r.text)
             return submissionEnvelope
@@ -154,7 +159,7 @@ class IngestApi:
     def getSubmissionByUuid(self, submissionUuid):
         searchByUuidLink = self.get_link_from_resource_url(self.url + '/submissionEnvelopes/search', 'findByUuid')
         searchByUuidLink = searchByUuidLink.replace('{?uuid}', '')  # TODO: use a REST traverser instead of requests?
-        r = requests.get(searchByUuidLink, params={'uuid': submissionUuid})
+        r = self.session.get(searchByUuidLink, params={'uuid': submissionUuid})
 
         if 200 <= r.status_code < 300:
             return r.json()
@@ -163,7 +168,7 @@ class IngestApi:
 
     def getFiles(self, id):
         submissionUrl = self.url + '/submissionEnvelopes/' + id + '/files'
-        r = requests.get(submissionUrl, headers=self.headers)
+        r = self.session.get(submissionUrl, headers=self.headers)
         files = []
         if r.status_code == requests.codes.ok:
             files = json.loads(r.text)
@@ -171,7 +176,7 @@ class IngestApi:
 
     def getBundleManifests(self, id):
         submissionUrl = self.url + '/submissionEnvelopes/' + id + '/bundleManifests'
-        r = requests.get(submissionUrl, headers=self.headers)
+        r = self.session.get(submissionUrl, headers=self.headers)
         bundleManifests = []
 
         if r.status_code == requests.codes.ok:
@@ -185,8 +190,8 @@ class IngestApi:
         }
 
         try:
-            r = requests.post(self.ingest_api_root["submissionEnvelopes"]["href"].rsplit("{")[0], data="{}",
-                              headers=auth_headers)
+            r = self.session.post(self.ingest_api_root["submissionEnvelopes"]["href"].rsplit("{")[0], data="{}",
+                                  headers=auth_headers)
             r.raise_for_status()
             submission = r.json()
             submission_url = submission["_links"]["self"]["href"].rsplit("{")[0]
@@ -198,7 +203,7 @@ class IngestApi:
 
     def get_submission_links(self, submission_url):
         if not self.submission_links.get(submission_url):
-            r = requests.get(submission_url, headers=self.headers)
+            r = self.session.get(submission_url, headers=self.headers)
             r.raise_for_status()
             self.submission_links[submission_url] = r.json()["_links"]
 
@@ -212,7 +217,7 @@ class IngestApi:
         return link
 
     def finishSubmission(self, submissionUrl):
-        r = requests.put(submissionUrl, headers=self.headers)
+        r = self.session.put(submissionUrl, headers=self.headers)
         if r.status_code == requests.codes.update:
             self.logger.info("Submission complete!")
             return r.text
@@ -221,13 +226,13 @@ class IngestApi:
         state_url = self.getSubmissionStateUrl(submissionId, state)
 
         if state_url:
-            r = requests.put(state_url, headers=self.headers)
+            r = self.session.put(state_url, headers=self.headers)
 
         return self.handleResponse(r)
 
     def getSubmissionStateUrl(self, submissionId, state):
         submissionUrl = self.getSubmissionUri(submissionId)
-        response = requests.get(submissionUrl, headers=self.headers)
+        response = self.session.get(submissionUrl, headers=self.headers)
         submission = self.handleResponse(response)
 
         if submission and state in submission['_links']:
@@ -249,7 +254,7 @@ class IngestApi:
         return urljoin(self.url, callback_link)
 
     def get_process(self, process_url):
-        r = requests.get(process_url, headers=self.headers)
+        r = self.session.get(process_url, headers=self.headers)
         r.raise_for_status()
         return r.json()
 
@@ -257,7 +262,7 @@ class IngestApi:
         return self.getEntities(submissionUrl, "analyses")
 
     def getEntities(self, submissionUrl, entityType, pageSize=None):
-        r = requests.get(submissionUrl, headers=self.headers)
+        r = self.session.get(submissionUrl, headers=self.headers)
         if r.status_code == requests.codes.ok:
             if entityType in json.loads(r.text)["_links"]:
                 if not pageSize:
@@ -270,7 +275,7 @@ class IngestApi:
         if pageSize:
             params = {"size": pageSize}
 
-        r = requests.get(url, headers=self.headers, params=params)
+        r = self.session.get(url, headers=self.headers, params=params)
         r.raise_for_status()
         if r.status_code == requests.codes.ok:
             if "_embedded" in json.loads(r.text):
@@ -288,7 +293,7 @@ class IngestApi:
                 yield entity
 
     def _updateStatusToPending(self, submissionUrl):
-        r = requests.patch(submissionUrl, data="{\"submissionStatus\" : \"Pending\"}", headers=self.headers)
+        r = self.session.patch(submissionUrl, data="{\"submissionStatus\" : \"Pending\"}", headers=self.headers)
 
     def createProject(self, submissionUrl, jsonObject):
         return self.createEntity(submissionUrl, jsonObject, "projects", self.token)
@@ -303,7 +308,7 @@ class IngestApi:
         return self.createEntity(submissionUrl, jsonObject, 'submissionManifest')
 
     def patch(self, url, patch):
-        r = requests.patch(url, json=patch)
+        r = self.session.patch(url, json=patch)
         r.raise_for_status()
         return r
 
@@ -328,9 +333,7 @@ class IngestApi:
         }
 
         time.sleep(0.001)
-        with optimistic_session(fileSubmissionsUrl) as session:
-            r = session.post(fileSubmissionsUrl, data=json.dumps(fileToCreateObject),
-                              headers=self.headers)
+        r = self.session.post(fileSubmissionsUrl, data=json.dumps(fileToCreateObject), headers=self.headers)
 
         # TODO Investigate why core is returning internal server error
         if r.status_code == requests.codes.conflict or r.status_code == requests.codes.internal_server_error:
@@ -348,7 +351,7 @@ class IngestApi:
 
                 fileUrl = fileInIngest['_links']['self']['href']
                 time.sleep(0.001)
-                r = requests.patch(fileUrl, data=json.dumps({'content': content}), headers=self.headers)
+                r = self.session.patch(fileUrl, data=json.dumps({'content': content}), headers=self.headers)
                 self.logger.debug(f'Updating existing content of file {fileUrl}.')
 
         r.raise_for_status()
@@ -362,10 +365,9 @@ class IngestApi:
         submissionUrl = self.get_link_in_submisssion(submissionUrl, entityType)
 
         self.logger.debug("posting " + submissionUrl)
-        with optimistic_session(submissionUrl) as session:
-            r = session.post(submissionUrl, data=jsonObject, headers=auth_headers)
-            r.raise_for_status()
-            return r.json()
+        r = self.session.post(submissionUrl, data=jsonObject, headers=auth_headers)
+        r.raise_for_status()
+        return r.json()
 
     # given a HCA object return the URI for the object from ingest
     def getObjectId(self, entity):
@@ -375,8 +377,8 @@ class IngestApi:
         raise ValueError('Can\'t get id for ' + json.dumps(entity) + ' is it a HCA entity?')
 
     def getObjectUuid(self, entityUri):
-        r = requests.get(entityUri,
-                         headers=self.headers)
+        r = self.session.get(entityUri,
+                             headers=self.headers)
         if r.status_code == requests.codes.ok:
             return json.loads(r.text)["uuid"]["uuid"]
 
@@ -390,6 +392,33 @@ class IngestApi:
         if not relationship:
             raise ValueError("Error: relationship is None")
 
+        fromUri = self._get_relationship_uri(fromEntity, relationship)
+        toUri = self.getObjectId(toEntity)
+
+        self._retry_when_http_error(0, self._post_link_entity, fromUri, toUri)
+
+    def link_entities(self, from_entity, to_entities, relationship, chunk_size=DEFAULT_LINK_CHUNK_SIZE):
+        """
+        Links all the given entities to from_entity under the same relationship. The targets are
+        sent as a single text/uri-list body, in chunks of at most chunk_size URIs per request.
+        """
+        if not from_entity:
+            raise ValueError("Error: fromEntity is None")
+
+        if not to_entities or not all(to_entities):
+            raise ValueError("Error: toEntities is empty or contains None")
+
+        if not relationship:
+            raise ValueError("Error: relationship is None")
+
+        from_uri = self._get_relationship_uri(from_entity, relationship)
+        to_uris = [self.getObjectId(to_entity) for to_entity in to_entities]
+
+        for start in range(0, len(to_uris), chunk_size):
+            uri_list = '\n'.join(to_uris[start:start + chunk_size])
+            self._retry_when_http_error(0, self._post_link_entity, from_uri, uri_list)
+
+    def _get_relationship_uri(self, fromEntity, relationship):
         # check each dict in turn for non-None-ness
 
         fromEntityLinks = fromEntity["_links"] if "_links" in fromEntity else None
@@ -404,18 +433,15 @@ class IngestApi:
         if not fromEntityLinksRelationshipHref:
             raise ValueError("Error: fromEntityLinksRelationship for relationship {0} has no href".format(relationship))
 
-        fromUri = fromEntity["_links"][relationship]["href"]
-        toUri = self.getObjectId(toEntity)
-
-        self._retry_when_http_error(0, self._post_link_entity, fromUri, toUri)
+        return fromEntity["_links"][relationship]["href"]
 
     def _post_link_entity(self, fromUri, toUri):
         self.logger.debug('fromUri ' + fromUri + ' toUri:' + toUri);
 
         headers = {'Content-type': 'text/uri-list'}
 
-        r = requests.post(fromUri.rsplit("{")[0],
-                          data=toUri.rsplit("{")[0], headers=headers)
+        r = self.session.post(fromUri.rsplit("{")[0],
+                              data=toUri.rsplit("{")[0], headers=headers)
 
         return r
 
@@ -458,15 +484,15 @@ class IngestApi:
 
     def _request_post(self, url, data, params, headers):
         if params:
-            return requests.post(url, data=data, params=params, headers=headers)
+            return self.session.post(url, data=data, params=params, headers=headers)
 
-        return requests.post(url, data=data, headers=headers)
+        return self.session.post(url, data=data, headers=headers)
 
     def _request_put(self, url, data, params, headers):
         if params:
-            return requests.put(url, data=data, params=params, headers=headers)
+            return self.session.put(url, data=data, params=params, headers=headers)
 
-        return requests.put(url, data=data, headers=headers)
+        return self.session.put(url, data=data, headers=headers)
 
     def createBundleManifest(self, bundleManifest):
         r = self._retry_when_http_error(0, self._post_bundle_manifest, bundleManifest, self.ingest_api_root["bundleManifests"]["href"].rsplit("{")[0])
@@ -480,7 +506,7 @@ class IngestApi:
             self.logger.info("successfully created bundle manifest")
 
     def _post_bundle_manifest(self, bundleManifest, url):
-        return requests.post(url, data=json.dumps(bundleManifest.__dict__), headers=self.headers)
+        return self.session.post(url, data=json.dumps(bundleManifest.__dict__), headers=self.headers)
 
     def updateSubmissionWithStagingCredentials(self, subUrl, uuid, submissionCredentials):
         stagingDetails = \
@@ -503,12 +529,12 @@ class IngestApi:
     def retrySubmissionUpdateWithStagingDetails(self, subUrl, stagingDetails, tries):
         if tries < 5:
             # do a GET request to get latest submission envelope
-            entity_response = requests.get(subUrl)
+            entity_response = self.session.get(subUrl)
             etag = entity_response.headers['ETag']
             if etag:
                 # set the etag header so we get 412 if someone beats us to set validating
                 self.headers['If-Match'] = etag
-                r = requests.patch(subUrl, data=json.dumps(stagingDetails))
+                r = self.session.patch(subUrl, data=json.dumps(stagingDetails))
                 try:
                     r.raise_for_status()
                     return True
@@ -6,9 +6,22 @@ from requests.adapters import HTTPAdapter
 env_max_retries = os.environ.get('REQUESTS_MAX_RETRIES')
 DEFAULT_MAX_RETRIES = int(env_max_retries) if env_max_retries else 3
 
+env_pool_size = os.environ.get('REQUESTS_POOL_SIZE')
+DEFAULT_POOL_SIZE = int(env_pool_size) if env_pool_size else 20
 
-def optimistic_session(url_prefix, max_retries=DEFAULT_MAX_RETRIES):
+
+def pooled_session(pool_size=DEFAULT_POOL_SIZE, max_retries=DEFAULT_MAX_RETRIES, pool_block=False,
+                   keep_alive=True):
+    """
+    Creates a long lived session whose connections are kept alive and reused across requests.
+    The pool size bounds the number of connections kept open per host, and should be at least
+    as large as the number of threads sharing the session.
+    """
     session = requests.Session()
-    retry_adapter = HTTPAdapter(max_retries=max_retries)
-    session.mount(url_prefix, retry_adapter)
+    retry_adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size,
+                                max_retries=max_retries, pool_block=pool_block)
+    session.mount('http://', retry_adapter)
+    session.mount('https://', retry_adapter)
+    if not keep_alive:
+        session.headers['Connection'] = 'close'
     return session
@@ -9,22 +9,67 @@ __author__ = "jupp"
 __license__ = "Apache 2.0"
 
 
+import copy
 import json
 import logging
 import os
 import uuid
 import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
 import polling
 
 import ingest.api.dssapi as dssapi
 import ingest.api.ingestapi as ingestapi
 import ingest.api.stagingapi as stagingapi
+from ingest.exporter.provenance_cache import ProvenanceCache, DEFAULT_CACHE_SIZE, DEFAULT_CACHE_DIR
 from requests.exceptions import HTTPError
 
 DEFAULT_INGEST_URL = os.environ.get('INGEST_API', 'http://api.ingest.dev.data.humancellatlas.org')
 DEFAULT_STAGING_URL = os.environ.get('STAGING_API', 'http://upload.dev.data.humancellatlas.org')
 DEFAULT_DSS_URL = os.environ.get('DSS_API', 'http://dss.dev.data.humancellatlas.org')
 
+env_fetch_workers = os.environ.get('EXPORTER_FETCH_WORKERS')
+DEFAULT_FETCH_WORKERS = int(env_fetch_workers) if env_fetch_workers else 8
+
+# the fetch, upload and DSS workers of a bundle export are kept within the size of the
+# connection pools of the api sessions; in a batch export, they are shared out among the bundles
+# exported at a time, so that the batch as a whole stays within the same bounds
+env_upload_workers = os.environ.get('EXPORTER_UPLOAD_WORKERS')
+DEFAULT_UPLOAD_WORKERS = int(env_upload_workers) if env_upload_workers else 8
+
+env_dss_workers = os.environ.get('EXPORTER_DSS_WORKERS')
+DEFAULT_DSS_WORKERS = int(env_dss_workers) if env_dss_workers else 8
+
+# the time, in seconds, that all the files of a bundle have to be created in DSS
+env_dss_deadline = os.environ.get('EXPORTER_DSS_DEADLINE')
+DEFAULT_DSS_DEADLINE = int(env_dss_deadline) if env_dss_deadline else 1200
+
+# copies to DSS are checked every second at first, then less and less often
+env_verify_timeout = os.environ.get('EXPORTER_VERIFY_TIMEOUT')
+DEFAULT_VERIFY_TIMEOUT = int(env_verify_timeout) if env_verify_timeout else 1200
+
+env_verify_initial_interval = os.environ.get('EXPORTER_VERIFY_INITIAL_INTERVAL')
+DEFAULT_VERIFY_INITIAL_INTERVAL = float(env_verify_initial_interval) if env_verify_initial_interval else 1.0
+
+env_verify_max_interval = os.environ.get('EXPORTER_VERIFY_MAX_INTERVAL')
+DEFAULT_VERIFY_MAX_INTERVAL = float(env_verify_max_interval) if env_verify_max_interval else 30.0
+
+env_export_workers = os.environ.get('EXPORTER_EXPORT_WORKERS')
+DEFAULT_EXPORT_WORKERS = int(env_export_workers) if env_export_workers else 4
+
+# relationships of a process that make up a bundle, with the type of the related entities
+PROCESS_RELATIONSHIPS = [
+    ('inputBiomaterials', 'biomaterials'),
+    ('inputFiles', 'files'),
+    ('derivedBiomaterials', 'biomaterials'),
+    ('derivedFiles', 'files'),
+    ('protocols', 'protocols')
+]
+
+# upstream processes are found through the processes that derived the inputs of a process
+INPUT_RELATIONSHIPS = ['inputBiomaterials', 'inputFiles']
+
 ERROR_TEMPLATE = {
     'errorCode': 'ingest.exporter.error',
     'message': 'Error occurred while attempting to export bundle.'
@@ -33,7 +78,9 @@ ERROR_TEMPLATE = {
 # TODO shouldn't source from environment variables, must pass config or params instead, throw an error if not in config
 
 class IngestExporter:
-    def __init__(self, options=None):
+    def __init__(self, options=None, ingest_api=None, fetch_workers=DEFAULT_FETCH_WORKERS,
+                 upload_workers=DEFAULT_UPLOAD_WORKERS, dss_workers=DEFAULT_DSS_WORKERS,
+                 dss_deadline=DEFAULT_DSS_DEADLINE, cache_size=DEFAULT_CACHE_SIZE, cache_dir=DEFAULT_CACHE_DIR):
         format = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
         logging.basicConfig(format=format)
         self.logger = logging.getLogger(__name__)
@@ -48,18 +95,87 @@ class IngestExporter:
 
         self.staging_api = stagingapi.StagingApi()
         self.dss_api = dssapi.DssApi()
-        self.ingest_api = ingestapi.IngestApi(self.ingestUrl)
-        self.related_entities_cache = {}
+        # an existing IngestApi can be passed in so that its pooled session is shared
+        self.ingest_api = ingest_api if ingest_api else ingestapi.IngestApi(self.ingestUrl)
+        self.fetch_workers = fetch_workers
+        self.upload_workers = upload_workers
+        self.dss_workers = dss_workers
+        self.dss_deadline = dss_deadline
+        self.verify_timeout = DEFAULT_VERIFY_TIMEOUT
+        self.verify_initial_interval = DEFAULT_VERIFY_INITIAL_INTERVAL
+        self.verify_max_interval = DEFAULT_VERIFY_MAX_INTERVAL
+        self.cache_size = cache_size
+        self.cache_dir = cache_dir
+        self.provenance_cache = ProvenanceCache(None, max_size=cache_size)
+        # seconds spent waiting for DSS to copy the files of each exported bundle, by bundle uuid
+        self.verification_times = {}
 
     def export_bundle(self, submission_uuid, process_uuid):
-        start_time = time.time()
-        self.related_entities_cache = {}
-        saved_bundle_uuid = None
+        self.use_submission_cache(submission_uuid)
+        self._check_upload_area(submission_uuid)
+        submission = self.ingest_api.getEntityByUuid('submissionEnvelopes', submission_uuid)
+        return self._export_bundle(submission_uuid, submission, process_uuid)
+
+    def export_bundles(self, submission_uuid, process_uuids, max_workers=DEFAULT_EXPORT_WORKERS):
+        """
+        Exports a bundle for each of the processes of a submission, max_workers at a time. The
+        clients and the provenance cache of this exporter are shared by all the bundles, and so
+        are its fetch, upload and DSS workers, which are divided among the bundles exported at a
+        time. Returns the bundle UUIDs by process UUID. Every process is exported before failures, if
+        any, are raised together in a BatchExportError.
+        """
+        self.use_submission_cache(submission_uuid)
+        self._check_upload_area(submission_uuid)
+        submission = self.ingest_api.getEntityByUuid('submissionEnvelopes', submission_uuid)
 
+        start_time = time.time()
+        bundle_exporter = self._bundle_exporter(max_workers)
+        bundle_uuids = {}
+        failures = {}
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            exports = [(process_uuid, executor.submit(bundle_exporter._export_bundle, submission_uuid, submission,
+                                                      process_uuid))
+                       for process_uuid in dict.fromkeys(process_uuids)]
+            for process_uuid, future in exports:
+                try:
+                    bundle_uuids[process_uuid] = future.result()
+                except Exception as e:
+                    self.logger.error(f'Export of bundle for process with UUID {process_uuid} failed: {str(e)}')
+                    failures[process_uuid] = e
+
+        self.logger.info(f'Exported {len(bundle_uuids)} of {len(exports)} bundles.')
+        self.logger.info("Execution Time: %s seconds" % (time.time() - start_time))
+        if failures:
+            raise BatchExportError(failures, bundle_uuids)
+        return bundle_uuids
+
+    def _bundle_exporter(self, export_workers):
+        # shares the clients, the cache and the verification times of this exporter, with a share
+        # of its workers
+        bundle_exporter = copy.copy(self)
+        bundle_exporter.fetch_workers = max(1, self.fetch_workers // export_workers)
+        bundle_exporter.upload_workers = max(1, self.upload_workers // export_workers)
+        bundle_exporter.dss_workers = max(1, self.dss_workers // export_workers)
+        return bundle_exporter
+
+    def use_submission_cache(self, submission_uuid):
+        """
+        Keeps the provenance cache across the exports of bundles of the same submission, and
+        starts a new one for a different submission.
+        """
+        if self.provenance_cache.submission_uuid != submission_uuid:
+            self.provenance_cache = ProvenanceCache(submission_uuid, max_size=self.cache_size,
+                                                    cache_dir=self.cache_dir)
+
+    def _check_upload_area(self, submission_uuid):
         if not self.dryrun and not self.staging_api.hasStagingArea(submission_uuid):
             error_message = "Can't do export as no upload area has been created."
             raise NoUploadAreaFoundError(error_message)
 
+    def _export_bundle(self, submission_uuid, submission, process_uuid):
+        start_time = time.time()
+        saved_bundle_uuid = None
+
         self.logger.info('Export bundle for process with UUID ' + process_uuid)
 
         self.logger.info('Retrieving all process information...')
@@ -68,7 +184,6 @@ class IngestExporter:
         process_info = self.get_all_process_info(process)
 
         self.logger.info('Generating bundle files...')
-        submission = self.ingest_api.getEntityByUuid('submissionEnvelopes', submission_uuid)
         is_indexed = submission['triggersAnalysis']
 
         metadata_by_type = self.get_metadata_by_type(process_info)
@@ -130,7 +245,7 @@ class IngestExporter:
 
                 # check all created files
                 self.logger.info('Verifying if all files get successfully copied to DSS...')
-                self.verify_files(created_files)
+                self.verification_times[bundle_uuid] = self.verify_files(created_files)
 
                 self.logger.info('Saving bundle in DSS...')
                 self.put_bundle_in_dss(bundle_uuid, created_files)
@@ -188,10 +303,11 @@ class IngestExporter:
             project_uuid = project_uuid_lists[0][0]
             process_info.project = self.ingest_api.getProjectByUuid(project_uuid)
 
+        self.prefetch_process_graph(process)
         self.recurse_process(process, process_info)
 
         if process_info.project:
-            supplementary_files = self.ingest_api.getRelatedEntities('supplementaryFiles', process_info.project, 'files')
+            supplementary_files = self.get_related_entities('supplementaryFiles', process_info.project, 'files')
             for supplementary_file in supplementary_files:
                 uuid = supplementary_file['uuid']['uuid']
                 process_info.supplementary_files[uuid] = supplementary_file
@@ -199,7 +315,7 @@ class IngestExporter:
         return process_info
 
     def get_project_info(self, process):
-        projects = list(self.ingest_api.getRelatedEntities('projects', process, 'projects'))
+        projects = self.get_related_entities('projects', process, 'projects')
 
         if len(projects) > 1:
             raise MultipleProjectsError('Can only be one project in bundle')
@@ -212,6 +328,41 @@ class IngestExporter:
 
         return None
 
+    def prefetch_process_graph(self, process):
+        """
+        Fetches the relationships of the process, and of every process upstream of it, into the
+        related entities cache. The graph is walked breadth first and every fetch known at any
+        time is made side by side, so that the time taken grows with the depth of the graph
+        rather than with its size. recurse_process then assembles the bundle from the cache.
+        """
+        submitted = set()
+        with ThreadPoolExecutor(max_workers=self.fetch_workers) as executor:
+            pending = {}
+            self._submit_process_fetches(executor, pending, submitted, process)
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    relationship = pending.pop(future)
+                    related_entities = future.result()
+                    if relationship in INPUT_RELATIONSHIPS:
+                        for input_entity in related_entities:
+                            self._submit_fetch(executor, pending, submitted,
+                                               'derivedByProcesses', input_entity, 'processes')
+                    elif relationship == 'derivedByProcesses':
+                        for derived_by_process in related_entities:
+                            self._submit_process_fetches(executor, pending, submitted, derived_by_process)
+
+    def _submit_process_fetches(self, executor, pending, submitted, process):
+        for relationship, entity_type in PROCESS_RELATIONSHIPS:
+            self._submit_fetch(executor, pending, submitted, relationship, process, entity_type)
+
+    def _submit_fetch(self, executor, pending, submitted, relationship, entity, entity_type):
+        key = (entity['uuid']['uuid'], relationship)
+        if key not in submitted:
+            submitted.add(key)
+            future = executor.submit(self.get_related_entities, relationship, entity, entity_type)
+            pending[future] = relationship
+
     # get all related info of a process
     def recurse_process(self, process, process_info):
         uuid = process['uuid']['uuid']
@@ -298,23 +449,11 @@ class IngestExporter:
         for derived_by_process in derived_by_processes:
             self.recurse_process(derived_by_process, process_info)
 
+    # safe to call from several threads; empty results are cached as well
     def get_related_entities(self, relationship, entity, entity_type):
-        entity_uuid = entity['uuid']['uuid']
-
-        if self.related_entities_cache.get(entity_uuid) and self.related_entities_cache.get(entity_uuid).get(relationship):
-            return self.related_entities_cache.get(entity_uuid).get(relationship)
-
-        related_entities = list(self.ingest_api.getRelatedEntities(relationship, entity, entity_type))
-
-        if not self.related_entities_cache.get(entity_uuid):
-            self.related_entities_cache[entity_uuid] = {}
-
-        if not self.related_entities_cache.get(entity_uuid).get(relationship):
-            self.related_entities_cache[entity_uuid][relationship] = []
-
-        self.related_entities_cache[entity_uuid][relationship] = related_entities
-
-        return related_entities
+        key = f'{entity["uuid"]["uuid"]}/{relationship}'
+        return self.provenance_cache.get(
+            key, lambda: list(self.ingest_api.getRelatedEntities(relationship, entity, entity_type)))
 
     def get_input_bundle(self, process):
         bundle_manifests = list(self.ingest_api.getRelatedEntities('inputBundleManifests', process, 'bundleManifests'))
@@ -371,10 +510,8 @@ class IngestExporter:
         provenance_core['submission_date'] = metadata_doc['submissionDate']
         provenance_core['update_date'] = metadata_doc['updateDate']
 
-        bundle_doc = metadata_doc['content']
-        bundle_doc['provenance'] = provenance_core
-
-        return bundle_doc
+        # a new document, as metadata documents are shared through the provenance cache
+        return dict(metadata_doc['content'], provenance=provenance_core)
 
     def bundle_links(self, links):
 
@@ -396,21 +533,38 @@ class IngestExporter:
         }
 
     def upload_metadata_files(self, submission_uuid, metadata_files_info):
+        """
+        Uploads the metadata documents that are not from the input bundle to the staging area,
+        side by side, and records the url of each uploaded document. All documents are tried
+        before the failures, if any, are reported in a single BundleFileUploadError.
+        """
         try:
-            for metadata_type in ['project', 'biomaterial', 'process', 'protocol', 'file', 'links']:
-                for metadata_doc in metadata_files_info[metadata_type]:
-                    bundle_file = metadata_doc
-                    filename = bundle_file['upload_filename']
-                    content = bundle_file['content']
-                    content_type = bundle_file['content_type']
-
-                    if not bundle_file.get('is_from_input_bundle'):
-                        uploaded_file = self.upload_file(submission_uuid, filename, content, content_type)
-                        bundle_file['upload_file_url'] = uploaded_file.url
+            bundle_files = [metadata_doc
+                            for metadata_type in ['project', 'biomaterial', 'process', 'protocol', 'file', 'links']
+                            for metadata_doc in metadata_files_info[metadata_type]
+                            if not metadata_doc.get('is_from_input_bundle')]
         except Exception as e:
             message = "An error occurred on uploading bundle files: " + str(e)
             raise BundleFileUploadError(message)
 
+        errors = []
+        with ThreadPoolExecutor(max_workers=self.upload_workers) as executor:
+            uploads = [(bundle_file, executor.submit(self.upload_file, submission_uuid, bundle_file['upload_filename'],
+                                                     bundle_file['content'], bundle_file['content_type']))
+                       for bundle_file in bundle_files]
+            # results are collected in document order so that errors are always reported the same way
+            for bundle_file, future in uploads:
+                try:
+                    uploaded_file = future.result()
+                    bundle_file['upload_file_url'] = uploaded_file.url
+                except Exception as e:
+                    self.logger.error(f'Failed to upload {bundle_file["upload_filename"]}: {str(e)}')
+                    errors.append(f'{bundle_file["upload_filename"]}: {str(e)}')
+
+        if errors:
+            message = "An error occurred on uploading bundle files: " + '; '.join(errors)
+            raise BundleFileUploadError(message)
+
     # TODO handle error #export-errors
     def put_bundle_in_dss(self, bundle_uuid, created_files):
         try:
@@ -423,56 +577,91 @@ class IngestExporter:
 
     # TODO handle error #exporter-errors
     def put_files_in_dss(self, bundle_uuid, files_to_put, process_info):
+        """
+        Creates the bundle files in DSS side by side. Each file retries on its own, with backoff,
+        until the deadline for the whole bundle, so the time taken follows the slowest file rather
+        than the sum of all of them. Files are returned in the order they were given.
+        """
+        input_data_files = {input_file['dataFileUuid'] for input_file in process_info.input_files.values()}
+        deadline = time.time() + self.dss_deadline
+
+        errors = []
         created_files = []
+        with ThreadPoolExecutor(max_workers=self.dss_workers) as executor:
+            puts = [executor.submit(self._put_file_in_dss, bundle_uuid, bundle_file, input_data_files, deadline)
+                    for bundle_file in files_to_put]
+            for bundle_file, future in zip(files_to_put, puts):
+                try:
+                    created_files.append(future.result())
+                except Exception as e:
+                    errors.append(f'{bundle_file["dss_uuid"]}: {str(e)}')
+
+        if errors:
+            raise FileDSSError('An error occurred while putting file in DSS: ' + '; '.join(errors))
 
-        for bundle_file in files_to_put:
-            version = ''
-            file_uuid = bundle_file["dss_uuid"]
-            created_file = None
-            input_data_files = [input_file['dataFileUuid'] for input_file in list(process_info.input_files.values())]
+        return created_files
 
-            try:
-                # TODO if file is an input file, this file may already be in the data store, need to get the stored version
-                # This assumes that the latest version is the file version in the input bundle, should be a safe assumption for now
-                # Ideally, bundle manifest must store the file uuid and version and version must be retrieved from there
-
-                # if metadata file , check is_from_input_bundle flag, if true, do not put file to DSS again
-                if bundle_file.get('is_from_input_bundle') or file_uuid in input_data_files:
-                    file_response = self.dss_api.head_file(bundle_file["dss_uuid"])
-                    created_file = {
-                        'version': file_response.headers['X-DSS-VERSION']
-                    }
-                else:
-                    created_file = self.dss_api.put_file(bundle_uuid, bundle_file)
-
-                version = created_file['version']
-            except Exception as e:
-                raise FileDSSError('An error occurred while putting file in DSS' + str(e))
-
-            file_param = {
-                "indexed": bundle_file["indexed"],
-                "name": bundle_file["submittedName"],
-                "uuid": file_uuid,
-                "content-type": bundle_file["content-type"],
-                "version": version
-            }
+    def _put_file_in_dss(self, bundle_uuid, bundle_file, input_data_files, deadline):
+        file_uuid = bundle_file["dss_uuid"]
 
-            created_files.append(file_param)
+        # TODO if file is an input file, this file may already be in the data store, need to get the stored version
+        # This assumes that the latest version is the file version in the input bundle, should be a safe assumption for now
+        # Ideally, bundle manifest must store the file uuid and version and version must be retrieved from there
 
-        return created_files
+        # if metadata file , check is_from_input_bundle flag, if true, do not put file to DSS again
+        if bundle_file.get('is_from_input_bundle') or file_uuid in input_data_files:
+            file_response = self.dss_api.head_file(bundle_file["dss_uuid"])
+            created_file = {
+                'version': file_response.headers['X-DSS-VERSION']
+            }
+        else:
+            created_file = self.dss_api.put_file(bundle_uuid, bundle_file, deadline=deadline)
+
+        return {
+            "indexed": bundle_file["indexed"],
+            "name": bundle_file["submittedName"],
+            "uuid": file_uuid,
+            "content-type": bundle_file["content-type"],
+            "version": created_file['version']
+        }
 
     def verify_files(self, created_files):
-        for created_file in created_files:
-            try:
-                polling.poll(
-                    lambda: self._is_file_copied(created_file),
-                    step=30,
-                    timeout=1200  # 20 minutes
-                )
-            except polling.TimeoutException as te:
-                self.logger.error(f'File {created_file["uuid"]}/{created_file["version"]} with name {created_file["name"]} takes too long to be copied.')
-                raise
-            self.logger.info(f'File {created_file["uuid"]}/{created_file["version"]} with name {created_file["name"]} is successfully copied!')
+        """
+        Checks that DSS has copied every created file, polling all files still pending side by side.
+        Polls start at a short interval that doubles up to a cap, and a file is no longer checked
+        once it is confirmed. Files are checked a last time when the verification timeout is up,
+        and polling.TimeoutException is raised if any are still pending then. Returns the time
+        the verification took, in seconds.
+        """
+        start_time = time.time()
+        deadline = start_time + self.verify_timeout
+        interval = self.verify_initial_interval
+        pending_files = list(created_files)
+        with ThreadPoolExecutor(max_workers=self.dss_workers) as executor:
+            while pending_files:
+                copied = list(executor.map(self._is_file_copied, pending_files))
+                still_pending = []
+                for created_file, is_copied in zip(pending_files, copied):
+                    if is_copied:
+                        self.logger.info(f'File {created_file["uuid"]}/{created_file["version"]} with name {created_file["name"]} is successfully copied!')
+                    else:
+                        still_pending.append(created_file)
+                pending_files = still_pending
+
+                if not pending_files:
+                    break
+                remaining_time = deadline - time.time()
+                if remaining_time <= 0:
+                    for created_file in pending_files:
+                        self.logger.error(f'File {created_file["uuid"]}/{created_file["version"]} with name {created_file["name"]} takes too long to be copied.')
+                    raise polling.TimeoutException(pending_files)
+                # the last wait is cut short so that files are checked once more at the deadline
+                time.sleep(min(interval, remaining_time))
+                interval = min(interval * 2, self.verify_max_interval)
+
+        verification_time = time.time() - start_time
+        self.logger.info("Verification Time: %s seconds" % verification_time)
+        return verification_time
 
     def _is_file_copied(self, created_file):
         try:
@@ -630,4 +819,14 @@ class FileDSSError(Error):
 
 
 class NoUploadAreaFoundError(Error):
-    """Export couldn't be as no upload area found"""
\ No newline at end of file
+    """Export couldn't be as no upload area found"""
+
+
+class BatchExportError(Error):
+    """The export of some of the bundles in a batch failed."""
+
+    def __init__(self, failures, bundle_uuids):
+        process_uuids = ', '.join(failures.keys())
+        super(BatchExportError, self).__init__(f'Export failed for processes {process_uuids}.')
+        self.failures = failures
+        self.bundle_uuids = bundle_uuids
\ No newline at end of file
@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+"""
+A cache of the entities and relationships that bundles of a submission share, like the project,
+the protocols, the donors and the upstream processes, so that exporting many bundles of one
+submission fetches each of them from ingest once.
+"""
+__license__ = "Apache 2.0"
+
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+
+env_cache_size = os.environ.get('EXPORTER_CACHE_SIZE')
+DEFAULT_CACHE_SIZE = int(env_cache_size) if env_cache_size else 10000
+
+env_cache_dir = os.environ.get('EXPORTER_CACHE_DIR')
+DEFAULT_CACHE_DIR = env_cache_dir if env_cache_dir else None
+
+# entries on disk are fetched again after a day, as the submission may have been updated since
+env_cache_ttl = os.environ.get('EXPORTER_CACHE_TTL')
+DEFAULT_CACHE_TTL = int(env_cache_ttl) if env_cache_ttl else 86400
+
+# stands for a document that is not cached, as None is a document that can be cached
+_MISSING = object()
+
+
+class ProvenanceCache:
+    """
+    Keeps up to max_size documents in memory, evicting the least recently used first. With a
+    cache_dir, documents are also written to disk, one file per key under a directory for the
+    submission, so that evicted documents and later exports of the same submission are read from
+    disk instead of ingest, until they are ttl seconds old. Safe to use from several threads;
+    concurrent gets of a key that is not cached wait for a single fetch.
+    """
+
+    def __init__(self, submission_uuid, max_size=DEFAULT_CACHE_SIZE, cache_dir=DEFAULT_CACHE_DIR,
+                 ttl=DEFAULT_CACHE_TTL):
+        self.submission_uuid = submission_uuid
+        self.max_size = max_size
+        self.ttl = ttl
+        # only a cache bound to a submission is persisted
+        self.cache_dir = os.path.join(cache_dir, submission_uuid) if cache_dir and submission_uuid else None
+        self.logger = logging.getLogger(__name__)
+        self._documents = OrderedDict()
+        self._fetches = {}
+        self._lock = threading.Lock()
+        if self.cache_dir:
+            os.makedirs(self.cache_dir, exist_ok=True)
+
+    def __len__(self):
+        return len(self._documents)
+
+    def __contains__(self, key):
+        return key in self._documents
+
+    def get(self, key, fetch):
+        """
+        Returns the cached document for the key, calling fetch() to get and store it when it is
+        neither in memory nor on disk. Empty results of fetch are cached as well. While a key is
+        being fetched, other gets of it wait for the result instead of fetching it again.
+        """
+        with self._lock:
+            if key in self._documents:
+                self._documents.move_to_end(key)
+                return self._documents[key]
+            pending_fetch = self._fetches.get(key)
+            if pending_fetch is None:
+                self._fetches[key] = Future()
+
+        if pending_fetch is not None:
+            return pending_fetch.result()
+        return self._load(key, fetch)
+
+    def _load(self, key, fetch):
+        try:
+            document = self._read(key) if self.cache_dir else _MISSING
+            if document is _MISSING:
+                document = fetch()
+                if self.cache_dir:
+                    self._write(key, document)
+        except Exception as e:
+            with self._lock:
+                self._fetches.pop(key).set_exception(e)
+            raise
+
+        with self._lock:
+            self._documents[key] = document
+            self._documents.move_to_end(key)
+            while len(self._documents) > self.max_size:
+                self._documents.popitem(last=False)
+            self._fetches.pop(key).set_result(document)
+        return document
+
+    def _cache_path(self, key):
+        file_name = hashlib.sha256(key.encode('utf-8')).hexdigest()
+        return os.path.join(self.cache_dir, f'{file_name}.json')
+
+    def _read(self, key):
+        cache_path = self._cache_path(key)
+        if not os.path.exists(cache_path) or time.time() - os.path.getmtime(cache_path) >= self.ttl:
+            return _MISSING
+        try:
+            with open(cache_path) as cache_file:
+                return json.load(cache_file)['document']
+        except (OSError, ValueError, KeyError):
+            self.logger.warning(f'Ignoring unreadable provenance cache entry {cache_path}.')
+            return _MISSING
+
+    def _write(self, key, document):
+        # written to a temporary file first so that readers never see a partial entry
+        file_descriptor, temp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+        try:
+            with os.fdopen(file_descriptor, 'w') as temp_file:
+                json.dump({'key': key, 'document': document}, temp_file)
+            os.replace(temp_path, self._cache_path(key))
+        except (OSError, TypeError, ValueError):
+            self.logger.warning(f'Could not write provenance cache entry for {key}.', exc_info=True)
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
@@ -7,34 +7,59 @@ from ingest.importer.conversion.data_converter import Converter, ListConverter
 from ingest.importer.conversion.exceptions import UnknownMainCategory
 from ingest.importer.conversion.metadata_entity import MetadataEntity
 from ingest.importer.conversion.utils import split_field_chain
-from ingest.importer.data_node import DataNode
+from ingest.importer.data_node import DataNode, FIELD_SEPARATOR
 
 _LIST_CONVERTER = ListConverter()
 
+APPLIED_FIELD_PATTERN = re.compile(r'(\w*\.){0,1}(?P<insert_field>.*)')
+
+
+def _split_path(path):
+    return tuple(path.split(FIELD_SEPARATOR))
+
 
 class CellConversion(object):
+    """
+    Converts cell data into a field of a metadata entity. Field paths are parsed once, when the
+    conversion is created, and applied as pre-split field chains.
+    """
 
     def __init__(self, field, converter: Converter):
         self.field = field
         self.applied_field = self._process_applied_field(field)
+        self.field_chain = _split_path(self.applied_field)
         self.converter = converter
 
     @staticmethod
     def _process_applied_field(field):
-        pattern = '(\w*\.){0,1}(?P<insert_field>.*)'
-        match = re.match(pattern, field)
+        match = APPLIED_FIELD_PATTERN.match(field)
         return match.group('insert_field')
 
     @abstractmethod
     def apply(self, metadata: MetadataEntity, cell_data): ...
 
+    def apply_column(self, metadata_entities, column):
+        """
+        Applies the conversion to a whole column, where each cell belongs to the metadata entity
+        at the same position. Empty cells are skipped.
+        """
+        for metadata, cell_data in zip(metadata_entities, column):
+            if cell_data is not None:
+                self.apply(metadata, cell_data)
+
 
 class DirectCellConversion(CellConversion):
 
     def apply(self, metadata: MetadataEntity, cell_data):
         if cell_data is not None:
             content = self.converter.convert(cell_data)
-            metadata.define_content(self.applied_field, content)
+            metadata.define_content(self.field_chain, content)
+
+    def apply_column(self, metadata_entities, column):
+        field_chain = self.field_chain
+        for metadata, content in zip(metadata_entities, self.converter.convert_column(column)):
+            if content is not None:
+                metadata.define_content(field_chain, content)
 
 
 class ListElementCellConversion(CellConversion):
@@ -42,16 +67,26 @@ class ListElementCellConversion(CellConversion):
     def __init__(self, field: str, converter: Converter):
         list_converter = ListConverter(base_converter=converter)
         super(ListElementCellConversion, self).__init__(field, list_converter)
+        parent_path, self.target_field = split_field_chain(self.applied_field)
+        self.parent_chain = _split_path(parent_path)
 
     def apply(self, metadata: MetadataEntity, cell_data):
         if cell_data is not None:
-            parent_path, target_field = split_field_chain(self.applied_field)
             data_list = self.converter.convert(cell_data)
-            parent = self._prepare_array(metadata, parent_path, len(data_list))
+            parent = self._prepare_array(metadata, self.parent_chain, len(data_list))
+            target_field = self.target_field
             for index, data in enumerate(data_list):
                 target_object = parent[index]
                 target_object[target_field] = data
 
+    def apply_column(self, metadata_entities, column):
+        parent_chain, target_field = self.parent_chain, self.target_field
+        for metadata, data_list in zip(metadata_entities, self.converter.convert_column(column)):
+            if data_list is not None:
+                parent = self._prepare_array(metadata, parent_chain, len(data_list))
+                for target_object, data in zip(parent, data_list):
+                    target_object[target_field] = data
+
     @staticmethod
     def _prepare_array(metadata, path, child_count):
         parent = metadata.get_content(path)
@@ -68,12 +103,23 @@ class ListElementCellConversion(CellConversion):
 
 class FieldOfSingleElementListCellConversion(CellConversion):
 
+    def __init__(self, field: str, converter: Converter):
+        super(FieldOfSingleElementListCellConversion, self).__init__(field, converter)
+        parent_path, self.target_field = split_field_chain(self.applied_field)
+        self.parent_chain = _split_path(parent_path)
+
     def apply(self, metadata: MetadataEntity, cell_data):
         if cell_data is not None:
-            parent_path, target_field = split_field_chain(self.applied_field)
-            target_object = self._determine_target_object(metadata, parent_path)
+            target_object = self._determine_target_object(metadata, self.parent_chain)
             data = self.converter.convert(cell_data)
-            target_object[target_field] = data
+            target_object[self.target_field] = data
+
+    def apply_column(self, metadata_entities, column):
+        parent_chain, target_field = self.parent_chain, self.target_field
+        for metadata, data in zip(metadata_entities, self.converter.convert_column(column)):
+            if data is not None:
+                target_object = self._determine_target_object(metadata, parent_chain)
+                target_object[target_field] = data
 
     @staticmethod
     def _determine_target_object(metadata, parent_path):
@@ -91,7 +137,14 @@ class IdentityCellConversion(CellConversion):
     def apply(self, metadata: MetadataEntity, cell_data):
         value = self.converter.convert(cell_data)
         metadata.object_id = value
-        metadata.define_content(self.applied_field, value)
+        metadata.define_content(self.field_chain, value)
+
+    def apply_column(self, metadata_entities, column):
+        field_chain = self.field_chain
+        for metadata, value in zip(metadata_entities, self.converter.convert_column(column)):
+            if value is not None:
+                metadata.object_id = value
+                metadata.define_content(field_chain, value)
 
 
 class LinkedIdentityCellConversion(CellConversion):
@@ -107,6 +160,13 @@ class LinkedIdentityCellConversion(CellConversion):
             links = self.converter.convert(cell_data)
             metadata.add_links(self.main_category, links)
 
+    def apply_column(self, metadata_entities, column):
+        for metadata, links in zip(metadata_entities, self.converter.convert_column(column)):
+            if links is not None:
+                if self.main_category is None:
+                    raise UnknownMainCategory()
+                metadata.add_links(self.main_category, links)
+
 
 class ExternalReferenceCellConversion(CellConversion):
 
@@ -118,12 +178,23 @@ class ExternalReferenceCellConversion(CellConversion):
         link_ids = self.converter.convert(cell_data)
         metadata.add_external_links(self.main_category, link_ids)
 
+    def apply_column(self, metadata_entities, column):
+        for metadata, link_ids in zip(metadata_entities, self.converter.convert_column(column)):
+            if link_ids is not None:
+                metadata.add_external_links(self.main_category, link_ids)
+
 
 class LinkingDetailCellConversion(CellConversion):
 
     def apply(self, metadata: MetadataEntity, cell_data):
         value = self.converter.convert(cell_data)
-        metadata.define_linking_detail(self.applied_field, value)
+        metadata.define_linking_detail(self.field_chain, value)
+
+    def apply_column(self, metadata_entities, column):
+        field_chain = self.field_chain
+        for metadata, value in zip(metadata_entities, self.converter.convert_column(column)):
+            if value is not None:
+                metadata.define_linking_detail(field_chain, value)
 
 
 class DoNothing(CellConversion):
@@ -134,6 +205,9 @@ class DoNothing(CellConversion):
     def apply(self, metadata: MetadataEntity, cell_data):
         pass
 
+    def apply_column(self, metadata_entities, column):
+        pass
+
 
 DO_NOTHING = DoNothing()
 
@@ -29,30 +29,49 @@ class Converter:
     def convert(self, data):
         raise NotImplementedError()
 
+    def convert_column(self, column):
+        """
+        Converts a whole column of values at once. Empty (None) values are kept as they are.
+        """
+        convert = self.convert
+        return [None if data is None else convert(data) for data in column]
+
 
 class DefaultConverter(Converter):
 
     def convert(self, data):
         return data
 
+    def convert_column(self, column):
+        return list(column)
+
 
 class StringConverter(Converter):
 
     def convert(self, data):
         return str(data).strip()
 
+    def convert_column(self, column):
+        return [None if data is None else str(data).strip() for data in column]
+
 
 class IntegerConverter(Converter):
 
     def convert(self, data):
         return int(data)
 
+    def convert_column(self, column):
+        return [None if data is None else int(data) for data in column]
+
 
 class NumberConverter(Converter):
 
     def convert(self, data):
         return float(data)
 
+    def convert_column(self, column):
+        return [None if data is None else float(data) for data in column]
+
 
 BOOLEAN_TABLE = {
     'true': True,
@@ -70,6 +89,17 @@ class BooleanConverter(Converter):
             raise InvalidBooleanValue(data)
         return value
 
+    def convert_column(self, column):
+        values = []
+        for data in column:
+            value = None
+            if data is not None:
+                value = BOOLEAN_TABLE.get(data.lower())
+                if value is None:
+                    raise InvalidBooleanValue(data)
+            values.append(value)
+        return values
+
 
 CONVERTER_MAP = {
     DataType.STRING: StringConverter(),
@@ -96,5 +126,9 @@ class ListConverter(Converter):
         value = [self.base_converter.convert(elem) for elem in value]
         return value
 
+    def convert_column(self, column):
+        convert_elements = self.base_converter.convert_column
+        return [None if data is None else convert_elements(str(data).split('||')) for data in column]
+
 
 DEFAULT = DefaultConverter()
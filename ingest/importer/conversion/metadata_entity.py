@@ -1,12 +1,15 @@
-import copy
-
-from ingest.importer.data_node import DataNode
+from ingest.importer.data_node import DataNode, copy_tree
 
 TYPE_UNDEFINED = 'undefined'
 
 
 class MetadataEntity:
 
+    # an entity is created for every row of a worksheet, so link maps and linking details are
+    # only allocated once something is added to them
+    __slots__ = ('_concrete_type', '_domain_type', 'object_id', '_content', '_links',
+                 '_external_links', '_linking_details', '_shared')
+
     # TODO enforce definition of concrete and domain types for all MetadataEntity
     # It's only currently done this way to minimise friction with other parts of the system
     def __init__(self, concrete_type=TYPE_UNDEFINED, domain_type=TYPE_UNDEFINED, object_id=None,
@@ -14,10 +17,26 @@ class MetadataEntity:
         self._concrete_type = concrete_type
         self._domain_type = domain_type
         self.object_id = object_id
-        self._content = DataNode(defaults=copy.deepcopy(content))
-        self._links = copy.deepcopy(links)
-        self._external_links = copy.deepcopy(external_links)
-        self._linking_details = DataNode(defaults=copy.deepcopy(linking_details))
+        self._content = DataNode(defaults=copy_tree(content), adopt=True)
+        self._links = copy_tree(links) if links else None
+        self._external_links = copy_tree(external_links) if external_links else None
+        self._linking_details = DataNode(defaults=copy_tree(linking_details), adopt=True) \
+            if linking_details else None
+        self._shared = False
+
+    # The content, links and linking details are handed over, not copied, when the entity is
+    # mapped for submission or added as a module. The receiver owns what is handed over, so the
+    # entity copies its state before it is next changed or handed over again.
+    def _own(self):
+        if self._shared:
+            self._content = DataNode(defaults=self._content.node)
+            if self._links is not None:
+                self._links = copy_tree(self._links)
+            if self._external_links is not None:
+                self._external_links = copy_tree(self._external_links)
+            if self._linking_details is not None:
+                self._linking_details = DataNode(defaults=self._linking_details.node)
+            self._shared = False
 
     @property
     def concrete_type(self):
@@ -29,42 +48,63 @@ class MetadataEntity:
 
     @property
     def content(self):
-        return copy.deepcopy(self._content)
+        return DataNode(defaults=self._content.node)
 
     def get_content(self, content_property):
+        # content is returned as is, and may be changed in place by the caller
+        self._own()
         return self._content[content_property]
 
     def define_content(self, content_property, value):
+        self._own()
         self._content[content_property] = value
 
     def define_linking_detail(self, link_property, value):
+        self._own()
+        if self._linking_details is None:
+            self._linking_details = DataNode()
         self._linking_details[link_property] = value
 
     @property
     def linking_details(self):
-        return self._linking_details.as_dict()
+        return self._linking_details.as_dict() if self._linking_details is not None else {}
 
     def get_linking_detail(self, link_property):
+        if self._linking_details is None:
+            return None
+        self._own()
         return self._linking_details[link_property]
 
     @property
     def links(self):
-        return copy.deepcopy(self._links)
+        return copy_tree(self._links) if self._links is not None else {}
 
     def get_links(self, link_entity_type):
+        if self._links is None:
+            return None
+        self._own()
         return self._links.get(link_entity_type)
 
     def add_links(self, link_entity_type, new_links):
+        self._own()
+        if self._links is None:
+            self._links = {}
         self._do_add_links(self._links, link_entity_type, new_links)
 
     @property
     def external_links(self):
-        return copy.deepcopy(self._external_links)
+        return copy_tree(self._external_links) if self._external_links is not None else {}
 
     def get_external_links(self, link_entity_type):
+        if self._external_links is None:
+            return None
+        self._own()
         return self._external_links.get(link_entity_type)
 
     def add_external_links(self, link_entity_type, new_links):
+        self._own()
+        if self._external_links is None:
+            self._external_links = {}
         self._do_add_links(self._external_links, link_entity_type, new_links)
 
     @staticmethod
@@ -76,12 +116,16 @@ class MetadataEntity:
         existent_links.extend(new_links)
 
     def retain_content_fields(self, *fields):
+        self._own()
         for key in self._content.keys():
             if key not in fields:
                 self._content.remove_field(key)
 
     def add_module_entity(self, module_entity):
-        for field, value in module_entity.content.as_dict().items():
+        self._own()
+        module_entity._own()
+        module_entity._shared = True
+        for field, value in module_entity._content.node.items():
             module_list = self._content[field]
             if not module_list:
                 module_list = []
@@ -89,10 +133,12 @@ class MetadataEntity:
             module_list.append(value)
 
     def map_for_submission(self):
+        self._own()
+        self._shared = True
         return {
             'concrete_type': self.concrete_type,
-            'content': self._content.as_dict(),
-            'links_by_entity': self.links,
-            'external_links_by_entity': self.external_links,
-            'linking_details': self.linking_details
+            'content': self._content.node,
+            'links_by_entity': self._links if self._links is not None else {},
+            'external_links_by_entity': self._external_links if self._external_links is not None else {},
+            'linking_details': self._linking_details.node if self._linking_details is not None else {}
         }
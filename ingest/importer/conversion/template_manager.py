@@ -1,9 +1,12 @@
 import copy
 import logging
+import os
+import threading
+from collections import OrderedDict
+from itertools import zip_longest
 
 from openpyxl.worksheet.worksheet import Worksheet
 
-import ingest.template.schema_template as schema_template
 from ingest.api.ingestapi import IngestApi
 from ingest.importer.conversion import utils, conversion_strategy, column_specification
 from ingest.importer.conversion.column_specification import ColumnSpecification
@@ -15,11 +18,57 @@ from ingest.importer.spreadsheet.ingest_worksheet import IngestWorksheet, MODULE
 from ingest.template.schema_template import SchemaTemplate
 
 
+env_row_template_cache_size = os.environ.get('ROW_TEMPLATE_CACHE_SIZE')
+DEFAULT_ROW_TEMPLATE_CACHE_SIZE = int(env_row_template_cache_size) if env_row_template_cache_size else 256
+
+# stands for keys that are not in the schema template, as None is a value that a key can have
+_UNKNOWN_KEY = object()
+
+
+class RowTemplateCache:
+    """
+    A bounded, least recently used cache of compiled row templates, shared across imports. Row
+    templates hold no state of their own between rows, so the same one can serve any number of
+    imports, concurrent ones included.
+    """
+
+    def __init__(self, max_size=DEFAULT_ROW_TEMPLATE_CACHE_SIZE):
+        self.max_size = max_size
+        self._row_templates = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_or_create(self, key, create):
+        with self._lock:
+            row_template = self._row_templates.get(key)
+            if row_template is not None:
+                self._row_templates.move_to_end(key)
+                return row_template
+
+        row_template = create()
+        with self._lock:
+            self._row_templates[key] = row_template
+            self._row_templates.move_to_end(key)
+            while len(self._row_templates) > self.max_size:
+                self._row_templates.popitem(last=False)
+        return row_template
+
+    def clear(self):
+        with self._lock:
+            self._row_templates.clear()
+
+    def __len__(self):
+        return len(self._row_templates)
+
+
+ROW_TEMPLATE_CACHE = RowTemplateCache()
+
+
 class TemplateManager:
 
-    def __init__(self, template:SchemaTemplate, ingest_api:IngestApi):
+    def __init__(self, template:SchemaTemplate, ingest_api:IngestApi, row_template_cache=None):
         self.template = template
         self.ingest_api = ingest_api
+        self.row_template_cache = row_template_cache
         self.logger = logging.getLogger(__name__)
 
     def create_template_node(self, worksheet: Worksheet):
@@ -31,6 +80,15 @@ class TemplateManager:
         return data_node
 
     def create_row_template(self, ingest_worksheet: IngestWorksheet):
+        if self.row_template_cache is None:
+            return self._compile_row_template(ingest_worksheet)
+        # the same schemas, title and headers always compile to the same row template
+        key = (frozenset(self.template.get_schema_urls()), ingest_worksheet.title,
+               tuple(ingest_worksheet.get_column_headers()))
+        return self.row_template_cache.get_or_create(
+            key, lambda: self._compile_row_template(ingest_worksheet))
+
+    def _compile_row_template(self, ingest_worksheet: IngestWorksheet):
         concrete_type = self.get_concrete_type(ingest_worksheet.title)
         domain_type = self.get_domain_type(concrete_type)
         column_headers = ingest_worksheet.get_column_headers()
@@ -129,17 +187,15 @@ class TemplateManager:
         return self.get_domain_type(concrete_type)
 
     def get_key_for_label(self, header_name, tab_name):
-        try:
-            key = self.template.get_key_for_label(header_name, tab_name)
-        except:
+        key = self.template.find_key_for_label(header_name, tab_name)
+        if key is None:
             self.logger.warning(f'{header_name} in "{tab_name}" tab is not found in schema template')
         return key
 
     def lookup(self, header_name):
-        try:
-            spec = self.template.lookup(header_name)
-        except schema_template.UnknownKeyException:
-            self.logger.warning(f'schema_template.UnknownKeyException: Could not lookup {header_name} in template.')
+        spec = self.template.find(header_name, _UNKNOWN_KEY)
+        if spec is _UNKNOWN_KEY:
+            self.logger.warning(f'Could not lookup {header_name} in template.')
             return {}
 
         return spec
@@ -149,11 +205,12 @@ def build(schemas, ingest_api) -> TemplateManager:
     template = None
 
     if not schemas:
-        template = SchemaTemplate(ingest_api_url=ingest_api.url)
+        template = SchemaTemplate(ingest_api_url=ingest_api.url, ingest_api=ingest_api)
     else:
-        template = SchemaTemplate(ingest_api_url=ingest_api.url, list_of_schema_urls=schemas)
+        template = SchemaTemplate(ingest_api_url=ingest_api.url, list_of_schema_urls=schemas,
+                                  ingest_api=ingest_api)
 
-    template_mgr = TemplateManager(template, ingest_api)
+    template_mgr = TemplateManager(template, ingest_api, row_template_cache=ROW_TEMPLATE_CACHE)
     return template_mgr
 
 
@@ -166,13 +223,30 @@ class RowTemplate:
         self.default_values = copy.deepcopy(default_values)
 
     def do_import(self, row):
+        return self.import_values(cell.value for cell in row)
+
+    def import_rows(self, rows):
+        """
+        Converts a batch of rows of plain values a column at a time: each column is converted
+        in one pass, then applied down the metadata entities of the batch. The result is the
+        same as converting the rows one by one with import_values.
+        """
+        metadata_entities = [MetadataEntity(domain_type=self.domain_type, concrete_type=self.concrete_type,
+                                            content=self.default_values) for _ in rows]
+        columns = zip_longest(*rows)
+        for conversion, column in zip(self.cell_conversions, columns):
+            conversion.apply_column(metadata_entities, column)
+        return metadata_entities
+
+    # row templates are picklable, so rows of plain values can be converted in other processes
+    def import_values(self, row_values):
         metadata = MetadataEntity(domain_type=self.domain_type, concrete_type=self.concrete_type,
                                   content=self.default_values)
-        for index, cell in enumerate(row):
-            if cell.value is None:
+        for index, value in enumerate(row_values):
+            if value is None:
                 continue
             conversion: CellConversion = self.cell_conversions[index]
-            conversion.apply(metadata, cell.value)
+            conversion.apply(metadata, value)
         return metadata
 
 
@@ -2,33 +2,64 @@ import copy
 
 FIELD_SEPARATOR = '.'
 
+_IMMUTABLE_TYPES = (str, int, float, bool, type(None))
+
+
+def copy_tree(tree):
+    """
+    Copies a tree of dicts and lists, such as metadata content. Values that are not dicts or lists
+    are shared unless they are of a mutable type, which are deep copied.
+    """
+    tree_type = type(tree)
+    if tree_type is dict:
+        return {key: copy_tree(value) for key, value in tree.items()}
+    if tree_type is list:
+        return [copy_tree(value) for value in tree]
+    if tree_type in _IMMUTABLE_TYPES:
+        return tree
+    return copy.deepcopy(tree)
+
 
 class DataNode:
 
-    def __init__(self, defaults={}):
-        self.node = copy.deepcopy(defaults)
+    __slots__ = ('node',)
+
+    # an adopted defaults tree is used as the node itself instead of being copied
+    def __init__(self, defaults=None, adopt=False):
+        if defaults is None:
+            self.node = {}
+        else:
+            self.node = defaults if adopt else copy_tree(defaults)
 
+    # keys are either dotted paths, or paths already split into a sequence of fields
     def __setitem__(self, key, value):
-        field_chain = key.split(FIELD_SEPARATOR)
+        field_chain = key.split(FIELD_SEPARATOR) if isinstance(key, str) else key
+        self.set_path(field_chain, value)
+
+    def set_path(self, field_chain, value):
+        """Sets the value at a path already split into fields, e.g. ('project_core', 'name')."""
         target_node = self._determine_node(field_chain)
         target_node[field_chain[-1]] = value
 
     def _determine_node(self, field_chain):
         current_node = self.node
-        for field in field_chain[:len(field_chain) - 1]:
+        for field in field_chain[:-1]:
             if field not in current_node:
                 current_node[field] = {}
             current_node = current_node[field]
         return current_node
 
     def __getitem__(self, key):
-        field_chain = key.split(FIELD_SEPARATOR)
-        current_node = self.node.get(field_chain[0])
-        for field in field_chain[1:]:
+        field_chain = key.split(FIELD_SEPARATOR) if isinstance(key, str) else key
+        return self.get_path(field_chain)
+
+    def get_path(self, field_chain):
+        """Returns the value at a path already split into fields, or None if there is none."""
+        current_node = self.node
+        for field in field_chain:
+            current_node = current_node.get(field)
             if current_node is None:
                 break
-            else:
-                current_node = current_node.get(field)
         return current_node
 
     def remove_field(self, field):
@@ -38,4 +69,4 @@ class DataNode:
         return list(self.node.keys())
 
     def as_dict(self):
-        return copy.deepcopy(self.node)
+        return copy_tree(self.node)
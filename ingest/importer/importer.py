@@ -1,5 +1,8 @@
 import json
 import logging
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 
 import openpyxl
 
@@ -7,6 +10,7 @@ import ingest.importer.submission
 from ingest.importer.conversion import template_manager
 from ingest.importer.conversion.metadata_entity import MetadataEntity
 from ingest.importer.conversion.template_manager import TemplateManager
+from ingest.importer.spreadsheet import workbook_source, xlsx_reader
 from ingest.importer.spreadsheet.ingest_workbook import IngestWorkbook
 from ingest.importer.spreadsheet.ingest_worksheet import IngestWorksheet
 from ingest.importer.submission import IngestSubmitter, EntityMap, EntityLinker
@@ -15,13 +19,40 @@ from ingest.importer.submission import IngestSubmitter, EntityMap, EntityLinker
 format = '[%(filename)s:%(lineno)s - %(funcName)20s() ] %(asctime)s - %(name)s - %(levelname)s - %(message)s'
 logging.basicConfig(format=format)
 
+env_max_workers = os.environ.get('IMPORTER_MAX_WORKERS')
+DEFAULT_MAX_WORKERS = int(env_max_workers) if env_max_workers else 1
+
+env_chunk_size = os.environ.get('IMPORTER_CHUNK_SIZE')
+DEFAULT_CHUNK_SIZE = int(env_chunk_size) if env_chunk_size else 500
+
+# xlsx files are read with openpyxl unless the lightweight 'raw' reader is chosen
+OPENPYXL_READER = 'openpyxl'
+RAW_XLSX_READER = 'raw'
+env_xlsx_reader = os.environ.get('IMPORTER_XLSX_READER')
+DEFAULT_XLSX_READER = env_xlsx_reader if env_xlsx_reader else OPENPYXL_READER
+
+# rows are converted one at a time unless a batch size is set
+env_batch_size = os.environ.get('IMPORTER_BATCH_SIZE')
+DEFAULT_BATCH_SIZE = int(env_batch_size) if env_batch_size else 0
+
 
 class XlsImporter:
 
     # TODO why does the importer need to refer to an IngestApi instance?
     # Seems like it should be the IngestSubmitter that takes care of this detail
-    def __init__(self, ingest_api):
+    def __init__(self, ingest_api, reader=DEFAULT_XLSX_READER, max_workers=DEFAULT_MAX_WORKERS,
+                 chunk_size=DEFAULT_CHUNK_SIZE, submission_workers=ingest.importer.submission.DEFAULT_MAX_WORKERS,
+                 max_links_per_host=ingest.importer.submission.DEFAULT_MAX_LINKS_PER_HOST,
+                 journal_dir=ingest.importer.submission.DEFAULT_JOURNAL_DIR):
         self.ingest_api = ingest_api
+        self.reader = reader
+        # passed on to the WorkbookImporter of every imported file
+        self.max_workers = max_workers
+        self.chunk_size = chunk_size
+        # passed on to the IngestSubmitter of every imported file
+        self.submission_workers = submission_workers
+        self.max_links_per_host = max_links_per_host
+        self.journal_dir = journal_dir
         self.logger = logging.getLogger(__name__)
 
     def dry_run_import_file(self, file_path, project_uuid=None):
@@ -32,7 +63,13 @@ class XlsImporter:
 
     def _generate_spreadsheet_json(self, file_path, project_uuid=None):
 
-        ingest_workbook = self._create_ingest_workbook(file_path)
+        ingest_workbook = self._create_ingest_workbook(file_path, reader=self.reader)
+        try:
+            return self._import_workbook(ingest_workbook, project_uuid)
+        finally:
+            ingest_workbook.close()
+
+    def _import_workbook(self, ingest_workbook, project_uuid=None):
         template_mgr = None
 
         try:
@@ -42,7 +79,8 @@ class XlsImporter:
             raise SchemaRetrievalError(
                 'An error was encountered while retrieving the schema information to process the spreadsheet.')
 
-        workbook_importer = WorkbookImporter(template_mgr)
+        workbook_importer = WorkbookImporter(template_mgr, max_workers=self.max_workers,
+                                             chunk_size=self.chunk_size)
         spreadsheet_json = workbook_importer.do_import(ingest_workbook, project_uuid)
 
         return spreadsheet_json, template_mgr
@@ -55,7 +93,9 @@ class XlsImporter:
             spreadsheet_json, template_mgr = self._generate_spreadsheet_json(file_path, project_uuid)
             entity_map = self._process_links_from_spreadsheet(template_mgr, spreadsheet_json)
 
-            submitter = IngestSubmitter(self.ingest_api)
+            submitter = IngestSubmitter(self.ingest_api, max_workers=self.submission_workers,
+                                        max_links_per_host=self.max_links_per_host,
+                                        journal_dir=self.journal_dir)
 
             # TODO the submission_url should be passed to the IngestSubmitter instead
             submission = submitter.submit(entity_map, submission_url)
@@ -85,9 +125,15 @@ class XlsImporter:
 
         return submission
 
+    # a directory of CSV, TSV or JSON lines worksheets is imported without any xlsx parsing
     @staticmethod
-    def _create_ingest_workbook(file_path):
-        workbook = openpyxl.load_workbook(filename=file_path, read_only=True)
+    def _create_ingest_workbook(file_path, reader=OPENPYXL_READER):
+        if os.path.isdir(file_path):
+            workbook = workbook_source.load_directory(file_path)
+        elif reader == RAW_XLSX_READER:
+            workbook = xlsx_reader.load_workbook(file_path)
+        else:
+            workbook = openpyxl.load_workbook(filename=file_path, read_only=True)
         return IngestWorkbook(workbook)
 
     @staticmethod
@@ -150,24 +196,35 @@ class _ImportRegistry:
 
 
 class WorkbookImporter:
+    """
+    Converts the worksheets of a workbook into metadata entities. With more than one worker,
+    rows are converted in chunks in a pool of processes, and the results are merged back in
+    worksheet and row order, so the output is the same as that of a serial import. Worksheets
+    are imported one at a time, with at most max_pending chunks (twice the number of workers by
+    default) read ahead of the results collected.
+    """
 
-    def __init__(self, template_mgr):
-        self.worksheet_importer = WorksheetImporter(template_mgr)
+    def __init__(self, template_mgr, max_workers=DEFAULT_MAX_WORKERS, chunk_size=DEFAULT_CHUNK_SIZE,
+                 batch_size=DEFAULT_BATCH_SIZE, max_pending=None):
+        self.worksheet_importer = WorksheetImporter(template_mgr, batch_size=batch_size)
         self.template_mgr = template_mgr
+        self.max_workers = max_workers
+        self.chunk_size = chunk_size
+        self.max_pending = max_pending if max_pending else 2 * max_workers
         self.logger = logging.getLogger(__name__)
 
     def do_import(self, workbook: IngestWorkbook, project_uuid=None):
         registry = _ImportRegistry()
-
-        for worksheet in workbook.importable_worksheets():
-            metadata_entities = self.worksheet_importer.do_import(worksheet)
-            module_field_name = worksheet.get_module_field_name()
-            for entity in metadata_entities:
-                if worksheet.is_module_tab():
-                    entity.retain_content_fields(module_field_name)
-                    registry.add_module(entity)
-                else:
-                    registry.add_submittable(entity)
+        if self.max_workers > 1:
+            with ProcessPoolExecutor(max_workers=self.max_workers) as executor:
+                worksheet_imports = ((worksheet, self.worksheet_importer.import_chunks(
+                    worksheet, executor, chunk_size=self.chunk_size, max_pending=self.max_pending))
+                                     for worksheet in workbook.importable_worksheets())
+                self._register_worksheet_imports(registry, worksheet_imports)
+        else:
+            worksheet_imports = [(worksheet, self.worksheet_importer.do_import(worksheet))
+                                 for worksheet in workbook.importable_worksheets()]
+            self._register_worksheet_imports(registry, worksheet_imports)
 
         if registry.has_project():
             registry.import_modules()
@@ -175,6 +232,18 @@ class WorkbookImporter:
             raise NoProjectFound()
         return registry.flatten()
 
+    @staticmethod
+    def _register_worksheet_imports(registry, worksheet_imports):
+        for worksheet, metadata_entities in worksheet_imports:
+            if worksheet.is_module_tab():
+                module_field_name = worksheet.get_module_field_name()
+                for entity in metadata_entities:
+                    entity.retain_content_fields(module_field_name)
+                    registry.add_module(entity)
+            else:
+                for entity in metadata_entities:
+                    registry.add_submittable(entity)
+
 
 class WorksheetImporter:
 
@@ -184,28 +253,120 @@ class WorksheetImporter:
 
     UNKNOWN_ID_PREFIX = '_unknown_'
 
-    def __init__(self, template: TemplateManager):
+    def __init__(self, template: TemplateManager, batch_size=DEFAULT_BATCH_SIZE):
         self.template = template
+        self.batch_size = batch_size
         self.unknown_id_ctr = 0
         self.logger = logging.getLogger(__name__)
         self.concrete_entity = None
 
     def do_import(self, ingest_worksheet: IngestWorksheet):
+        """
+        Returns the metadata entities of the worksheet, converted from the data rows as the
+        entities are iterated over, so that rows are never all held in memory.
+        """
+        return _ConvertedEntities(self.iter_import(ingest_worksheet))
+
+    def iter_import(self, ingest_worksheet: IngestWorksheet):
+        """
+        Yields the metadata entity of each data row as the row is read. Identifiers for
+        entities without one are assigned in row order. With a batch size set, rows are read
+        that many at a time and converted a column at a time.
+        """
+        row_template = self.template.create_row_template(ingest_worksheet)
+        if self.batch_size > 0:
+            metadata_entities = self._import_batches(row_template, ingest_worksheet)
+        elif ingest_worksheet.reads_values():
+            metadata_entities = (row_template.import_values(row_values)
+                                 for row_values in ingest_worksheet.iter_data_values())
+        else:
+            metadata_entities = (row_template.do_import(row) for row in ingest_worksheet.iter_data_rows())
+        for metadata in metadata_entities:
+            if not metadata.object_id:
+                metadata.object_id = self._generate_id()
+            yield metadata
+
+    def _import_batches(self, row_template, ingest_worksheet):
+        batch = []
+        for row_values in ingest_worksheet.iter_data_values():
+            batch.append(row_values)
+            if len(batch) == self.batch_size:
+                yield from row_template.import_rows(batch)
+                batch = []
+        if batch:
+            yield from row_template.import_rows(batch)
+
+    def import_chunks(self, ingest_worksheet: IngestWorksheet, executor, chunk_size=DEFAULT_CHUNK_SIZE,
+                      max_pending=2):
+        """
+        Reads the data rows of the worksheet in chunks of plain cell values and submits them to
+        the executor for conversion, yielding the metadata entities in row order. At most
+        max_pending chunks are submitted ahead of the results yielded, so that only a window of
+        the worksheet is held in memory.
+        """
         row_template = self.template.create_row_template(ingest_worksheet)
-        records = []
-        rows = ingest_worksheet.get_data_rows()
-        for index, row in enumerate(rows):
-            metadata = row_template.do_import(row)
+        conversions = deque()
+        chunk = []
+        for row_values in ingest_worksheet.iter_data_values():
+            chunk.append(row_values)
+            if len(chunk) == chunk_size:
+                conversions.append(executor.submit(_convert_rows, row_template, chunk))
+                chunk = []
+                if len(conversions) >= max_pending:
+                    yield from self._collect_conversion(conversions.popleft())
+        if chunk:
+            conversions.append(executor.submit(_convert_rows, row_template, chunk))
+        while conversions:
+            yield from self._collect_conversion(conversions.popleft())
+
+    def _collect_conversion(self, conversion):
+        # identifiers are only generated here, in row order, to match the numbering of do_import
+        for metadata in conversion.result():
             if not metadata.object_id:
                 metadata.object_id = self._generate_id()
-            records.append(metadata)
-        return records
+            yield metadata
 
     def _generate_id(self):
         self.unknown_id_ctr = self.unknown_id_ctr + 1
         return f'{self.UNKNOWN_ID_PREFIX}{self.unknown_id_ctr}'
 
 
+class _ConvertedEntities:
+    """
+    A sequence of metadata entities that are converted as they are first iterated over. Only
+    converted entities are kept; asking for the length converts the rest of them.
+    """
+
+    def __init__(self, entities):
+        self._entities = entities
+        self._converted = []
+
+    def __iter__(self):
+        index = 0
+        while True:
+            if index == len(self._converted) and not self._convert_next():
+                return
+            yield self._converted[index]
+            index += 1
+
+    def __len__(self):
+        while self._convert_next():
+            pass
+        return len(self._converted)
+
+    def _convert_next(self):
+        entity = next(self._entities, None)
+        if entity is None:
+            return False
+        self._converted.append(entity)
+        return True
+
+
+def _convert_rows(row_template, rows):
+    # rows are converted one by one, as they are in a serial import
+    return [row_template.import_values(row_values) for row_values in rows]
+
+
 class MultipleProjectsFound(Exception):
     def __init__(self):
         message = f'The spreadsheet should only be associated to a single project.'
@@ -0,0 +1,107 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+
+ENTITY_EVENT = 'entity'
+LINK_EVENT = 'link'
+MANIFEST_EVENT = 'manifest'
+SUBMISSION_EVENT = 'submission'
+
+
+class SubmissionJournal(object):
+    """
+    An append-only local record of the work done on a submission. Every entity created in ingest
+    is recorded with the links of its ingest resource, and every group of links is recorded once
+    all its targets are linked. Opening the journal of the same submission again replays the
+    records so that finished work can be skipped.
+    """
+
+    def __init__(self, journal_path, submission_url=None):
+        self.journal_path = journal_path
+        self.logger = logging.getLogger(__name__)
+        self.manifest = None
+        self._entities = {}
+        self._links = set()
+        self._lock = threading.Lock()
+
+        is_new = not os.path.exists(journal_path)
+        complete = True
+        if not is_new:
+            complete = self._replay()
+        self._journal_file = open(journal_path, 'a')
+        if not complete:
+            # start new records on a fresh line after an incomplete one
+            self._journal_file.write('\n')
+        if is_new and submission_url:
+            self._append({'event': SUBMISSION_EVENT, 'url': submission_url})
+
+    @staticmethod
+    def for_submission(journal_dir, submission_url):
+        os.makedirs(journal_dir, exist_ok=True)
+        journal_name = hashlib.sha1(submission_url.encode('utf-8')).hexdigest()
+        journal_path = os.path.join(journal_dir, f'{journal_name}.jsonl')
+        return SubmissionJournal(journal_path, submission_url=submission_url)
+
+    def _replay(self):
+        line = '\n'
+        with open(self.journal_path) as journal_file:
+            for line in journal_file:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # the last line may have been cut short if the previous run crashed
+                    self.logger.warning(f'Skipping incomplete record in journal {self.journal_path}.')
+                    continue
+                event = record.get('event')
+                if event == ENTITY_EVENT:
+                    self._entities[record['key']] = record['links']
+                elif event == LINK_EVENT:
+                    self._links.add(record['key'])
+                elif event == MANIFEST_EVENT:
+                    self.manifest = record['manifest']
+        return line.endswith('\n')
+
+    def count_entities(self):
+        return len(self._entities)
+
+    def get_entity_links(self, entity):
+        return self._entities.get(self._entity_key(entity))
+
+    def record_entity(self, entity):
+        links = entity.ingest_json.get('_links', {})
+        key = self._entity_key(entity)
+        with self._lock:
+            self._entities[key] = links
+            self._append({'event': ENTITY_EVENT, 'key': key, 'links': links})
+
+    def is_linked(self, from_entity, to_entities, relationship):
+        return self._link_key(from_entity, to_entities, relationship) in self._links
+
+    def record_links(self, from_entity, to_entities, relationship):
+        key = self._link_key(from_entity, to_entities, relationship)
+        with self._lock:
+            self._links.add(key)
+            self._append({'event': LINK_EVENT, 'key': key})
+
+    def record_manifest(self, manifest):
+        with self._lock:
+            self.manifest = manifest
+            self._append({'event': MANIFEST_EVENT, 'manifest': manifest})
+
+    def close(self):
+        with self._lock:
+            self._journal_file.close()
+
+    def _append(self, record):
+        self._journal_file.write(json.dumps(record) + '\n')
+        self._journal_file.flush()
+
+    @staticmethod
+    def _entity_key(entity):
+        return f'{entity.type}.{entity.id}'
+
+    def _link_key(self, from_entity, to_entities, relationship):
+        target_keys = ','.join(self._entity_key(to_entity) for to_entity in to_entities)
+        return f'{self._entity_key(from_entity)}|{relationship}|{target_keys}'
@@ -39,6 +39,11 @@ class IngestWorkbook:
             schemas.append(schema_cell.value)
         return schemas
 
+    def close(self):
+        # read-only openpyxl workbooks and xlsx workbook sources keep their file open until closed
+        if hasattr(self.workbook, 'close'):
+            self.workbook.close()
+
     def importable_worksheets(self):
         return [IngestWorksheet(worksheet) for worksheet in self.workbook.worksheets
                 if worksheet.title not in SPECIAL_TABS]
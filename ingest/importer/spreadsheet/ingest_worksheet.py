@@ -13,43 +13,71 @@ class IngestWorksheet(object):
     def __init__(self, worksheet: Worksheet, header_row_idx=HEADER_ROW_IDX):
         self._worksheet = worksheet
         self._header_row_idx = header_row_idx
+        self._column_headers = None
 
     @staticmethod
     def is_empty(row):
         return all(cell.value is None for cell in row)
 
+    def reads_values(self):
+        """Tells if the worksheet reads rows as plain values, without creating cell objects."""
+        return hasattr(self._worksheet, 'iter_values')
+
+    def _iter_values(self, min_row, max_row):
+        # worksheets that can read rows as plain values are spared the creation of cell objects
+        if self.reads_values():
+            return self._worksheet.iter_values(min_row=min_row, max_row=max_row)
+        rows = self._worksheet.iter_rows(min_row=min_row, max_row=max_row)
+        return (tuple(cell.value for cell in row) for row in rows)
+
     @property
     def title(self):
         return self._worksheet.title
 
     def get_column_headers(self):
-        rows = self._worksheet.iter_rows(min_row=self._header_row_idx, max_row=self._header_row_idx)
-        header_row = next(rows)
+        # the header row is only read once, as every read of a read-only worksheet reparses it
+        if self._column_headers is None:
+            self._column_headers = self._read_column_headers()
+        return list(self._column_headers)
+
+    def _read_column_headers(self):
+        rows = self._iter_values(self._header_row_idx, self._header_row_idx)
+        header_row = next(rows, ())
 
         headers = []
-        for cell in header_row:
-            if cell.value is None:
+        for value in header_row:
+            if value is None:
                 continue
 
-            cell_value = cell.value.strip()
-            headers.append(cell_value)
+            headers.append(value.strip())
 
         return headers
 
     def get_data_rows(self, start_row=START_DATA_ROW, end_row=None):
-        headers = self.get_column_headers()
-        max_row = end_row or self.compute_max_row()
+        return list(self.iter_data_rows(start_row=start_row, end_row=end_row))
+
+    def iter_data_rows(self, start_row=START_DATA_ROW, end_row=None):
+        """
+        Yields the non-empty data rows one at a time, trimmed to the column headers, as they
+        are read from the worksheet.
+        """
+        header_count = len(self.get_column_headers())
+        # a read-only worksheet without recorded dimensions is streamed to its last row
+        max_row = end_row or self._worksheet.max_row
         rows = self._worksheet.iter_rows(min_row=start_row, max_row=max_row)
-        return [row[:len(headers)] for row in rows if not self.is_empty(row)]
-
-    # NOTE: there are no tests around this because it's too complicated to
-    # setup the scenario where the worksheet returns an erroneous max_row value
-    def compute_max_row(self):
-        max_row = self._worksheet.max_row
-        if max_row is None:
-            self._worksheet.calculate_dimension(force=True)
-            max_row = self._worksheet.max_row
-        return max_row
+        for row in rows:
+            if not self.is_empty(row):
+                yield row[:header_count]
+
+    def iter_data_values(self, start_row=START_DATA_ROW, end_row=None):
+        """
+        Yields the non-empty data rows like iter_data_rows, but as plain tuples of cell values.
+        """
+        header_count = len(self.get_column_headers())
+        max_row = end_row or self._worksheet.max_row
+        for values in self._iter_values(start_row, max_row):
+            if any(value is not None for value in values):
+                yield values[:header_count]
 
     def is_module_tab(self):
         match = MODULE_TITLE_PATTERN.match(self.title)
@@ -0,0 +1,155 @@
+"""
+Workbook sources other than xlsx files, for submissions generated by pipelines. A source workbook
+offers the parts of the openpyxl workbook and worksheet interface that IngestWorkbook and
+IngestWorksheet use, so it can be imported the same way as a spreadsheet.
+
+A directory workbook holds one file per worksheet, named after the worksheet title, e.g.
+'Project.csv' or 'Donor organism - Familial relationship.tsv'. A file name may start with its
+position in the workbook, followed by a space or an underscore, e.g. '01 Project.csv', which is
+not part of the title. Files are either comma or tab
+separated values, or JSON lines where every line is a JSON array of cell values. Rows follow
+the spreadsheet layout: column headers are on row 4 and data starts on row 6, and a 'Schemas'
+file lists the schema URLs from row 2 onwards.
+"""
+import csv
+import json
+import os
+import re
+from collections import OrderedDict, namedtuple
+
+CSV_EXTENSION = '.csv'
+TSV_EXTENSION = '.tsv'
+JSON_LINES_EXTENSION = '.jsonl'
+
+SOURCE_EXTENSIONS = (CSV_EXTENSION, TSV_EXTENSION, JSON_LINES_EXTENSION)
+
+POSITIONED_NAME_PATTERN = re.compile(r'^(?P<position>\d+)[ _](?P<title>.+)$')
+
+SourceCell = namedtuple('SourceCell', ['value'])
+
+
+def _read_csv(path, delimiter):
+    with open(path, newline='', encoding='utf-8') as source_file:
+        for row in csv.reader(source_file, delimiter=delimiter):
+            # as with spreadsheet cells, blank values are empty cells
+            yield [value if value != '' else None for value in row]
+
+
+def _read_json_lines(path):
+    with open(path, encoding='utf-8') as source_file:
+        for line in source_file:
+            line = line.strip()
+            yield json.loads(line) if line else []
+
+
+def read_source_file(path):
+    """Yields the rows of a worksheet file, each as a list of cell values."""
+    extension = os.path.splitext(path)[1].lower()
+    if extension == CSV_EXTENSION:
+        return _read_csv(path, ',')
+    if extension == TSV_EXTENSION:
+        return _read_csv(path, '\t')
+    if extension == JSON_LINES_EXTENSION:
+        return _read_json_lines(path)
+    raise UnsupportedSourceFile(path)
+
+
+class SourceWorksheet(object):
+    """
+    A worksheet whose rows are streamed from a file on every read. The number of rows is not
+    known in advance, so max_row is None, and rows are read to the end of the file unless a
+    max_row is given. Besides rows of cells, rows can be read as plain tuples of values.
+    """
+
+    max_row = None
+
+    def __init__(self, title, path):
+        self.title = title
+        self.path = path
+
+    def _read_values(self):
+        return read_source_file(self.path)
+
+    def iter_values(self, min_row=1, max_row=None):
+        for row_idx, values in enumerate(self._read_values(), start=1):
+            if max_row is not None and row_idx > max_row:
+                break
+            if row_idx >= min_row:
+                # as in openpyxl, blank rows have a single empty cell
+                yield tuple(values) or (None,)
+
+    def iter_rows(self, min_row=1, max_row=None):
+        for values in self.iter_values(min_row=min_row, max_row=max_row):
+            yield tuple(SourceCell(value) for value in values)
+
+
+class SourceWorkbook(object):
+    """
+    The worksheets of a workbook source, by title. A reader that holds resources open for the
+    worksheets, like the archive of an xlsx file, is closed along with the workbook.
+    """
+
+    def __init__(self, worksheets, reader=None):
+        self._worksheets = OrderedDict((worksheet.title, worksheet) for worksheet in worksheets)
+        self._reader = reader
+
+    def close(self):
+        if self._reader is not None:
+            self._reader.close()
+
+    @property
+    def worksheets(self):
+        return list(self._worksheets.values())
+
+    @property
+    def sheetnames(self):
+        return list(self._worksheets.keys())
+
+    def get_sheet_names(self):
+        return self.sheetnames
+
+    def get_sheet_by_name(self, title):
+        return self._worksheets[title]
+
+    def __getitem__(self, title):
+        return self._worksheets[title]
+
+
+def load_directory(directory):
+    """
+    Creates a workbook out of the worksheet files in a directory. Worksheets are ordered by the
+    position their file names start with, and those without one come last, ordered by title.
+    Files of other types are ignored.
+    """
+    positioned_worksheets = []
+    for file_name in os.listdir(directory):
+        name, extension = os.path.splitext(file_name)
+        if extension.lower() in SOURCE_EXTENSIONS:
+            position, title = _split_position(name)
+            worksheet = SourceWorksheet(title, os.path.join(directory, file_name))
+            positioned_worksheets.append((position is None, position, title, worksheet))
+    if not positioned_worksheets:
+        raise EmptySourceDirectory(directory)
+    positioned_worksheets.sort(key=lambda positioned: positioned[:3])
+    return SourceWorkbook(worksheet for *__, worksheet in positioned_worksheets)
+
+
+def _split_position(name):
+    match = POSITIONED_NAME_PATTERN.match(name)
+    if not match:
+        return None, name
+    return int(match.group('position')), match.group('title')
+
+
+class UnsupportedSourceFile(Exception):
+
+    def __init__(self, path):
+        super(UnsupportedSourceFile, self).__init__(f'[{path}] is not a CSV, TSV or JSON lines file.')
+        self.path = path
+
+
+class EmptySourceDirectory(Exception):
+
+    def __init__(self, directory):
+        super(EmptySourceDirectory, self).__init__(f'[{directory}] has no worksheet files.')
+        self.directory = directory
@@ -0,0 +1,247 @@
+"""
+A lightweight, read only xlsx reader. Worksheet XML is streamed with iterparse and rows are
+produced as plain tuples of values, without the cell objects that openpyxl creates for every
+cell. Shared strings and cell styles are read once per workbook.
+
+Cell values are converted the way openpyxl does: numbers to int or float, booleans to bool, and
+numbers with a date format and ISO 8601 date cells to datetime. Date numbers count from 1904 in
+workbooks set to the 1904 date system. Formulas are not evaluated; their cached value is used.
+"""
+import posixpath
+import re
+import zipfile
+from xml.etree.ElementTree import iterparse, parse
+
+from openpyxl.styles.numbers import BUILTIN_FORMATS, is_date_format
+from openpyxl.utils.datetime import from_excel, from_ISO8601, CALENDAR_MAC_1904, CALENDAR_WINDOWS_1900
+
+from ingest.importer.spreadsheet.workbook_source import SourceWorksheet, SourceWorkbook
+
+MAIN_NS = '{http://schemas.openxmlformats.org/spreadsheetml/2006/main}'
+RELATIONSHIP_NS = '{http://schemas.openxmlformats.org/officeDocument/2006/relationships}'
+PACKAGE_RELATIONSHIP_NS = '{http://schemas.openxmlformats.org/package/2006/relationships}'
+
+WORKBOOK_PATH = 'xl/workbook.xml'
+WORKBOOK_RELATIONSHIPS_PATH = 'xl/_rels/workbook.xml.rels'
+SHARED_STRINGS_PATH = 'xl/sharedStrings.xml'
+STYLES_PATH = 'xl/styles.xml'
+
+ROW_TAG = f'{MAIN_NS}row'
+CELL_TAG = f'{MAIN_NS}c'
+VALUE_TAG = f'{MAIN_NS}v'
+INLINE_STRING_TAG = f'{MAIN_NS}is'
+TEXT_TAG = f'{MAIN_NS}t'
+RUN_TAG = f'{MAIN_NS}r'
+SHEET_DATA_TAG = f'{MAIN_NS}sheetData'
+WORKBOOK_PROPERTIES_TAG = f'{MAIN_NS}workbookPr'
+
+CELL_REFERENCE_PATTERN = re.compile(r'^([A-Z]+)')
+
+EMPTY_ROW = (None,)
+
+
+def _column_index(cell_reference):
+    letters = CELL_REFERENCE_PATTERN.match(cell_reference).group(1)
+    index = 0
+    for letter in letters:
+        index = index * 26 + (ord(letter) - ord('A') + 1)
+    return index - 1
+
+
+def _cast_number(value):
+    if '.' in value or 'E' in value or 'e' in value:
+        return float(value)
+    return int(value)
+
+
+def _read_text(element):
+    # rich text is split into runs; phonetic hints (rPh) are not part of the text
+    text = element.find(TEXT_TAG)
+    if text is not None:
+        return text.text or ''
+    return ''.join(run_text.text or '' for run in element.iter(RUN_TAG) for run_text in run.iter(TEXT_TAG))
+
+
+class XlsxWorksheet(SourceWorksheet):
+    """
+    A worksheet of an xlsx file. Every read streams the worksheet XML from the start, so rows
+    are never all held in memory.
+    """
+
+    def __init__(self, title, reader, sheet_path):
+        super(XlsxWorksheet, self).__init__(title, sheet_path)
+        self._reader = reader
+
+    def iter_values(self, min_row=1, max_row=None):
+        # rows are numbered in the sheet XML, and rows without any data are left out of it; as
+        # in openpyxl, such rows have a single empty cell
+        next_row_idx = min_row
+        for row_idx, values in self._reader.read_rows(self.path):
+            if row_idx < min_row:
+                continue
+            last_gap_idx = row_idx if max_row is None else min(row_idx, max_row + 1)
+            while next_row_idx < last_gap_idx:
+                yield EMPTY_ROW
+                next_row_idx += 1
+            if max_row is not None and row_idx > max_row:
+                break
+            yield values or EMPTY_ROW
+            next_row_idx = row_idx + 1
+
+
+class XlsxReader(object):
+
+    def __init__(self, file_path):
+        self.file_path = file_path
+        self._archive = zipfile.ZipFile(file_path)
+        self._shared_strings = None
+        self._date_styles = None
+        self._epoch = None
+
+    def close(self):
+        self._archive.close()
+
+    def load_workbook(self):
+        worksheets = [XlsxWorksheet(title, self, sheet_path)
+                      for title, sheet_path in self._read_sheet_paths()]
+        return SourceWorkbook(worksheets, reader=self)
+
+    def _read_sheet_paths(self):
+        relationships = parse(self._archive.open(WORKBOOK_RELATIONSHIPS_PATH)).getroot()
+        targets = {relationship.get('Id'): relationship.get('Target')
+                   for relationship in relationships.iter(f'{PACKAGE_RELATIONSHIP_NS}Relationship')}
+        workbook = parse(self._archive.open(WORKBOOK_PATH)).getroot()
+        sheet_paths = []
+        for sheet in workbook.iter(f'{MAIN_NS}sheet'):
+            target = targets[sheet.get(f'{RELATIONSHIP_NS}id')]
+            # targets are relative to the workbook part, unless they start from the package root
+            if target.startswith('/'):
+                sheet_path = target[1:]
+            else:
+                sheet_path = posixpath.normpath(posixpath.join(posixpath.dirname(WORKBOOK_PATH), target))
+            sheet_paths.append((sheet.get('name'), sheet_path))
+        return sheet_paths
+
+    @property
+    def shared_strings(self):
+        if self._shared_strings is None:
+            self._shared_strings = self._read_shared_strings()
+        return self._shared_strings
+
+    def _read_shared_strings(self):
+        if SHARED_STRINGS_PATH not in self._archive.namelist():
+            return []
+        shared_strings = []
+        with self._archive.open(SHARED_STRINGS_PATH) as source:
+            for _, element in iterparse(source):
+                if element.tag == f'{MAIN_NS}si':
+                    shared_strings.append(_read_text(element))
+                    element.clear()
+        return shared_strings
+
+    @property
+    def date_styles(self):
+        if self._date_styles is None:
+            self._date_styles = self._read_date_styles()
+        return self._date_styles
+
+    def _read_date_styles(self):
+        """Returns the indices of the cell styles that format numbers as dates."""
+        if STYLES_PATH not in self._archive.namelist():
+            return frozenset()
+        styles = parse(self._archive.open(STYLES_PATH)).getroot()
+        number_formats = dict(BUILTIN_FORMATS)
+        for number_format in styles.iter(f'{MAIN_NS}numFmt'):
+            number_formats[int(number_format.get('numFmtId'))] = number_format.get('formatCode')
+        date_styles = set()
+        cell_formats = styles.find(f'{MAIN_NS}cellXfs')
+        if cell_formats is not None:
+            for index, cell_format in enumerate(cell_formats.iter(f'{MAIN_NS}xf')):
+                format_code = number_formats.get(int(cell_format.get('numFmtId', 0)))
+                if format_code and is_date_format(format_code):
+                    date_styles.add(index)
+        return frozenset(date_styles)
+
+    @property
+    def epoch(self):
+        if self._epoch is None:
+            self._epoch = self._read_epoch()
+        return self._epoch
+
+    def _read_epoch(self):
+        """Returns the date that date numbers count from, as set in the workbook properties."""
+        workbook = parse(self._archive.open(WORKBOOK_PATH)).getroot()
+        properties = workbook.find(WORKBOOK_PROPERTIES_TAG)
+        date_1904 = properties.get('date1904') if properties is not None else None
+        return CALENDAR_MAC_1904 if date_1904 in ('1', 'true') else CALENDAR_WINDOWS_1900
+
+    def read_rows(self, sheet_path):
+        """Yields the row number and the tuple of cell values of every row in the sheet XML."""
+        shared_strings = self.shared_strings
+        date_styles = self.date_styles
+        epoch = self.epoch
+        with self._archive.open(sheet_path) as source:
+            sheet_data = None
+            last_row_idx = 0
+            for event, element in iterparse(source, events=('start', 'end')):
+                if event == 'start':
+                    if element.tag == SHEET_DATA_TAG:
+                        sheet_data = element
+                    continue
+                if element.tag != ROW_TAG:
+                    continue
+                row_attribute = element.get('r')
+                row_idx = int(row_attribute) if row_attribute else last_row_idx + 1
+                last_row_idx = row_idx
+                values = self._read_row_values(element, shared_strings, date_styles, epoch)
+                # processed rows are dropped so that memory use does not grow with the sheet
+                if sheet_data is not None:
+                    sheet_data.clear()
+                yield row_idx, values
+
+    @staticmethod
+    def _read_row_values(row, shared_strings, date_styles, epoch):
+        values = []
+        for cell in row.iter(CELL_TAG):
+            reference = cell.get('r')
+            if reference:
+                column_idx = _column_index(reference)
+                if column_idx > len(values):
+                    values.extend([None] * (column_idx - len(values)))
+            values.append(XlsxReader._read_cell_value(cell, shared_strings, date_styles, epoch))
+        while values and values[-1] is None:
+            values.pop()
+        return tuple(values)
+
+    @staticmethod
+    def _read_cell_value(cell, shared_strings, date_styles, epoch):
+        data_type = cell.get('t', 'n')
+        if data_type == 'inlineStr':
+            inline_string = cell.find(INLINE_STRING_TAG)
+            return None if inline_string is None else _read_text(inline_string)
+        value_element = cell.find(VALUE_TAG)
+        if value_element is None or value_element.text is None:
+            return None
+        value = value_element.text
+        if data_type == 's':
+            return shared_strings[int(value)]
+        if data_type == 'b':
+            return value == '1'
+        if data_type == 'n':
+            number = _cast_number(value)
+            style = cell.get('s')
+            if style is not None and int(style) in date_styles:
+                return from_excel(number, epoch)
+            return number
+        if data_type == 'd':
+            return from_ISO8601(value)
+        # formula strings and errors are kept as text
+        return value
+
+
+def load_workbook(file_path):
+    """
+    Opens an xlsx file as a workbook that can be passed to IngestWorkbook. The file stays open
+    until the workbook is closed.
+    """
+    return XlsxReader(file_path).load_workbook()
@@ -1,33 +1,80 @@
 import json
 import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from types import MappingProxyType
+from urllib.parse import urlparse
+
 import requests
 
+from ingest.importer.journal import SubmissionJournal
+
 format = '[%(filename)s:%(lineno)s - %(funcName)20s() ] %(asctime)s - %(name)s - %(levelname)s - %(message)s'
 logging.basicConfig(format=format)
 
+env_max_workers = os.environ.get('SUBMISSION_MAX_WORKERS')
+DEFAULT_MAX_WORKERS = int(env_max_workers) if env_max_workers else 1
+
+# links are requests against the few ingest hosts, so they are capped apart from the workers
+env_max_links_per_host = os.environ.get('SUBMISSION_MAX_LINKS_PER_HOST')
+DEFAULT_MAX_LINKS_PER_HOST = int(env_max_links_per_host) if env_max_links_per_host else 4
+
+DEFAULT_JOURNAL_DIR = os.environ.get('SUBMISSION_JOURNAL_DIR')
+
 
 class IngestSubmitter(object):
 
-    def __init__(self, ingest_api):
+    def __init__(self, ingest_api, max_workers=DEFAULT_MAX_WORKERS,
+                 max_links_per_host=DEFAULT_MAX_LINKS_PER_HOST, journal_dir=DEFAULT_JOURNAL_DIR):
         # TODO the IngestSubmitter should probably build its own instance of IngestApi
         self.ingest_api = ingest_api
         self.logger = logging.getLogger(__name__)
         self.PROGRESS_CTR = 50
+        # entities are submitted serially unless more than 1 worker is allowed
+        self.max_workers = max_workers
+        self.max_links_per_host = max_links_per_host
+        # work is only checkpointed when a journal directory is given
+        self.journal_dir = journal_dir
+        self.journal = None
 
     def submit(self, entity_map, submission_url):
         submission = Submission(self.ingest_api, submission_url)
-        submission.define_manifest(entity_map)
+        self.journal = self._open_journal(submission_url)
+
+        try:
+            self._define_manifest(entity_map, submission)
 
-        entities = entity_map.get_entities()
+            entities = entity_map.get_entities()
 
-        self._add_entities(entities, submission)
+            self._add_entities(entities, submission)
 
-        self._link_submission_to_project(entity_map, submission, submission_url)
+            self._link_submission_to_project(entity_map, submission, submission_url)
 
-        self._link_entities(entities, entity_map, submission)
+            self._link_entities(entities, entity_map, submission)
+        finally:
+            if self.journal:
+                self.journal.close()
+                self.journal = None
 
         return submission
 
+    def _open_journal(self, submission_url):
+        if not self.journal_dir:
+            return None
+        journal = SubmissionJournal.for_submission(self.journal_dir, submission_url)
+        if journal.count_entities():
+            self.logger.info(f'Resuming submission {submission_url} from journal {journal.journal_path}.')
+        return journal
+
+    def _define_manifest(self, entity_map, submission):
+        if self.journal and self.journal.manifest:
+            submission.manifest = self.journal.manifest
+            return
+        submission.define_manifest(entity_map)
+        if self.journal:
+            self.journal.record_manifest(submission.manifest)
+
     def _link_submission_to_project(self, entity_map, submission, submission_url):
         project = entity_map.get_project()
         submission_envelope = self.ingest_api.getSubmissionEnvelope(submission_url)
@@ -37,37 +84,225 @@ class IngestSubmitter(object):
                                    is_reference=True,
                                    ingest_json=submission_envelope
                                    )
+        if self._is_linked(project, [submission_entity], 'submissionEnvelopes'):
+            return
         submission.link_entity(project, submission_entity, 'submissionEnvelopes')
+        self._record_links(project, [submission_entity], 'submissionEnvelopes')
 
     def _link_entities(self, entities, entity_map, submission):
-        progress = 0
+        link_groups = []
+        linked_count = 0
         for entity in entities:
-            for link in entity.direct_links:
-                to_entity = entity_map.get_entity(link['entity'], link['id'])
-                try:
-                    submission.link_entity(entity, to_entity, relationship=link['relationship'])
-                    progress = progress + 1
-                    if progress % self.PROGRESS_CTR == 0 or (progress == int(submission.manifest.get('expectedLinks', 0))):
-                        manifest_url = self.ingest_api.get_link_from_resource(submission.manifest, 'self')
-                        self.ingest_api.patch(manifest_url, {'actualLinks': progress})
-                        self.logger.info(f"links progress: {progress}/ {submission.manifest.get('expectedLinks')}")
+            for from_entity, to_entities, relationship in self._group_links(entity, entity_map):
+                if self._is_linked(from_entity, to_entities, relationship):
+                    linked_count = linked_count + len(to_entities)
+                else:
+                    link_groups.append((from_entity, to_entities, relationship))
+
+        progress = LinkProgress(self.ingest_api, submission.manifest, self.PROGRESS_CTR,
+                                start_count=linked_count)
+
+        def apply_links(from_entity, to_entities, relationship):
+            submission.link_entities(from_entity, to_entities, relationship=relationship)
+            self._record_links(from_entity, to_entities, relationship)
+            progress.increment(len(to_entities))
+
+        if self.max_workers > 1:
+            self._link_entities_concurrently(link_groups, submission, apply_links)
+            return
+
+        for from_entity, to_entities, relationship in link_groups:
+            try:
+                apply_links(from_entity, to_entities, relationship)
+            except Exception as link_error:
+                for to_entity in to_entities:
+                    self._log_link_error(from_entity, to_entity, link_error)
+                raise
+
+    def _link_entities_concurrently(self, link_groups, submission, apply_links):
+        # groups from the same source entity make up one chain
+        chains_by_source = {}
+        for link_group in link_groups:
+            from_entity = link_group[0]
+            chains_by_source.setdefault((from_entity.type, from_entity.id), []).append(link_group)
+        link_chains = list(chains_by_source.values())
+
+        scheduler = LinkScheduler(self.max_workers, self.max_links_per_host)
+        scheduler.resolve_references(link_chains, submission)
+        failures = scheduler.run(link_chains, apply_links)
+
+        for from_entity, to_entity, link_error in failures:
+            self._log_link_error(from_entity, to_entity, link_error)
+
+        if failures:
+            raise LinksNotCreated(failures)
 
-                except Exception as link_error:
-                    error_message = f'''The {entity.type} with id {entity.id} could not be 
+    @staticmethod
+    def _group_links(entity, entity_map):
+        # all targets of the same relationship are linked in a single request
+        targets_by_relationship = {}
+        for link in entity.direct_links:
+            to_entity = entity_map.get_entity(link['entity'], link['id'])
+            targets_by_relationship.setdefault(link['relationship'], []).append(to_entity)
+        return [(entity, to_entities, relationship)
+                for relationship, to_entities in targets_by_relationship.items()]
+
+    def _is_linked(self, from_entity, to_entities, relationship):
+        return self.journal and self.journal.is_linked(from_entity, to_entities, relationship)
+
+    def _record_links(self, from_entity, to_entities, relationship):
+        if self.journal:
+            self.journal.record_links(from_entity, to_entities, relationship)
+
+    def _log_link_error(self, from_entity, to_entity, link_error):
+        error_message = f'''The {from_entity.type} with id {from_entity.id} could not be 
                     linked to {to_entity.type} with id {to_entity.id}.'''
-                    self.logger.error(error_message)
-                    self.logger.error(f'{str(link_error)}')
-                    raise
+        self.logger.error(error_message)
+        self.logger.error(f'{str(link_error)}')
 
     def _add_entities(self, entities, submission):
-        for entity in entities:
-            if not entity.is_reference:
+        new_entities = [entity for entity in entities
+                        if not entity.is_reference and not self._restore_entity(entity, submission)]
+
+        # projects are always created first as every other entity depends on them
+        projects = [entity for entity in new_entities if entity.type == 'project']
+        dependents = [entity for entity in new_entities if entity.type != 'project']
+
+        for project in projects:
+            self._add_entity(project, submission)
+
+        if self.max_workers > 1:
+            self._add_entities_concurrently(dependents, submission)
+        else:
+            for entity in dependents:
+                self._add_entity(entity, submission)
+
+    def _restore_entity(self, entity, submission):
+        entity_links = self.journal.get_entity_links(entity) if self.journal else None
+        if entity_links is None:
+            return False
+        submission.restore_entity(entity, {'_links': entity_links})
+        return True
+
+    def _add_entity(self, entity, submission):
+        try:
+            self._create_entity(entity, submission)
+        except:
+            self._log_entity_error(entity)
+            raise
+
+    def _create_entity(self, entity, submission):
+        submission.add_entity(entity)
+        if self.journal:
+            self.journal.record_entity(entity)
+        return entity
+
+    def _add_entities_concurrently(self, entities, submission):
+        failures = []
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = {executor.submit(self._create_entity, entity, submission): entity for entity in entities}
+            for future in as_completed(futures):
+                entity = futures[future]
+                error = future.exception()
+                if error:
+                    self._log_entity_error(entity)
+                    self.logger.error(str(error))
+                    failures.append((entity, error))
+
+        if failures:
+            raise EntitiesNotCreated(failures)
+
+    def _log_entity_error(self, entity):
+        error_message = f'error in entity [{entity.type}]:\n{entity.content}'
+        self.logger.error(error_message)
+
+
+class LinkProgress(object):
+    """
+    Keeps count of the links created so far and reports it to the submission manifest every few
+    links. Increments are safe to make from several threads.
+    """
+
+    def __init__(self, ingest_api, manifest, progress_ctr, start_count=0):
+        self.ingest_api = ingest_api
+        self.manifest = manifest
+        self.progress_ctr = progress_ctr
+        self.count = start_count
+        self.logger = logging.getLogger(__name__)
+        self._lock = threading.Lock()
+
+    def increment(self, link_count=1):
+        # the manifest is patched while holding the lock so that actualLinks never goes backwards
+        with self._lock:
+            previous_count = self.count
+            self.count = self.count + link_count
+            expected_links = self.manifest.get('expectedLinks', 0)
+            crossed_step = self.count // self.progress_ctr > previous_count // self.progress_ctr
+            if crossed_step or (self.count == int(expected_links)):
+                manifest_url = self.ingest_api.get_link_from_resource(self.manifest, 'self')
+                self.ingest_api.patch(manifest_url, {'actualLinks': self.count})
+                self.logger.info(f"links progress: {self.count}/ {expected_links}")
+            return self.count
+
+
+class LinkScheduler(object):
+    """
+    Runs link requests in a bounded thread pool. Links are given as chains of
+    (from_entity, to_entities, relationship) tuples sharing the same source entity. Each chain is
+    applied in order by a single worker because every link in it updates the same document in
+    ingest, while separate chains run concurrently. The number of requests in flight against a
+    single host is capped at max_requests_per_host.
+    """
+
+    def __init__(self, max_workers, max_requests_per_host):
+        self.max_workers = max_workers
+        self.max_requests_per_host = max_requests_per_host
+        self._host_limits = {}
+        self._lock = threading.Lock()
+
+    def resolve_references(self, link_chains, submission):
+        # references are resolved up front so that no 2 workers fetch the same entity
+        references = {}
+        for chain in link_chains:
+            for from_entity, to_entities, __ in chain:
+                for entity in [from_entity] + list(to_entities):
+                    if entity.is_reference and not entity.ingest_json:
+                        references[(entity.type, entity.id)] = entity
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            list(executor.map(submission.resolve_reference, references.values()))
+
+    def run(self, link_chains, apply_links):
+        failures = []
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = [executor.submit(self._run_chain, chain, apply_links) for chain in link_chains]
+            for future in as_completed(futures):
+                failures.extend(future.result())
+        return failures
+
+    def _run_chain(self, chain, apply_links):
+        failures = []
+        for from_entity, to_entities, relationship in chain:
+            with self._host_limit(self._get_host(from_entity, relationship)):
                 try:
-                    submission.add_entity(entity)
-                except:
-                    error_message = f'error in entity [{entity.type}]:\n{entity.content}'
-                    self.logger.error(error_message)
-                    raise
+                    apply_links(from_entity, to_entities, relationship)
+                except Exception as link_error:
+                    failures.extend((from_entity, to_entity, link_error) for to_entity in to_entities)
+        return failures
+
+    def _host_limit(self, host):
+        with self._lock:
+            host_limit = self._host_limits.get(host)
+            if not host_limit:
+                host_limit = threading.BoundedSemaphore(self.max_requests_per_host)
+                self._host_limits[host] = host_limit
+            return host_limit
+
+    @staticmethod
+    def _get_host(entity, relationship):
+        ingest_json = entity.ingest_json if isinstance(entity.ingest_json, dict) else {}
+        link = ingest_json.get('_links', {}).get(relationship, {})
+        return urlparse(link.get('href', '')).netloc
 
 
 class EntityLinker(object):
@@ -77,7 +312,8 @@ class EntityLinker(object):
         self.process_id_ctr = 0
 
     def process_links_from_spreadsheet(self, entity_map):
-        for entity in entity_map.get_entities():
+        # linking adds process entities to the map, so iterate over a snapshot of it
+        for entity in list(entity_map.get_entities()):
             self._validate_entity_links(entity_map, entity)
             self._generate_direct_links(entity_map, entity)
 
@@ -238,13 +474,67 @@ class EntityLinker(object):
         return 'process_id_' + str(self.process_id_ctr)
 
 
+def _tracks_size(list_method):
+    def tracked_method(self, *args, **kwargs):
+        size = len(self)
+        result = list_method(self, *args, **kwargs)
+        self._notify_size_change(len(self) - size)
+        return result
+    return tracked_method
+
+
+class DirectLinks(list):
+    """
+    The direct links of an Entity. Every change in the number of links is reported to the
+    listeners of the owning entity, so that link totals can be kept without walking all entities.
+    """
+
+    __slots__ = ('_owner',)
+
+    def __init__(self, links=(), owner=None):
+        super(DirectLinks, self).__init__(links)
+        self._owner = owner
+
+    def _notify_size_change(self, change):
+        if change and self._owner is not None:
+            self._owner._notify_link_count_change(change)
+
+    # the owner and its listeners are not carried over to copies
+    def __reduce_ex__(self, protocol):
+        return self.__class__, (list(self),)
+
+    append = _tracks_size(list.append)
+    extend = _tracks_size(list.extend)
+    insert = _tracks_size(list.insert)
+    remove = _tracks_size(list.remove)
+    pop = _tracks_size(list.pop)
+    clear = _tracks_size(list.clear)
+    __iadd__ = _tracks_size(list.__iadd__)
+    __imul__ = _tracks_size(list.__imul__)
+    __setitem__ = _tracks_size(list.__setitem__)
+    __delitem__ = _tracks_size(list.__delitem__)
+
+
+# shared by all entities that have no links or linking details
+_EMPTY_MAPPING = MappingProxyType({})
+
+
 class Entity(object):
+    """
+    Entities are kept in memory for every row of a spreadsheet, so they are slotted and only
+    allocate their link containers once something is put in them. Until then, links_by_entity
+    and linking_details read as an empty read-only mapping; assign a dict to populate them.
+    """
+
+    __slots__ = ('type', 'id', 'content', 'ingest_json', 'is_reference', 'concrete_type',
+                 '_links_by_entity', '_direct_links', '_linking_details', '_link_listeners')
 
     def __init__(self, entity_type, entity_id, content, ingest_json=None, links_by_entity=None,
                  direct_links=None, is_reference=False, linking_details=None, concrete_type=None):
         self.type = entity_type
         self.id = entity_id
         self.content = content
+        self._link_listeners = ()
         self._prepare_links_by_entity(links_by_entity)
         self._prepare_direct_links(direct_links)
         self._prepare_linking_details(linking_details)
@@ -253,19 +543,66 @@ class Entity(object):
         self.concrete_type = concrete_type
 
     def _prepare_links_by_entity(self, links_by_entity):
-        self.links_by_entity = {}
-        if links_by_entity is not None:
-            self.links_by_entity.update(links_by_entity)
+        self._links_by_entity = links_by_entity if links_by_entity else None
+
+    @property
+    def links_by_entity(self):
+        return self._links_by_entity if self._links_by_entity is not None else _EMPTY_MAPPING
+
+    @links_by_entity.setter
+    def links_by_entity(self, links_by_entity):
+        self._prepare_links_by_entity(links_by_entity)
 
     def _prepare_direct_links(self, direct_links):
-        self.direct_links = []
-        if direct_links is not None:
-            self.direct_links.extend(direct_links)
+        self._direct_links = DirectLinks(direct_links, owner=self) if direct_links else None
+
+    @property
+    def direct_links(self):
+        if self._direct_links is None:
+            self._direct_links = DirectLinks(owner=self)
+        return self._direct_links
+
+    @direct_links.setter
+    def direct_links(self, direct_links):
+        # replace the contents in place so that listeners keep track of the change
+        self.direct_links[:] = direct_links
+
+    def count_direct_links(self):
+        return len(self._direct_links) if self._direct_links is not None else 0
+
+    def add_link_listener(self, listener):
+        self._link_listeners = self._link_listeners + (listener,)
+
+    def remove_link_listener(self, listener):
+        self._link_listeners = tuple(registered for registered in self._link_listeners
+                                     if registered != listener)
+
+    def _notify_link_count_change(self, change):
+        for listener in self._link_listeners:
+            listener(change)
 
     def _prepare_linking_details(self, linking_details):
-        self.linking_details = {}
-        if linking_details is not None:
-            self.linking_details.update(linking_details)
+        self._linking_details = linking_details if linking_details else None
+
+    @property
+    def linking_details(self):
+        return self._linking_details if self._linking_details is not None else _EMPTY_MAPPING
+
+    @linking_details.setter
+    def linking_details(self, linking_details):
+        self._prepare_linking_details(linking_details)
+
+    # listeners belong to the maps holding this entity and are not carried over to copies
+    def __getstate__(self):
+        state = {slot: getattr(self, slot) for slot in self.__slots__}
+        state['_direct_links'] = list(self._direct_links) if self._direct_links else None
+        state['_link_listeners'] = ()
+        return state
+
+    def __setstate__(self, state):
+        for slot, value in state.items():
+            setattr(self, slot, value)
+        self._prepare_direct_links(self._direct_links)
 
 
 class Submission(object):
@@ -304,27 +641,43 @@ class Submission(object):
 
         return entity
 
+    def restore_entity(self, entity: Entity, ingest_json):
+        # for entities that were already created in ingest by a previous run
+        entity.ingest_json = ingest_json
+        self.metadata_dict[entity.type + '.' + entity.id] = entity
+        return entity
+
     def get_entity(self, entity_type, id):
         key = entity_type + '.' + id
         return self.metadata_dict[key]
 
-    def link_entity(self, from_entity, to_entity, relationship):
-        if from_entity.is_reference and not from_entity.ingest_json:
-            from_entity.ingest_json = self.ingest_api.getEntityByUuid(self.ENTITY_LINK[from_entity.type], from_entity.id)
+    def resolve_reference(self, entity):
+        if entity.is_reference and not entity.ingest_json:
+            entity.ingest_json = self.ingest_api.getEntityByUuid(self.ENTITY_LINK[entity.type], entity.id)
+        return entity
 
-        if to_entity.is_reference and not to_entity.ingest_json:
-            to_entity.ingest_json = self.ingest_api.getEntityByUuid(self.ENTITY_LINK[to_entity.type], to_entity.id)
+    def link_entity(self, from_entity, to_entity, relationship):
+        self.resolve_reference(from_entity)
+        self.resolve_reference(to_entity)
 
         from_entity_ingest = from_entity.ingest_json
         to_entity_ingest = to_entity.ingest_json
         self.ingest_api.linkEntity(from_entity_ingest, to_entity_ingest, relationship)
 
+    def link_entities(self, from_entity, to_entities, relationship):
+        self.resolve_reference(from_entity)
+        for to_entity in to_entities:
+            self.resolve_reference(to_entity)
+
+        to_entities_ingest = [to_entity.ingest_json for to_entity in to_entities]
+        self.ingest_api.link_entities(from_entity.ingest_json, to_entities_ingest, relationship)
+
     def define_manifest(self, entity_map):
         total_count = entity_map.count_total()
 
         # TODO provide a better way to serialize
         manifest_json = json.dumps({
-            'totalCount': entity_map.count_total(),
+            'totalCount': total_count,
             'expectedBiomaterials': entity_map.count_entities_of_type('biomaterial'),
             'expectedProcesses': entity_map.count_entities_of_type('process'),
             'expectedFiles': entity_map.count_entities_of_type('file'),
@@ -341,6 +694,10 @@ class EntityMap(object):
 
     def __init__(self, *entities):
         self.entities_dict_by_type = {}
+        self._count_by_type = {}
+        self._new_count_by_type = {}
+        self._total_count = 0
+        self._link_count = 0
         if entities is not None:
             for entity in entities:
                 self.add_entity(entity)
@@ -390,64 +747,105 @@ class EntityMap(object):
         return list(self.entities_dict_by_type.keys())
 
     def get_entities_of_type(self, type):
-        entities = []
-
-        entities_dict = self.entities_dict_by_type.get(type, {})
-
-        for entity_id, entity in entities_dict.items():
-            entities.append(entity)
-
-        return entities
+        return EntitiesView(self, entity_type=type)
 
     def get_new_entities_of_type(self, type):
-        entities = []
-        entities_dict = self.entities_dict_by_type.get(type, {})
-        for entity_id, entity in entities_dict.items():
-            if not entity.is_reference:
-                entities.append(entity)
-
-        return entities
+        return EntitiesView(self, entity_type=type, new_only=True)
 
     def get_entity(self, type, id):
-        if self.entities_dict_by_type.get(type) and self.entities_dict_by_type[type].get(id):
-            return self.entities_dict_by_type[type][id]
+        entities_of_type = self.entities_dict_by_type.get(type)
+        if entities_of_type:
+            return entities_of_type.get(id)
 
     def add_entity(self, entity):
         entities_of_type = self.entities_dict_by_type.get(entity.type)
-        if not entities_of_type:
-            self.entities_dict_by_type[entity.type] = {}
-            entities_of_type = self.entities_dict_by_type.get(entity.type)
+        if entities_of_type is None:
+            entities_of_type = {}
+            self.entities_dict_by_type[entity.type] = entities_of_type
+
+        existing_entity = entities_of_type.get(entity.id)
+        if existing_entity is not None:
+            self._unindex(existing_entity)
+
         entities_of_type[entity.id] = entity
+        self._index(entity)
+
+    def _index(self, entity):
+        self._total_count = self._total_count + 1
+        self._count_by_type[entity.type] = self._count_by_type.get(entity.type, 0) + 1
+        if not entity.is_reference:
+            self._new_count_by_type[entity.type] = self._new_count_by_type.get(entity.type, 0) + 1
+        self._link_count = self._link_count + entity.count_direct_links()
+        entity.add_link_listener(self._count_link_change)
+
+    def _unindex(self, entity):
+        self._total_count = self._total_count - 1
+        self._count_by_type[entity.type] = self._count_by_type[entity.type] - 1
+        if not entity.is_reference:
+            self._new_count_by_type[entity.type] = self._new_count_by_type[entity.type] - 1
+        self._link_count = self._link_count - entity.count_direct_links()
+        entity.remove_link_listener(self._count_link_change)
+
+    def _count_link_change(self, change):
+        self._link_count = self._link_count + change
 
     def get_entities(self):
-        all_entities = []
-        for entity_type, entities_dict in self.entities_dict_by_type.items():
-            all_entities.extend(entities_dict.values())
-        return all_entities
+        return EntitiesView(self)
 
     def get_new_entities(self):
-        all_entities = []
-        for entity_type, entities_dict in self.entities_dict_by_type.items():
-            for entity_id, entity in entities_dict.items():
-                if not entity.is_reference:
-                    all_entities.append(entity)
-        return all_entities
+        return EntitiesView(self, new_only=True)
 
     def get_project(self):
-        project_id = list(self.entities_dict_by_type.get('project').keys())[0]
-        return self.get_entity('project', project_id)
+        projects = self.entities_dict_by_type.get('project')
+        return next(iter(projects.values()))
 
     def count_total(self):
-        return len(self.get_entities())
+        return self._total_count
 
     def count_entities_of_type(self, type):
-        return len(self.get_new_entities_of_type(type))
+        return self._new_count_by_type.get(type, 0)
+
+    def count_all_entities_of_type(self, type):
+        return self._count_by_type.get(type, 0)
+
+    def count_new_entities(self):
+        return sum(self._new_count_by_type.values())
 
     def count_links(self):
-        count = 0
-        for entity in self.get_entities():
-            count = count + len(entity.direct_links)
-        return count
+        return self._link_count
+
+
+class EntitiesView(object):
+    """
+    A read-only view over the entities of an EntityMap, optionally restricted to a single type
+    or to new (non-reference) entities. The view reflects later changes to the map, can be
+    iterated any number of times, and knows its size without walking the entities.
+    """
+
+    def __init__(self, entity_map: EntityMap, entity_type=None, new_only=False):
+        self._entity_map = entity_map
+        self._entity_type = entity_type
+        self._new_only = new_only
+
+    def __iter__(self):
+        entities_dict_by_type = self._entity_map.entities_dict_by_type
+        if self._entity_type is None:
+            entities_dicts = entities_dict_by_type.values()
+        else:
+            entities_dicts = [entities_dict_by_type.get(self._entity_type, {})]
+
+        for entities_dict in entities_dicts:
+            for entity in entities_dict.values():
+                if not (self._new_only and entity.is_reference):
+                    yield entity
+
+    def __len__(self):
+        entity_map = self._entity_map
+        if self._entity_type is None:
+            return entity_map.count_new_entities() if self._new_only else entity_map.count_total()
+        if self._new_only:
+            return entity_map.count_entities_of_type(self._entity_type)
+        return entity_map.count_all_entities_of_type(self._entity_type)
 
 
 class Error(Exception):
@@ -492,5 +890,22 @@ class MultipleProcessesFound(Error):
         self.from_entity = from_entity
 
 
+class EntitiesNotCreated(Error):
+    def __init__(self, failures):
+        details = '; '.join(f'{entity.type} with id {entity.id}: {error}' for entity, error in failures)
+        message = f'{len(failures)} entities could not be created in ingest. {details}'
+        super(EntitiesNotCreated, self).__init__('EntitiesNotCreated', message)
+        self.failures = failures
+
+
+class LinksNotCreated(Error):
+    def __init__(self, failures):
+        details = '; '.join(f'{from_entity.type} with id {from_entity.id} to {to_entity.type} '
+                            f'with id {to_entity.id}: {error}' for from_entity, to_entity, error in failures)
+        message = f'{len(failures)} links could not be created in ingest. {details}'
+        super(LinksNotCreated, self).__init__('LinksNotCreated', message)
+        self.failures = failures
+
+
 class SubmissionError(Error):
     pass
@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+"""
+A local, persistent cache of JSON schemas and schema listings, so that schemas are only
+downloaded once across imports.
+"""
+__license__ = "Apache 2.0"
+
+import hashlib
+import json
+import logging
+import os
+import re
+import tempfile
+import time
+
+env_cache_dir = os.environ.get('SCHEMA_CACHE_DIR')
+DEFAULT_CACHE_DIR = env_cache_dir if env_cache_dir else None
+
+env_latest_ttl = os.environ.get('SCHEMA_CACHE_LATEST_TTL')
+DEFAULT_LATEST_TTL = int(env_latest_ttl) if env_latest_ttl else 3600
+
+DEFAULT_OFFLINE = os.environ.get('SCHEMA_CACHE_OFFLINE', '').lower() in ('1', 'true', 'yes')
+
+VERSIONED_URL_PATTERN = re.compile(r'/\d+\.\d+\.\d+/')
+
+
+def is_versioned(url):
+    """Versioned schema URLs, e.g. .../type/project/5.1.0/project, never change their content."""
+    return bool(VERSIONED_URL_PATTERN.search(url))
+
+
+def default_cache():
+    """Returns the cache configured through the SCHEMA_CACHE_* environment variables, if any."""
+    if DEFAULT_CACHE_DIR:
+        return SchemaCache(DEFAULT_CACHE_DIR, latest_ttl=DEFAULT_LATEST_TTL, offline=DEFAULT_OFFLINE)
+    return None
+
+
+class SchemaCache:
+    """
+    Keeps JSON documents on disk, one file per key. Documents under versioned schema URLs are
+    kept for good; anything else, like the latest schemas listed by ingest, expires after
+    latest_ttl seconds. In offline mode, everything is served from the cache regardless of age,
+    and keys that were never cached raise SchemaNotCached.
+    """
+
+    def __init__(self, cache_dir, latest_ttl=DEFAULT_LATEST_TTL, offline=False):
+        self.cache_dir = cache_dir
+        self.latest_ttl = latest_ttl
+        self.offline = offline
+        self.logger = logging.getLogger(__name__)
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def get(self, key, fetch, permanent=None):
+        """
+        Returns the cached document for the key, calling fetch() to get and store it when it is
+        not cached or has expired. Empty results of fetch are returned but not stored. Documents
+        are kept for good if permanent, which defaults to whether the key is a versioned URL.
+        """
+        cache_path = self._cache_path(key)
+        if permanent is None:
+            permanent = is_versioned(key)
+        if self._is_fresh(cache_path, permanent):
+            document = self._read(cache_path)
+            if document is not None:
+                return document
+        if self.offline:
+            raise SchemaNotCached(key)
+
+        document = fetch()
+        if document:
+            self._write(cache_path, key, document)
+        return document
+
+    def _cache_path(self, key):
+        file_name = hashlib.sha256(key.encode('utf-8')).hexdigest()
+        return os.path.join(self.cache_dir, f'{file_name}.json')
+
+    def _is_fresh(self, cache_path, permanent):
+        if not os.path.exists(cache_path):
+            return False
+        if self.offline or permanent:
+            return True
+        return time.time() - os.path.getmtime(cache_path) < self.latest_ttl
+
+    def _read(self, cache_path):
+        try:
+            with open(cache_path) as cache_file:
+                return json.load(cache_file)['document']
+        except (OSError, ValueError, KeyError):
+            self.logger.warning(f'Ignoring unreadable schema cache entry {cache_path}.')
+            return None
+
+    def _write(self, cache_path, key, document):
+        # written to a temporary file first so that readers never see a partial entry
+        file_descriptor, temp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+        try:
+            with os.fdopen(file_descriptor, 'w') as temp_file:
+                json.dump({'key': key, 'document': document}, temp_file)
+            os.replace(temp_path, cache_path)
+        except OSError:
+            self.logger.warning(f'Could not write schema cache entry for {key}.', exc_info=True)
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+
+class SchemaNotCached(Exception):
+
+    def __init__(self, key):
+        super(SchemaNotCached, self).__init__(f'[{key}] is not in the schema cache, and the cache is offline.')
+        self.key = key
@@ -8,17 +8,30 @@ __author__ = "jupp"
 __license__ = "Apache 2.0"
 __date__ = "01/05/2018"
 
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from datetime import datetime
+from urllib.parse import urldefrag, urlparse
 from yaml import dump as yaml_dump
 from yaml import load as yaml_load
 from ingest.utils import doctict
+from ingest.template import schema_cache
 from ingest.template.tabs import TabConfig
 from ingest.api.ingestapi import IngestApi
+import copy
 import json
 import jsonref
+import logging
+import os
 import re
+import threading
 import urllib.request
 
+env_fetch_workers = os.environ.get('SCHEMA_FETCH_WORKERS')
+DEFAULT_FETCH_WORKERS = int(env_fetch_workers) if env_fetch_workers else 8
+
+SNAPSHOT_VERSION = 1
+
+_NOT_FOUND = object()
 
 
 class SchemaTemplate:
@@ -26,8 +39,24 @@ class SchemaTemplate:
     A schema template is a simplified view over
     JSON schema for the HCA metadata
     """
-    def __init__(self, ingest_api_url=None, list_of_schema_urls=None, tab_config=None):
+    def __init__(self, ingest_api_url=None, list_of_schema_urls=None, tab_config=None, ingest_api=None,
+                 cache=None, fetch_workers=DEFAULT_FETCH_WORKERS):
+
+        self._init_state(ingest_api_url, ingest_api, cache, fetch_workers)
+
+        if not list_of_schema_urls:
+            list_of_schema_urls = self.get_latest_submittable_schemas(self.ingest_api_url)
+            # print ("Got schemas from ingest api\n " + "\n".join(list_of_schema_urls))
+
+        self.schema_urls = list_of_schema_urls
+        if self._cache:
+            self._load_compiled(self.schema_urls)
+        else:
+            self._load(self.schema_urls)
+
+        self._init_tab_config(tab_config)
 
+    def _init_state(self, ingest_api_url, ingest_api, cache, fetch_workers):
         # todo remove this hard coding to a default ingest API url
         self.ingest_api_url = ingest_api_url if ingest_api_url else "http://api.ingest.dev.data.humancellatlas.org"
         self._template = {
@@ -38,24 +67,87 @@ class SchemaTemplate:
             "tabs": []
         }
         self._parser = SchemaParser(self)
-
-        if not list_of_schema_urls:
-            list_of_schema_urls = self.get_latest_submittable_schemas(self.ingest_api_url)
-            # print ("Got schemas from ingest api\n " + "\n".join(list_of_schema_urls))
-
-        self.schema_urls = list_of_schema_urls
-        self._load(self.schema_urls)
-
+        # built once the schemas are loaded, and dropped whenever the properties change
+        self._key_index = None
+        self._key_index_lock = threading.Lock()
+        self._ingest_api = ingest_api
+        # schemas are cached on disk if a cache is given or configured through SCHEMA_CACHE_DIR;
+        # cache=False disables the configured one
+        self._cache = cache if cache is not None else schema_cache.default_cache()
+        self._fetch_workers = fetch_workers
+        self.logger = logging.getLogger(__name__)
+
+    def _init_tab_config(self, tab_config):
         self._tab_config  = TabConfig(init=self._template)
         if tab_config:
             # override the default tab config if one is supplied
             self._tab_config = tab_config
 
+    @staticmethod
+    def from_snapshot(snapshot, ingest_api_url=None, tab_config=None):
+        """
+        Rebuilds a schema template from a snapshot, without fetching or parsing any schema.
+        """
+        template = SchemaTemplate.__new__(SchemaTemplate)
+        template._init_state(ingest_api_url, None, False, DEFAULT_FETCH_WORKERS)
+        template._restore(snapshot)
+        template._init_tab_config(tab_config)
+        return template
+
+    @staticmethod
+    def load_snapshot(path, ingest_api_url=None, tab_config=None):
+        with open(path) as snapshot_file:
+            snapshot = json.load(snapshot_file)
+        return SchemaTemplate.from_snapshot(snapshot, ingest_api_url=ingest_api_url, tab_config=tab_config)
+
+    def snapshot(self):
+        """
+        Returns the compiled template, i.e. the parsed properties, labels and tabs, as a JSON
+        serialisable dict. The snapshot shares its contents with this template.
+        """
+        return {
+            "snapshot_version": SNAPSHOT_VERSION,
+            "schema_urls": list(self.schema_urls),
+            "template": self._template
+        }
+
+    def dump_snapshot(self, path):
+        with open(path, 'w') as snapshot_file:
+            json.dump(self.snapshot(), snapshot_file)
+
+    def _restore(self, snapshot):
+        if snapshot.get("snapshot_version") != SNAPSHOT_VERSION:
+            raise SnapshotVersionException(
+                f'Unsupported schema template snapshot version [{snapshot.get("snapshot_version")}]')
+        template = snapshot["template"]
+        template["meta_data_properties"] = _to_dot_dicts(template["meta_data_properties"])
+        self.schema_urls = snapshot["schema_urls"]
+        self._template = template
+        self._parser._key_lookup = template["labels"]
+        self._key_index = self._build_key_index()
+
+    def _load_compiled(self, list_of_schema_urls):
+        # a template compiled from versioned schemas only never changes, so it is kept for good
+        snapshot_key = 'schema-template:' + ' '.join(list_of_schema_urls)
+        permanent = all(schema_cache.is_versioned(url) for url in list_of_schema_urls)
+        snapshot = self._cache.get(snapshot_key, lambda: self._load(list_of_schema_urls).snapshot(),
+                                   permanent=permanent)
+        try:
+            self._restore(snapshot)
+        except SnapshotVersionException:
+            self._load(list_of_schema_urls)
+
     def get_schema_urls (self):
         return self.schema_urls
 
     def get_latest_submittable_schemas(self, ingest_api_url):
-        ingest_api = IngestApi(url=ingest_api_url)
+        if self._cache:
+            cache_key = f'{ingest_api_url}/schemas?latest&high_level_entity=type'
+            return self._cache.get(cache_key, lambda: self._fetch_latest_submittable_schemas(ingest_api_url))
+        return self._fetch_latest_submittable_schemas(ingest_api_url)
+
+    def _fetch_latest_submittable_schemas(self, ingest_api_url):
+        ingest_api = self._ingest_api if self._ingest_api else IngestApi(url=ingest_api_url)
         urls = []
         for schema in ingest_api.get_schemas(high_level_entity="type", latest_only=True):
             url = schema["_links"]["json-schema"]["href"]
@@ -68,25 +160,104 @@ class SchemaTemplate:
         given a list of URLs to JSON schema files
         return a SchemaTemplate object
         """
+        documents = self._fetch_all(list_of_schema_urls)
+        loader = self._create_ref_loader(documents)
         for uri in list_of_schema_urls:
-                with urllib.request.urlopen(uri) as url:
-                    data = {}
-                    try:
-                        data = json.loads(url.read().decode())
-                    except:
-                        print("Failed to read schema from " + uri)
-                    self._parser._load_schema(data)
+            data = documents.get(uri)
+            self._parser._load_schema(data if data is not None else {}, loader=loader)
+        self._key_index = self._build_key_index()
         return self
 
+    def _fetch_all(self, list_of_schema_urls):
+        """
+        Fetches the given schemas and, transitively, every schema they refer to through $ref,
+        side by side. Each distinct URL is fetched once for the whole set. Failures to fetch a
+        referenced schema are left for the parser to run into.
+        """
+        documents = {}
+        submitted = set()
+        with ThreadPoolExecutor(max_workers=self._fetch_workers) as executor:
+            pending = {}
+            for uri in list_of_schema_urls:
+                if uri not in submitted:
+                    submitted.add(uri)
+                    pending[executor.submit(self._read_schema, uri)] = (uri, True)
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    uri, is_requested = pending.pop(future)
+                    try:
+                        document = future.result()
+                    except Exception:
+                        if is_requested:
+                            raise
+                        self.logger.debug(f'Could not prefetch referenced schema {uri}.', exc_info=True)
+                        continue
+                    documents[uri] = document
+                    for ref_uri in _collect_ref_uris(document):
+                        if ref_uri not in submitted:
+                            submitted.add(ref_uri)
+                            pending[executor.submit(self._read_schema, ref_uri)] = (ref_uri, False)
+        return documents
+
+    def _create_ref_loader(self, documents):
+        # the parser changes the documents it loads, so each reference gets its own copy
+        def load_ref(uri, **kwargs):
+            document = documents.get(uri)
+            if document is None:
+                return jsonref.jsonloader(uri, **kwargs)
+            return copy.deepcopy(document)
+        return load_ref
+
+    def _read_schema(self, uri):
+        if self._cache:
+            data = self._cache.get(uri, lambda: self._fetch_schema(uri))
+        else:
+            data = self._fetch_schema(uri)
+        return data if data is not None else {}
+
+    @staticmethod
+    def _fetch_schema(uri):
+        with urllib.request.urlopen(uri) as url:
+            try:
+                return json.loads(url.read().decode())
+            except:
+                print("Failed to read schema from " + uri)
+                return None
+
     def get_tabs_config(self, ):
         return self._tab_config
 
     def lookup(self, key):
-        try:
-            return self.get(self._template["meta_data_properties"], key)
-        except:
+        value = self.find(key, _NOT_FOUND)
+        if value is _NOT_FOUND:
             raise UnknownKeyException(
                 "Can't map the key to a known JSON schema property: " + str(key))
+        return value
+
+    def find(self, key, default=None):
+        """
+        Like lookup, but returns the default for unknown keys instead of raising an exception.
+        """
+        key_index = self._key_index
+        if key_index is None:
+            # only after a put; the index is otherwise built when the schemas are loaded
+            with self._key_index_lock:
+                if self._key_index is None:
+                    self._key_index = self._build_key_index()
+                key_index = self._key_index
+        return key_index.get(key, default)
+
+    def _build_key_index(self):
+        # every dotted path into the properties, attributes included, mapped to its value
+        key_index = {}
+        nodes = list(self._template["meta_data_properties"].items())
+        while nodes:
+            key, value = nodes.pop()
+            key_index[key] = value
+            if isinstance(value, dict):
+                nodes.extend((f'{key}.{child_key}', child) for child_key, child in value.items())
+        return key_index
 
     def get_template(self):
         return self._template["meta_data_properties"]
@@ -109,6 +280,7 @@ class SchemaTemplate:
         :return: void
         '''
         self._template["meta_data_properties"][property] = value
+        self._key_index = None
 
     def set_label_mappings(self, dict):
         '''
@@ -129,14 +301,22 @@ class SchemaTemplate:
         return json.dumps(self._template, indent=4)
 
     def get_key_for_label(self, column, tab):
-        try:
-            tab_key = self._tab_config.get_key_for_label(tab)
-            for column_key in self._parser.key_lookup(column.lower()):
-                if tab_key == self._get_level_one(column_key):
-                    return column_key
-        except:
+        key = self.find_key_for_label(column, tab)
+        if key is None:
             raise UnknownKeyException(
                 "Can't map the key to a known JSON schema property: " + str(column))
+        return key
+
+    def find_key_for_label(self, column, tab, default=None):
+        """
+        Like get_key_for_label, but returns the default for unknown labels instead of raising an
+        exception.
+        """
+        tab_key = self._tab_config.find_key_for_label(tab)
+        for column_key in self._parser.find_keys(column.lower()):
+            if tab_key == self._get_level_one(column_key):
+                return column_key
+        return default
 
     def get_tab_key(self, label):
         try:
@@ -173,15 +353,18 @@ class SchemaParser:
 
         self._key_lookup = {}
 
-    def _load_schema(self, json_schema):
+    def _load_schema(self, json_schema, loader=None):
         """load a JSON schema representation"""
         # use jsonrefs to resolve all $refs in json
-        data = jsonref.loads(json.dumps(json_schema))
+        data = jsonref.loads(json.dumps(json_schema), loader=loader)
         return self.__initialise_template(data)
 
     def key_lookup(self, key):
         return self._key_lookup[key]
 
+    def find_keys(self, label):
+        return self._key_lookup.get(label, [])
+
     def __initialise_template(self, data):
 
         self._collect_required_properties(data)
@@ -363,6 +546,32 @@ class SchemaParser:
         return {}
 
 
+def _to_dot_dicts(value):
+    if isinstance(value, dict):
+        return doctict.DotDict((key, _to_dot_dicts(item)) for key, item in value.items())
+    if isinstance(value, list):
+        return [_to_dot_dicts(item) for item in value]
+    return value
+
+
+def _collect_ref_uris(document):
+    """Returns the absolute http(s) URIs of the documents referred to through $ref."""
+    ref_uris = set()
+    nodes = [document]
+    while nodes:
+        node = nodes.pop()
+        if isinstance(node, dict):
+            ref = node.get('$ref')
+            if isinstance(ref, str):
+                ref_uri = urldefrag(ref)[0]
+                if urlparse(ref_uri).scheme in ('http', 'https'):
+                    ref_uris.add(ref_uri)
+            nodes.extend(node.values())
+        elif isinstance(node, list):
+            nodes.extend(node)
+    return ref_uris
+
+
 class Schema:
     def __init__(self):
         self.dict = {}
@@ -387,5 +596,8 @@ class RootSchemaException(Error):
 class UnknownKeyException(Error):
     """Can't map the key to a known property"""
 
+class SnapshotVersionException(Error):
+    """The snapshot was written by an incompatible version of the schema template"""
+
 if __name__ == '__main__':
     pass
\ No newline at end of file
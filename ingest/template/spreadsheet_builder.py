@@ -17,6 +17,8 @@ import xlsxwriter
 DEFAULT_INGEST_URL = "http://api.ingest.data.humancellatlas.org"
 DEFAULT_SCHEMAS_ENDPOINT = "/schemas/search/latestSchemas"
 
+_NOT_FOUND = object()
+
 
 
 class SpreadsheetBuilder:
@@ -31,27 +33,31 @@ class SpreadsheetBuilder:
         self.include_schemas_tab = False
         self.hidden_row = hide_row
 
-    def generate_workbook(self, tabs_template=None, schema_urls=list(), include_schemas_tab=False):
+    def generate_workbook(self, tabs_template=None, schema_urls=list(), include_schemas_tab=False,
+                          template_snapshot=None):
 
         self.include_schemas_tab = include_schemas_tab
+        tabs = None
         if tabs_template:
 
             tabs_parser = TabConfig()
             tabs = tabs_parser.load(tabs_template)
-            template = schema_template.SchemaTemplate(list_of_schema_urls=schema_urls, tab_config=tabs)
+
+        # a snapshot of a compiled template spares fetching and parsing the schemas again
+        if template_snapshot:
+            template = schema_template.SchemaTemplate.load_snapshot(template_snapshot, tab_config=tabs)
         else:
-            template = schema_template.SchemaTemplate(list_of_schema_urls=schema_urls)
+            template = schema_template.SchemaTemplate(list_of_schema_urls=schema_urls, tab_config=tabs)
 
         self._build(template)
         return self
 
     def _get_value_for_column(self, template, col_name, property):
-        try:
-            uf = str(template.lookup(col_name + "."+property)) if template.lookup(col_name + "."+property) else ""
-            return uf
-        except:
+        value = template.find(col_name + "." + property, _NOT_FOUND)
+        if value is _NOT_FOUND:
             print("No property " + property + " for " + col_name)
             return ""
+        return str(value) if value else ""
 
     def get_user_friendly(self, template, col_name):
 
@@ -67,16 +73,16 @@ class SpreadsheetBuilder:
 
         else:
             key = col_name + ".user_friendly"
-        try:
-            uf = str(template.lookup(key)) if template.lookup(key) else col_name
-            if '.ontology_label' in col_name:
-                uf = uf + " ontology label"
-            if '.ontology' in col_name:
-                uf = uf + " ontology ID"
-
-            return uf
-        except:
+        value = template.find(key, _NOT_FOUND)
+        if value is _NOT_FOUND:
             return key
+        uf = str(value) if value else col_name
+        if '.ontology_label' in col_name:
+            uf = uf + " ontology label"
+        if '.ontology' in col_name:
+            uf = uf + " ontology ID"
+
+        return uf
 
     def save_workbook(self):
         self.workbook.close()
@@ -200,6 +206,8 @@ if __name__ == '__main__':
                       help="Optional ingest API URL - if not default (prod)")
     parser.add_argument("-r", "--hidden_row", action="store_true",
                       help="Binary flag - if set, the 4th row will be hidden")
+    parser.add_argument("-s", "--snapshot", dest="snapshot",
+                      help="Optional schema template snapshot to build the spreadsheet from")
     args = parser.parse_args()
 
     if not args.output:
@@ -218,7 +226,7 @@ if __name__ == '__main__':
     if args.hidden_row:
         hide_row = True
 
-    all_schemas = schema_template.SchemaTemplate(ingest_url).get_schema_urls()
+    all_schemas = [] if args.snapshot else schema_template.SchemaTemplate(ingest_url).get_schema_urls()
 
     # all_schemas = [
     #     "http://schema.dev.data.humancellatlas.org/type/project/9.0.5/project",
@@ -236,6 +244,7 @@ if __name__ == '__main__':
     # ]
 
     spreadsheet_builder = SpreadsheetBuilder(output_file, hide_row)
-    spreadsheet_builder.generate_workbook(tabs_template=args.yaml, schema_urls=all_schemas)
+    spreadsheet_builder.generate_workbook(tabs_template=args.yaml, schema_urls=all_schemas,
+                                          template_snapshot=args.snapshot)
     spreadsheet_builder.save_workbook()
 
@@ -42,3 +42,6 @@ class TabConfig:
     def get_key_for_label(self, label):
         return self._key_label[label.lower()]
 
+    def find_key_for_label(self, label, default=None):
+        return self._key_label.get(label.lower(), default)
+
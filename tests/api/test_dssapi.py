@@ -0,0 +1,39 @@
+import time
+from unittest import TestCase
+
+from mock import MagicMock, patch
+
+from ingest.api import dssapi
+from ingest.api.dssapi import DssApi, backoff_delay
+
+
+class DssApiTest(TestCase):
+
+    @patch('ingest.api.dssapi.random.uniform', side_effect=lambda low, high: high)
+    def test_backoff_delay(self, uniform):
+        # expect:
+        self.assertEqual(2, backoff_delay(1, base_delay=2, max_delay=60))
+        self.assertEqual(8, backoff_delay(3, base_delay=2, max_delay=60))
+        self.assertEqual(60, backoff_delay(10, base_delay=2, max_delay=60))
+
+    @patch('ingest.api.dssapi.time.sleep')
+    @patch('ingest.api.dssapi.backoff_delay', return_value=5)
+    @patch('hca.dss.DSSClient')
+    def test_put_file_retries_until_deadline(self, dss_client_constructor, delay, sleep):
+        # given:
+        dss_api = DssApi(url='http://mock-dss')
+        dss_api.hca_client.put_file = MagicMock(side_effect=[Exception('unavailable'), {'version': 'v1'},
+                                                             Exception('unavailable')])
+        data_file = {'url': 'gs://bucket/file', 'dss_uuid': 'uuid', 'name': 'file.json'}
+
+        # when:
+        created_file = dss_api.put_file('bundle_uuid', data_file)
+
+        # then:
+        self.assertEqual({'version': 'v1'}, created_file)
+        sleep.assert_called_once_with(5)
+
+        # expect:
+        with self.assertRaises(dssapi.Error):
+            dss_api.put_file('bundle_uuid', data_file, deadline=time.time() + 1)
+        self.assertEqual(1, sleep.call_count)
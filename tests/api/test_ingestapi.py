@@ -5,6 +5,7 @@ from mock import MagicMock
 
 import ingest
 from ingest.api.ingestapi import IngestApi
+from ingest.api.requests_utils import DEFAULT_POOL_SIZE
 
 import json
 
@@ -27,17 +28,42 @@ class IngestApiTest(TestCase):
             root_links["submissionEnvelopes"] = {"href": api_url + "/submissionEnvelopes"}
             mock_load_root.return_value = root_links
 
-            ingest_api = IngestApi(api_url)
+            mock_session = MagicMock(name='session')
+            ingest_api = IngestApi(api_url, session=mock_session)
             ingest_api.submission_links[submission_url] = {
                 'files': {
                     'href': submission_url + "/files"
                 }
             }
 
-            with patch('ingest.api.ingestapi.optimistic_session') as mock_session:
-                mock_session.return_value = MagicMock()
-                ingest_api.createFile(submission_url, filename, "{}")
-            mock_session.assert_called_once_with(f'{submission_url}/files/{filename}')
+            ingest_api.createFile(submission_url, filename, "{}")
+            mock_session.post.assert_called_once()
+            post_args, __ = mock_session.post.call_args
+            self.assertEqual(f'{submission_url}/files/{filename}', post_args[0])
+
+    def test_default_session_is_pooled(self):
+        # given:
+        ingest_api = IngestApi(mock_ingest_api_url, dict())
+
+        # when:
+        adapter = ingest_api.session.get_adapter(mock_ingest_api_url)
+
+        # then:
+        self.assertEqual(DEFAULT_POOL_SIZE, adapter._pool_maxsize)
+        self.assertIs(adapter, ingest_api.session.get_adapter('https://secure.mockingestapi.com'))
+
+    def test_session_shared_across_calls(self):
+        # given:
+        mock_session = MagicMock(name='session')
+        ingest_api = IngestApi(mock_ingest_api_url, dict(), session=mock_session)
+
+        # when:
+        ingest_api.getEntityByUuid('projects', 'mock-uuid')
+        ingest_api.patch(f'{mock_ingest_api_url}/projects/mock-id', {'content': {}})
+
+        # then:
+        mock_session.get.assert_called_once()
+        mock_session.patch.assert_called_once()
 
     def test_get_submission_by_uuid(self):
         api_url = mock_ingest_api_url
@@ -55,7 +81,7 @@ class IngestApiTest(TestCase):
 
             mock_get_url_for_link.side_effect = mock_get_url_for_link_patch
 
-            with patch('ingest.api.ingestapi.requests.get') as mock_requests_get:
+            with patch.object(ingestapi.session, 'get') as mock_requests_get:
                 def mock_get_side_effect(*args, **kwargs):
                     mock_response = {}
                     mock_response_payload = {}
@@ -81,4 +107,38 @@ class IngestApiTest(TestCase):
 
                 mock_requests_get.side_effect = mock_get_side_effect
 
-                assert 'uuid' in ingestapi.getSubmissionByUuid(mock_submission_uuid)
\ No newline at end of file
+                assert 'uuid' in ingestapi.getSubmissionByUuid(mock_submission_uuid)
+
+    def test_link_entities_in_chunks(self):
+        # given:
+        mock_session = MagicMock(name='session')
+        mock_session.post.return_value.raise_for_status = MagicMock()
+        ingest_api = IngestApi(mock_ingest_api_url, dict(), session=mock_session)
+
+        # and:
+        process_url = f'{mock_ingest_api_url}/processes/1'
+        process = {'_links': {'protocols': {'href': process_url + '/protocols'}}}
+        protocols = [{'_links': {'self': {'href': f'{mock_ingest_api_url}/protocols/{index}{{?projection}}'}}}
+                     for index in range(0, 5)]
+
+        # when:
+        ingest_api.link_entities(process, protocols, 'protocols', chunk_size=2)
+
+        # then:
+        self.assertEqual(3, mock_session.post.call_count)
+        uri_lists = [kwargs['data'] for __, kwargs in mock_session.post.call_args_list]
+        self.assertEqual([f'{mock_ingest_api_url}/protocols/0\n{mock_ingest_api_url}/protocols/1',
+                          f'{mock_ingest_api_url}/protocols/2\n{mock_ingest_api_url}/protocols/3',
+                          f'{mock_ingest_api_url}/protocols/4'], uri_lists)
+        for args, kwargs in mock_session.post.call_args_list:
+            self.assertEqual(process_url + '/protocols', args[0])
+            self.assertEqual('text/uri-list', kwargs['headers']['Content-type'])
+
+    def test_link_entities_without_relationship(self):
+        # given:
+        ingest_api = IngestApi(mock_ingest_api_url, dict(), session=MagicMock(name='session'))
+        process = {'_links': {}}
+
+        # expect:
+        with self.assertRaises(ValueError):
+            ingest_api.link_entities(process, [{'_links': {}}], 'protocols')
@@ -3,7 +3,9 @@ import os
 import copy
 import unittest
 import uuid
+from concurrent.futures import ThreadPoolExecutor
 
+import polling
 import requests
 
 from mock import MagicMock
@@ -43,6 +45,71 @@ class TestExporter(TestCase):
         # then:
         self.assertEqual('bundle1', input_bundle)
 
+    @patch('ingest.api.dssapi.DssApi')
+    def test_prefetch_process_graph(self, dss_api_constructor):
+        # given:
+        dss_api_constructor.return_value = MagicMock('dss_api')
+        ingest_api = MagicMock(name='ingest_api')
+        exporter = IngestExporter(ingest_api=ingest_api, fetch_workers=4)
+
+        # and:
+        assay = {'uuid': {'uuid': 'assay'}}
+        sample = {'uuid': {'uuid': 'sample'}}
+        sampling = {'uuid': {'uuid': 'sampling'}}
+        donor = {'uuid': {'uuid': 'donor'}}
+        relationships = {
+            ('assay', 'inputBiomaterials'): [sample],
+            ('sample', 'derivedByProcesses'): [sampling],
+            ('sampling', 'inputBiomaterials'): [donor],
+            ('sampling', 'derivedBiomaterials'): [sample]
+        }
+
+        def get_related_entities(relationship, entity, entity_type):
+            return iter(relationships.get((entity['uuid']['uuid'], relationship), []))
+
+        ingest_api.getRelatedEntities = MagicMock(side_effect=get_related_entities)
+
+        # when:
+        exporter.prefetch_process_graph(assay)
+
+        # then: every relationship of both processes and of both inputs is fetched once
+        self.assertEqual(12, ingest_api.getRelatedEntities.call_count)
+
+        # when:
+        process_info = ingestexportservice.ProcessInfo()
+        exporter.recurse_process(assay, process_info)
+
+        # then:
+        self.assertEqual(12, ingest_api.getRelatedEntities.call_count)
+        self.assertEqual(['assay', 'sampling'], list(process_info.derived_by_processes.keys()))
+        self.assertEqual(['sample', 'donor'], list(process_info.input_biomaterials.keys()))
+
+    @patch('ingest.api.dssapi.DssApi')
+    def test_use_submission_cache(self, dss_api_constructor):
+        # given:
+        dss_api_constructor.return_value = MagicMock('dss_api')
+        ingest_api = MagicMock(name='ingest_api')
+        ingest_api.getRelatedEntities = MagicMock(return_value=iter([]))
+        exporter = IngestExporter(ingest_api=ingest_api)
+        protocol = {'uuid': {'uuid': 'protocol'}}
+
+        # when:
+        exporter.use_submission_cache('submission_uuid')
+        exporter.get_related_entities('protocols', protocol, 'protocols')
+        exporter.use_submission_cache('submission_uuid')
+        exporter.get_related_entities('protocols', protocol, 'protocols')
+
+        # then:
+        self.assertEqual(1, ingest_api.getRelatedEntities.call_count)
+
+        # when:
+        exporter.use_submission_cache('other_uuid')
+        exporter.get_related_entities('protocols', protocol, 'protocols')
+
+        # then:
+        self.assertEqual(2, ingest_api.getRelatedEntities.call_count)
+        self.assertEqual('other_uuid', exporter.provenance_cache.submission_uuid)
+
     @unittest.skip
     @patch('ingest.api.dssapi.DssApi')
     def test_upload_metadata_files(self, dss_api_constructor):
@@ -158,6 +225,242 @@ class TestExporter(TestCase):
         with self.assertRaises(ingestexportservice.BundleFileUploadError) as e:
             metadata_files = exporter.upload_metadata_files('sub_uuid', metadata_files_info)
 
+    @patch('ingest.api.dssapi.DssApi')
+    def test_upload_metadata_files_collects_errors(self, dss_api_constructor):
+        # given:
+        dss_api_constructor.return_value = MagicMock('dss_api')
+        exporter = IngestExporter(ingest_api=MagicMock(name='ingest_api'), upload_workers=4)
+
+        # and:
+        def upload_file(submission_uuid, filename, content, content_type):
+            if filename.startswith('bad'):
+                raise Exception('upload failed')
+            return stagingapi.FileDescription('checksums', content_type, filename, filename, f'url/{filename}')
+
+        exporter.upload_file = MagicMock(side_effect=upload_file)
+
+        # and:
+        def metadata_doc(filename, is_from_input_bundle=False):
+            return {'upload_filename': filename, 'content': {}, 'content_type': 'type',
+                    'is_from_input_bundle': is_from_input_bundle}
+
+        project = metadata_doc('project.json')
+        input_biomaterial = metadata_doc('input.json', is_from_input_bundle=True)
+        metadata_files_info = {
+            'project': [project],
+            'biomaterial': [input_biomaterial, metadata_doc('bad_biomaterial.json')],
+            'process': [],
+            'protocol': [],
+            'file': [metadata_doc('bad_file.json')],
+            'links': []
+        }
+
+        # when:
+        with self.assertRaises(ingestexportservice.BundleFileUploadError) as context:
+            exporter.upload_metadata_files('sub_uuid', metadata_files_info)
+
+        # then:
+        self.assertEqual(3, exporter.upload_file.call_count)
+        self.assertEqual('url/project.json', project['upload_file_url'])
+        self.assertNotIn('upload_file_url', input_biomaterial)
+        self.assertIn('bad_biomaterial.json: upload failed; bad_file.json: upload failed', str(context.exception))
+
+    @patch('ingest.api.dssapi.DssApi')
+    def test_put_files_in_dss(self, dss_api_constructor):
+        # given:
+        dss_api = MagicMock(name='dss_api')
+        dss_api_constructor.return_value = dss_api
+        exporter = IngestExporter(ingest_api=MagicMock(name='ingest_api'), dss_workers=4, dss_deadline=60)
+
+        # and:
+        def put_file(bundle_uuid, bundle_file, deadline=None):
+            if bundle_file['dss_uuid'] == 'broken':
+                raise Exception('could not create file')
+            return {'version': f'{bundle_file["dss_uuid"]}-version'}
+
+        dss_api.put_file = MagicMock(side_effect=put_file)
+        dss_api.head_file = MagicMock(return_value=MagicMock(headers={'X-DSS-VERSION': 'input-version'}))
+
+        # and:
+        def bundle_file(dss_uuid):
+            return {'dss_uuid': dss_uuid, 'indexed': False, 'submittedName': f'{dss_uuid}.json',
+                    'content-type': 'data'}
+
+        process_info = ingestexportservice.ProcessInfo()
+        process_info.input_files = {'input': {'dataFileUuid': 'input_data'}}
+
+        # when:
+        created_files = exporter.put_files_in_dss('bundle_uuid', [bundle_file('first'), bundle_file('input_data'),
+                                                                   bundle_file('last')], process_info)
+
+        # then:
+        self.assertEqual(['first-version', 'input-version', 'last-version'],
+                         [created_file['version'] for created_file in created_files])
+        self.assertEqual(['first', 'input_data', 'last'], [created_file['uuid'] for created_file in created_files])
+        self.assertEqual(2, dss_api.put_file.call_count)
+
+        # expect:
+        with self.assertRaises(ingestexportservice.FileDSSError) as context:
+            exporter.put_files_in_dss('bundle_uuid', [bundle_file('broken'), bundle_file('last')], process_info)
+        self.assertIn('broken: could not create file', str(context.exception))
+
+    @patch('ingest.exporter.ingestexportservice.time.sleep')
+    @patch('ingest.api.dssapi.DssApi')
+    def test_verify_files(self, dss_api_constructor, sleep):
+        # given:
+        dss_api_constructor.return_value = MagicMock('dss_api')
+        exporter = IngestExporter(ingest_api=MagicMock(name='ingest_api'))
+        exporter.verify_initial_interval = 1
+        exporter.verify_max_interval = 3
+
+        # and:
+        copy_checks = {'quick': [True], 'slow': [False, False, False, True]}
+        exporter._is_file_copied = MagicMock(side_effect=lambda created_file: copy_checks[created_file['uuid']].pop(0))
+        created_files = [{'uuid': uuid, 'version': 'v1', 'name': f'{uuid}.json'} for uuid in ['quick', 'slow']]
+
+        # when:
+        exporter.verify_files(created_files)
+
+        # then:
+        self.assertEqual(5, exporter._is_file_copied.call_count)
+        self.assertEqual([((1,),), ((2,),), ((3,),)], sleep.call_args_list)
+
+    @patch('ingest.exporter.ingestexportservice.time.sleep')
+    @patch('ingest.api.dssapi.DssApi')
+    def test_verify_files_timeout(self, dss_api_constructor, sleep):
+        # given:
+        dss_api_constructor.return_value = MagicMock('dss_api')
+        exporter = IngestExporter(ingest_api=MagicMock(name='ingest_api'))
+        exporter.verify_timeout = 0
+        exporter._is_file_copied = MagicMock(return_value=False)
+
+        # expect:
+        with self.assertRaises(polling.TimeoutException):
+            exporter.verify_files([{'uuid': 'never', 'version': 'v1', 'name': 'never.json'}])
+        sleep.assert_not_called()
+
+    @patch('ingest.exporter.ingestexportservice.time.time')
+    @patch('ingest.exporter.ingestexportservice.time.sleep')
+    @patch('ingest.api.dssapi.DssApi')
+    def test_verify_files_checks_at_deadline(self, dss_api_constructor, sleep, now):
+        # given:
+        dss_api_constructor.return_value = MagicMock('dss_api')
+        exporter = IngestExporter(ingest_api=MagicMock(name='ingest_api'))
+        exporter.verify_timeout = 10
+        exporter.verify_initial_interval = 8
+        exporter.verify_max_interval = 8
+
+        # and:
+        clock = [100.0]
+        now.side_effect = lambda: clock[0]
+        sleep.side_effect = lambda interval: clock.__setitem__(0, clock[0] + interval)
+        copy_checks = [False, False, True]
+        exporter._is_file_copied = MagicMock(side_effect=lambda created_file: copy_checks.pop(0))
+
+        # when:
+        verification_time = exporter.verify_files([{'uuid': 'slow', 'version': 'v1', 'name': 'slow.json'}])
+
+        # then:
+        self.assertEqual([((8,),), ((2.0,),)], sleep.call_args_list)
+        self.assertEqual(3, exporter._is_file_copied.call_count)
+        self.assertEqual(10.0, verification_time)
+
+    @patch('ingest.api.dssapi.DssApi')
+    def test_prepare_metadata_files_keeps_cached_documents(self, dss_api_constructor):
+        # given:
+        dss_api_constructor.return_value = MagicMock('dss_api')
+        protocol = {
+            'uuid': {'uuid': 'protocol'},
+            'content': {'describedBy': 'https://schema.humancellatlas.org/type/protocol/5.0.0/dissociation_protocol'},
+            'submissionDate': '2018-05-01',
+            'updateDate': '2018-05-02'
+        }
+        ingest_api = MagicMock(name='ingest_api')
+        ingest_api.getRelatedEntities = MagicMock(return_value=iter([protocol]))
+        exporter = IngestExporter(ingest_api=ingest_api)
+        exporter.use_submission_cache('submission_uuid')
+
+        # and:
+        # both bundles derive from the same upstream process
+        def prepare_bundle(bundle_number):
+            upstream_process = {'uuid': {'uuid': 'shared_process'}}
+            protocols = exporter.get_related_entities('protocols', upstream_process, 'protocols')
+            metadata_info = {'biomaterial': {}, 'file': {}, 'project': {}, 'process': {},
+                             'protocol': {protocol['uuid']['uuid']: protocol for protocol in protocols}}
+            return exporter.prepare_metadata_files(metadata_info, ingestexportservice.ProcessInfo())
+
+        # when:
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            bundles = list(executor.map(prepare_bundle, range(2)))
+
+        # then:
+        for metadata_files in bundles:
+            content = metadata_files['protocol'][0]['content']
+            self.assertEqual('protocol', content['provenance']['document_id'])
+
+        # and:
+        cached_protocols = exporter.get_related_entities('protocols', {'uuid': {'uuid': 'shared_process'}}, 'protocols')
+        self.assertIs(protocol, cached_protocols[0])
+        self.assertNotIn('provenance', protocol['content'])
+        self.assertEqual(1, ingest_api.getRelatedEntities.call_count)
+
+    @patch('ingest.api.dssapi.DssApi')
+    def test_export_bundles(self, dss_api_constructor):
+        # given:
+        dss_api_constructor.return_value = MagicMock('dss_api')
+        ingest_api = MagicMock(name='ingest_api')
+        submission = {'triggersAnalysis': True}
+        ingest_api.getEntityByUuid = MagicMock(return_value=submission)
+        exporter = IngestExporter(ingest_api=ingest_api)
+        exporter.staging_api = MagicMock(name='staging_api')
+
+        # and:
+        def export_bundle(submission_uuid, submission, process_uuid):
+            if process_uuid == 'broken':
+                raise Exception('could not export bundle')
+            return f'{process_uuid}-bundle'
+
+        exporter._export_bundle = MagicMock(side_effect=export_bundle)
+
+        # when:
+        bundle_uuids = exporter.export_bundles('submission_uuid', ['first', 'second', 'first'], max_workers=2)
+
+        # then:
+        self.assertEqual({'first': 'first-bundle', 'second': 'second-bundle'}, bundle_uuids)
+        self.assertEqual(2, exporter._export_bundle.call_count)
+        exporter._export_bundle.assert_any_call('submission_uuid', submission, 'second')
+        exporter.staging_api.hasStagingArea.assert_called_once_with('submission_uuid')
+        ingest_api.getEntityByUuid.assert_called_once_with('submissionEnvelopes', 'submission_uuid')
+
+        # expect:
+        with self.assertRaises(ingestexportservice.BatchExportError) as context:
+            exporter.export_bundles('submission_uuid', ['broken', 'second'])
+        self.assertEqual(['broken'], list(context.exception.failures.keys()))
+        self.assertEqual({'second': 'second-bundle'}, context.exception.bundle_uuids)
+
+    @patch('ingest.api.dssapi.DssApi')
+    def test_bundle_exporter_shares_workers(self, dss_api_constructor):
+        # given:
+        dss_api_constructor.return_value = MagicMock('dss_api')
+        exporter = IngestExporter(ingest_api=MagicMock(name='ingest_api'), fetch_workers=8, upload_workers=8,
+                                  dss_workers=3)
+        exporter.use_submission_cache('submission_uuid')
+
+        # when:
+        bundle_exporter = exporter._bundle_exporter(4)
+
+        # then:
+        self.assertEqual((2, 2, 1), (bundle_exporter.fetch_workers, bundle_exporter.upload_workers,
+                                     bundle_exporter.dss_workers))
+        self.assertEqual((8, 8, 3), (exporter.fetch_workers, exporter.upload_workers, exporter.dss_workers))
+
+        # and:
+        self.assertIs(exporter.ingest_api, bundle_exporter.ingest_api)
+        self.assertIs(exporter.staging_api, bundle_exporter.staging_api)
+        self.assertIs(exporter.dss_api, bundle_exporter.dss_api)
+        self.assertIs(exporter.provenance_cache, bundle_exporter.provenance_cache)
+        self.assertIs(exporter.verification_times, bundle_exporter.verification_times)
+
     @patch('ingest.api.dssapi.DssApi')
     def test_put_bundle_in_dss_error(self, dss_api_constructor):
         # given:
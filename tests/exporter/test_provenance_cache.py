@@ -0,0 +1,145 @@
+import os
+import shutil
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest import TestCase
+from unittest.mock import MagicMock
+
+from ingest.exporter.provenance_cache import ProvenanceCache
+
+
+class ProvenanceCacheTest(TestCase):
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir)
+
+    def test_get_fetches_once(self):
+        # given:
+        cache = ProvenanceCache('submission_uuid')
+        fetch = MagicMock(return_value=[])
+
+        # when:
+        cache.get('protocol_uuid/protocols', fetch)
+        documents = cache.get('protocol_uuid/protocols', fetch)
+
+        # then:
+        self.assertEqual([], documents)
+        fetch.assert_called_once()
+
+    def test_get_evicts_least_recently_used(self):
+        # given:
+        cache = ProvenanceCache('submission_uuid', max_size=2)
+        cache.get('first', lambda: ['first'])
+        cache.get('second', lambda: ['second'])
+
+        # when:
+        cache.get('first', MagicMock())
+        cache.get('third', lambda: ['third'])
+
+        # then:
+        self.assertEqual(2, len(cache))
+        self.assertIn('first', cache)
+        self.assertNotIn('second', cache)
+        self.assertIn('third', cache)
+
+    def test_get_persisted(self):
+        # given:
+        cache = ProvenanceCache('submission_uuid', max_size=1, cache_dir=self.cache_dir)
+        cache.get('first', lambda: [{'uuid': {'uuid': 'first'}}])
+        cache.get('second', lambda: [])
+        fetch = MagicMock()
+
+        # when:
+        evicted = cache.get('first', fetch)
+        restored = ProvenanceCache('submission_uuid', cache_dir=self.cache_dir).get('second', fetch)
+
+        # then:
+        self.assertEqual([{'uuid': {'uuid': 'first'}}], evicted)
+        self.assertEqual([], restored)
+        fetch.assert_not_called()
+        self.assertTrue(os.path.isdir(os.path.join(self.cache_dir, 'submission_uuid')))
+
+    def test_get_fetches_once_for_concurrent_gets(self):
+        # given:
+        cache = ProvenanceCache('submission_uuid', cache_dir=self.cache_dir)
+        fetching = threading.Event()
+
+        def fetch():
+            fetching.wait(5)
+            return [{'uuid': {'uuid': 'project'}}]
+
+        fetch_mock = MagicMock(side_effect=fetch)
+
+        # when:
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            gets = [executor.submit(cache.get, 'project_uuid/projects', fetch_mock) for _ in range(4)]
+            time.sleep(0.1)
+            fetching.set()
+            documents = [get.result() for get in gets]
+
+        # then:
+        self.assertEqual([[{'uuid': {'uuid': 'project'}}]] * 4, documents)
+        fetch_mock.assert_called_once()
+
+    def test_get_fetch_error_is_not_cached(self):
+        # given:
+        cache = ProvenanceCache('submission_uuid')
+
+        # expect:
+        with self.assertRaises(ValueError):
+            cache.get('key', MagicMock(side_effect=ValueError('could not fetch')))
+        self.assertEqual(['document'], cache.get('key', lambda: ['document']))
+
+    def test_get_persisted_none(self):
+        # given:
+        ProvenanceCache('submission_uuid', cache_dir=self.cache_dir).get('key', lambda: None)
+        fetch = MagicMock()
+
+        # when:
+        document = ProvenanceCache('submission_uuid', cache_dir=self.cache_dir).get('key', fetch)
+
+        # then:
+        self.assertIsNone(document)
+        fetch.assert_not_called()
+
+    def test_get_persisted_expires(self):
+        # given:
+        cache = ProvenanceCache('submission_uuid', cache_dir=self.cache_dir, ttl=60)
+        cache.get('key', lambda: ['old'])
+        past = time.time() - 120
+        os.utime(cache._cache_path('key'), (past, past))
+
+        # when:
+        document = ProvenanceCache('submission_uuid', cache_dir=self.cache_dir, ttl=60).get(
+            'key', lambda: ['new'])
+
+        # then:
+        self.assertEqual(['new'], document)
+
+    def test_get_persisted_per_submission(self):
+        # given:
+        ProvenanceCache('submission_uuid', cache_dir=self.cache_dir).get('key', lambda: ['first'])
+        fetch = MagicMock(return_value=['other'])
+
+        # when:
+        documents = ProvenanceCache('other_uuid', cache_dir=self.cache_dir).get('key', fetch)
+
+        # then:
+        self.assertEqual(['other'], documents)
+        fetch.assert_called_once()
+
+    def test_get_not_persisted_without_submission(self):
+        # given:
+        cache = ProvenanceCache(None, cache_dir=self.cache_dir)
+
+        # when:
+        cache.get('key', lambda: ['document'])
+
+        # then:
+        self.assertIsNone(cache.cache_dir)
+        self.assertEqual([], os.listdir(self.cache_dir))
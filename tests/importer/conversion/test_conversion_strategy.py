@@ -160,6 +160,15 @@ class ListElementCellConversionTest(TestCase):
         thing = list_of_things[0]
         self.assertEqual('sample - converted', thing.get('name'))
 
+    def test_field_path_split_on_creation(self):
+        # given:
+        cell_conversion = ListElementCellConversion('user.profile.addresses.city', None)
+
+        # expect:
+        self.assertEqual(('profile', 'addresses'), cell_conversion.parent_chain)
+        self.assertEqual('city', cell_conversion.target_field)
+        self.assertEqual(('profile', 'addresses', 'city'), cell_conversion.field_chain)
+
     def test_apply_previously_processed_field(self):
         # given:
         converter = _create_mock_string_converter()
@@ -123,3 +123,36 @@ class ListConverterTest(TestCase):
     def test_convert_to_int_list_single(self):
         converter = ListConverter(data_type=DataType.INTEGER)
         self.assertEqual([9606], converter.convert(9606))
+
+    def test_convert_column(self):
+        # given:
+        converter = ListConverter(data_type=DataType.INTEGER)
+
+        # expect:
+        self.assertEqual([[1, 2], None, [9606]], converter.convert_column(['1||2', None, 9606]))
+
+
+class ConvertColumnTest(TestCase):
+
+    def test_convert_column_matches_convert(self):
+        # given:
+        columns = [
+            (StringConverter(), ['  data ', None, 278]),
+            (IntegerConverter(), ['12', None, 7.0]),
+            (NumberConverter(), ['3.1416', None, 2]),
+            (BooleanConverter(), ['yes', None, 'False'])
+        ]
+
+        # expect:
+        for converter, column in columns:
+            expected = [None if data is None else converter.convert(data) for data in column]
+            self.assertEqual(expected, converter.convert_column(column))
+
+    def test_convert_column_invalid_boolean(self):
+        # given:
+        converter = BooleanConverter()
+
+        # expect:
+        with self.assertRaises(InvalidBooleanValue) as context:
+            converter.convert_column(['true', 'yup'])
+        self.assertEqual('yup', context.exception.get_value())
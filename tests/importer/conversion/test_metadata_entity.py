@@ -149,3 +149,62 @@ class MetadataEntityTest(TestCase):
         self.assertEqual(test_external_links, submission_dict.get('external_links_by_entity'))
         self.assertEqual(test_linking_details, submission_dict.get('linking_details'))
 
+    def test_link_containers_allocated_lazily(self):
+        # given:
+        metadata_entity = MetadataEntity(concrete_type='warehouse')
+
+        # expect:
+        self.assertFalse(hasattr(metadata_entity, '__dict__'))
+        self.assertIsNone(metadata_entity.get_links('items'))
+        self.assertIsNone(metadata_entity.get_external_links('producer'))
+        self.assertIsNone(metadata_entity.get_linking_detail('link'))
+
+        # and:
+        submission_dict = metadata_entity.map_for_submission()
+        self.assertEqual({}, submission_dict.get('links_by_entity'))
+        self.assertEqual({}, submission_dict.get('external_links_by_entity'))
+        self.assertEqual({}, submission_dict.get('linking_details'))
+
+        # when:
+        metadata_entity.define_linking_detail('link.details', 'test')
+
+        # then:
+        self.assertEqual({'link': {'details': 'test'}}, metadata_entity.linking_details)
+
+    def test_map_for_submission_hands_over_content(self):
+        # given:
+        metadata_entity = MetadataEntity(concrete_type='warehouse', content={'description': 'test'},
+                                         links={'items': ['123']})
+
+        # when:
+        submission_dict = metadata_entity.map_for_submission()
+
+        # and:
+        metadata_entity.define_content('description', 'changed')
+        metadata_entity.add_links('items', ['456'])
+
+        # then:
+        self.assertEqual({'description': 'test'}, submission_dict.get('content'))
+        self.assertEqual({'items': ['123']}, submission_dict.get('links_by_entity'))
+
+        # and:
+        self.assertEqual('changed', metadata_entity.get_content('description'))
+        self.assertEqual(['123', '456'], metadata_entity.get_links('items'))
+
+        # expect:
+        self.assertIsNot(submission_dict.get('content'),
+                         metadata_entity.map_for_submission().get('content'))
+
+    def test_add_module_entity_hands_over_content(self):
+        # given:
+        product = MetadataEntity(domain_type='product', concrete_type='product', object_id=12)
+        review = MetadataEntity(domain_type='product', concrete_type='product', object_id=12,
+                                content={'reviews': {'user': 'john', 'rating': 5}})
+
+        # when:
+        product.add_module_entity(review)
+        review.define_content('reviews.rating', 1)
+
+        # then:
+        self.assertEqual([{'user': 'john', 'rating': 5}], product.get_content('reviews'))
+        self.assertEqual(1, review.get_content('reviews.rating'))
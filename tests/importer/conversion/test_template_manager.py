@@ -3,15 +3,23 @@ from unittest import TestCase
 from mock import MagicMock, patch, call
 from openpyxl import Workbook
 
-from ingest.importer.conversion import conversion_strategy, column_specification
+from ingest.importer.conversion import conversion_strategy, column_specification, data_converter
 from ingest.importer.conversion.column_specification import ColumnSpecification
-from ingest.importer.conversion.conversion_strategy import CellConversion
-from ingest.importer.conversion.template_manager import TemplateManager, RowTemplate, InvalidTabName
+from ingest.importer.conversion.conversion_strategy import CellConversion, DirectCellConversion, \
+    IdentityCellConversion, ListElementCellConversion, LinkedIdentityCellConversion, \
+    LinkingDetailCellConversion, DoNothing
+from ingest.importer.conversion.template_manager import TemplateManager, RowTemplate, InvalidTabName, \
+    RowTemplateCache
 from ingest.importer.data_node import DataNode
 from ingest.importer.spreadsheet.ingest_worksheet import IngestWorksheet
 from tests.importer.utils.test_utils import create_test_workbook
 
 
+def _mock_find(schema_template):
+    # TemplateManager looks keys up with find, which stands in for the mocked lookup here
+    schema_template.find = lambda key, default=None: schema_template.lookup(key)
+
+
 def _mock_schema_template_lookup(value_type='string', multivalue=False):
     schema_template = MagicMock(name='schema_template')
     single_string_spec = {
@@ -19,6 +27,7 @@ def _mock_schema_template_lookup(value_type='string', multivalue=False):
         'multivalue': multivalue
     }
     schema_template.lookup = MagicMock(name='lookup', return_value=single_string_spec)
+    _mock_find(schema_template)
     return schema_template
 
 
@@ -41,6 +50,7 @@ class TemplateManagerTest(TestCase):
         }
 
         schema_template.lookup = lambda key: lookup_map.get(key)
+        _mock_find(schema_template)
 
         ingest_api = MagicMock(name='ingest_api')
 
@@ -76,6 +86,7 @@ class TemplateManagerTest(TestCase):
             'user': {'schema': {'domain_entity': 'main_category/subdomain'}}
         }
         template.lookup = lambda key: spec_map.get(key, None)
+        _mock_find(template)
 
         # and: set up column spec
         name_column_spec = MagicMock(name='name_column_spec')
@@ -117,6 +128,57 @@ class TemplateManagerTest(TestCase):
         self.assertTrue(name_strategy in row_template.cell_conversions)
         self.assertTrue(numbers_strategy in row_template.cell_conversions)
 
+    @patch.object(column_specification, 'look_up')
+    @patch.object(conversion_strategy, 'determine_strategy')
+    def test_create_row_template_from_cache(self, determine_strategy, look_up):
+        # given:
+        template = MagicMock(name='schema_template')
+        template.get_schema_urls = MagicMock(return_value=['https://schema.sample.com/user'])
+        template.get_tab_key = MagicMock(return_value='user')
+        template.lookup = lambda key: {'schema': {'domain_entity': 'user'}} if key == 'user' else None
+        _mock_find(template)
+        determine_strategy.side_effect = lambda column_spec: MagicMock('strategy')
+
+        # and:
+        def create_worksheet(*headers):
+            worksheet = Workbook().create_sheet('User')
+            for column, header in zip('ABC', headers):
+                worksheet[f'{column}4'] = header
+            return IngestWorksheet(worksheet)
+
+        # and:
+        row_template_cache = RowTemplateCache()
+        template_manager = TemplateManager(template, MagicMock(name='ingest_api'),
+                                           row_template_cache=row_template_cache)
+        other_template_manager = TemplateManager(template, MagicMock(name='ingest_api'),
+                                                 row_template_cache=row_template_cache)
+
+        # when:
+        row_template = template_manager.create_row_template(create_worksheet('user.name', 'user.age'))
+        same_shape = other_template_manager.create_row_template(create_worksheet('user.name', 'user.age'))
+        other_shape = template_manager.create_row_template(create_worksheet('user.name'))
+
+        # then:
+        self.assertIs(row_template, same_shape)
+        self.assertIsNot(row_template, other_shape)
+        self.assertEqual(3, look_up.call_count)
+        self.assertEqual(2, len(row_template_cache))
+
+    def test_row_template_cache_evicts_least_recently_used(self):
+        # given:
+        row_template_cache = RowTemplateCache(max_size=2)
+        first = row_template_cache.get_or_create('first', lambda: MagicMock('first'))
+        row_template_cache.get_or_create('second', lambda: MagicMock('second'))
+
+        # when:
+        self.assertIs(first, row_template_cache.get_or_create('first', lambda: MagicMock('other')))
+        row_template_cache.get_or_create('third', lambda: MagicMock('third'))
+
+        # then:
+        self.assertIs(first, row_template_cache.get_or_create('first', lambda: MagicMock('other')))
+        recreated = MagicMock('recreated')
+        self.assertIs(recreated, row_template_cache.get_or_create('second', lambda: recreated))
+
     @patch.object(column_specification, 'look_up')
     @patch.object(conversion_strategy, 'determine_strategy')
     def test_create_row_template_with_default_values(self, determine_strategy, look_up):
@@ -167,6 +229,7 @@ class TemplateManagerTest(TestCase):
             'product': {'schema': {'domain_entity': 'merchandise/product'}}
         }
         template.lookup = lambda key: spec_map.get(key, None)
+        _mock_find(template)
 
         # and:
         template_mgr = TemplateManager(template, ingest_api)
@@ -247,6 +310,7 @@ class TemplateManagerTest(TestCase):
             object_type: schema
         }
         schema_template.lookup = lambda key: spec_map.get(key)
+        _mock_find(schema_template)
 
     def test_get_schema_type(self):
         # given
@@ -262,6 +326,7 @@ class TemplateManagerTest(TestCase):
             }
         }
         schema_template.lookup = MagicMock(name='lookup', return_value=spec)
+        _mock_find(schema_template)
         template_manager = TemplateManager(schema_template, ingest_api)
 
         # when:
@@ -286,6 +351,7 @@ class TemplateManagerTest(TestCase):
         }
 
         schema_template.lookup = MagicMock(name='lookup', return_value=spec)
+        _mock_find(schema_template)
         template_manager = TemplateManager(schema_template, ingest_api)
         template_manager.get_latest_schema_url = MagicMock(return_value=latest_url)
 
@@ -338,6 +404,7 @@ class TemplateManagerTest(TestCase):
         template = MagicMock(name='schema_template')
         schema_spec = {'schema': { 'domain_entity': 'user/profile' }}
         template.lookup = MagicMock(return_value=schema_spec)
+        _mock_find(template)
 
         # and:
         template_manager = TemplateManager(template, MagicMock(name='ingest_api'))
@@ -413,3 +480,33 @@ class RowTemplateTest(TestCase):
         # then:
         self.assertEqual(schema_url, result.get_content('describedBy'))
         self.assertEqual('extra field', result.get_content('extra_field'))
+
+    def test_import_rows_matches_do_import(self):
+        # given:
+        integer_converter = data_converter.CONVERTER_MAP[data_converter.DataType.INTEGER]
+        cell_conversions = [
+            IdentityCellConversion('user.user_id', data_converter.DEFAULT),
+            DirectCellConversion('user.age', integer_converter),
+            ListElementCellConversion('user.aliases.name', data_converter.DEFAULT),
+            LinkedIdentityCellConversion('account.account_id', 'account'),
+            LinkingDetailCellConversion('process.process_id', data_converter.DEFAULT),
+            DoNothing()
+        ]
+        row_template = RowTemplate('user', 'user', cell_conversions, default_values={'schema_type': 'user'})
+
+        # and:
+        rows = [
+            ('user_1', '27', 'juan||jdc', 'account_1', 'process_1', 'note'),
+            ('user_2', None, None, 'account_1||account_2', None, None),
+            (None, '31', 'pia')
+        ]
+
+        # when:
+        results = row_template.import_rows(rows)
+
+        # then:
+        expected = [row_template.import_values(row) for row in rows]
+        self.assertEqual([metadata.object_id for metadata in expected],
+                         [metadata.object_id for metadata in results])
+        self.assertEqual([metadata.map_for_submission() for metadata in expected],
+                         [metadata.map_for_submission() for metadata in results])
@@ -1,5 +1,7 @@
 from unittest import TestCase
 
+from mock import MagicMock
+
 from ingest.importer.spreadsheet.ingest_worksheet import IngestWorksheet
 
 import ingest.utils.spreadsheet as spreadsheet_utils
@@ -137,6 +139,28 @@ class IngestWorksheetTest(TestCase):
         self.assertEqual(len(data_row_values), 1)
         self.assertEqual(data_row_values, [expected_data_row])
 
+    def test_iter_data_rows_reads_header_once(self):
+        # given:
+        header_row = ['name', 'address']
+        rows = [[], [], [], header_row, [], ['Jane Doe', 'Cambridge'], ['John Doe', 'London']]
+        worksheet = spreadsheet_utils.create_worksheet('person', rows)
+        worksheet.iter_rows = MagicMock(side_effect=worksheet.iter_rows)
+
+        # and:
+        ingest_worksheet = IngestWorksheet(worksheet)
+        ingest_worksheet.get_column_headers()
+
+        # when:
+        data_rows = ingest_worksheet.iter_data_rows()
+        first_row = next(data_rows)
+
+        # then:
+        self.assertEqual(['Jane Doe', 'Cambridge'], [cell.value for cell in first_row])
+        self.assertEqual([['John Doe', 'London']], [[cell.value for cell in row] for row in data_rows])
+
+        # and:
+        self.assertEqual(2, worksheet.iter_rows.call_count)
+
     def test_is_module_tab(self):
         # given:
         workbook = create_test_workbook('Product', 'Product - History')
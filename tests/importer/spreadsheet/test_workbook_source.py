@@ -0,0 +1,122 @@
+import json
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+from ingest.importer.spreadsheet import workbook_source
+from ingest.importer.spreadsheet.ingest_workbook import IngestWorkbook
+from ingest.importer.spreadsheet.workbook_source import UnsupportedSourceFile, EmptySourceDirectory
+
+PROJECT_ROWS = [
+    'PROJECT',
+    'Project details',
+    'Short name,Description',
+    'project.project_core.project_shortname,project.project_core.project_description',
+    'FILL OUT INFORMATION BELOW THIS ROW',
+    'demo,"A project, described"',
+    ',',
+    'second,'
+]
+
+
+class WorkbookSourceTest(TestCase):
+
+    def setUp(self):
+        self.source_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.source_dir)
+
+    def _write(self, file_name, lines):
+        with open(os.path.join(self.source_dir, file_name), 'w') as source_file:
+            source_file.write('\n'.join(lines) + '\n')
+
+    def test_load_csv_directory(self):
+        # given:
+        self._write('Schemas.csv', ['schema', 'https://schema.humancellatlas.org/type/project/project'])
+        self._write('Project.csv', PROJECT_ROWS)
+        self._write('Project - Contributors.tsv', ['', '', '', 'project.contributors.name', '', 'Juan'])
+        self._write('notes.txt', ['ignored'])
+
+        # when:
+        ingest_workbook = IngestWorkbook(workbook_source.load_directory(self.source_dir))
+
+        # then:
+        self.assertEqual(['https://schema.humancellatlas.org/type/project/project'],
+                         ingest_workbook.get_schemas())
+
+        # and:
+        worksheets = ingest_workbook.importable_worksheets()
+        self.assertEqual(['Project', 'Project - Contributors'],
+                         [worksheet.title for worksheet in worksheets])
+        project_sheet, contributors_sheet = worksheets
+
+        # and:
+        self.assertEqual(['project.project_core.project_shortname',
+                          'project.project_core.project_description'],
+                         project_sheet.get_column_headers())
+        rows = [[cell.value for cell in row] for row in project_sheet.iter_data_rows()]
+        self.assertEqual([['demo', 'A project, described'], ['second', None]], rows)
+
+        # and:
+        self.assertTrue(contributors_sheet.is_module_tab())
+        self.assertEqual('contributors', contributors_sheet.get_module_field_name())
+        rows = [[cell.value for cell in row] for row in contributors_sheet.iter_data_rows()]
+        self.assertEqual([['Juan']], rows)
+
+    def test_load_json_lines(self):
+        # given:
+        rows = [[], [], [], ['donor.age', 'donor.is_living'], [], [27, True], [None, False]]
+        self._write('Donor.jsonl', [json.dumps(row) for row in rows])
+
+        # when:
+        workbook = workbook_source.load_directory(self.source_dir)
+        worksheet = IngestWorkbook(workbook).importable_worksheets()[0]
+
+        # then:
+        rows = [[cell.value for cell in row] for row in worksheet.iter_data_rows()]
+        self.assertEqual([[27, True], [None, False]], rows)
+
+    def test_get_schemas_with_blank_line(self):
+        # given:
+        self._write('Schemas.csv', ['schema', 'https://schema.humancellatlas.org/type/project/project', '',
+                                    'https://schema.humancellatlas.org/type/biomaterial/donor_organism'])
+        self._write('Donor.jsonl', ['', '["donor.age"]'])
+
+        # when:
+        workbook = workbook_source.load_directory(self.source_dir)
+
+        # then:
+        self.assertEqual(['https://schema.humancellatlas.org/type/project/project', None,
+                          'https://schema.humancellatlas.org/type/biomaterial/donor_organism'],
+                         IngestWorkbook(workbook).get_schemas())
+        self.assertEqual([(None,), ('donor.age',)], list(workbook['Donor'].iter_values()))
+        self.assertEqual([None], [cell.value for cell in next(workbook['Donor'].iter_rows())])
+
+    def test_load_directory_in_file_name_order(self):
+        # given:
+        self._write('Schemas.csv', ['schema'])
+        self._write('02 Specimen from organism.csv', [])
+        self._write('10_Donor organism.csv', [])
+        self._write('1 Project.csv', [])
+        self._write('Sequence file.tsv', [])
+        self._write('Cell suspension.jsonl', [])
+
+        # when:
+        workbook = workbook_source.load_directory(self.source_dir)
+
+        # then:
+        self.assertEqual(['Project', 'Specimen from organism', 'Donor organism', 'Cell suspension',
+                          'Schemas', 'Sequence file'], workbook.sheetnames)
+        self.assertTrue(workbook['Donor organism'].path.endswith('10_Donor organism.csv'))
+
+    def test_load_empty_directory(self):
+        # expect:
+        with self.assertRaises(EmptySourceDirectory):
+            workbook_source.load_directory(self.source_dir)
+
+    def test_read_unsupported_file(self):
+        # expect:
+        with self.assertRaises(UnsupportedSourceFile):
+            workbook_source.read_source_file(os.path.join(self.source_dir, 'Project.xlsx'))
@@ -0,0 +1,165 @@
+import datetime
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+import openpyxl
+from openpyxl import Workbook
+from openpyxl.utils.datetime import CALENDAR_MAC_1904
+
+from ingest.importer.spreadsheet import xlsx_reader
+from ingest.importer.spreadsheet.ingest_workbook import IngestWorkbook
+
+BASE_PATH = os.path.dirname(__file__)
+
+
+def _read_openpyxl_values(worksheet):
+    rows = []
+    for row in worksheet.iter_rows():
+        values = [cell.value for cell in row]
+        while values and values[-1] is None:
+            values.pop()
+        rows.append(tuple(values) or (None,))
+    return rows
+
+
+class XlsxReaderTest(TestCase):
+
+    def setUp(self):
+        self.workbook_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.workbook_dir)
+
+    def test_load_workbook(self):
+        # given:
+        workbook = Workbook()
+        workbook.remove(workbook.active)
+        users = workbook.create_sheet('User')
+        users['A4'] = 'user.name'
+        users['B4'] = 'user.age'
+        users['C4'] = 'user.active'
+        users['D4'] = 'user.joined'
+        users['A6'] = 'Juan'
+        users['B6'] = 27
+        users['C6'] = True
+        users['D6'] = datetime.datetime(2018, 4, 2)
+        users['B8'] = 1.5
+        workbook.create_sheet('User - Profiles')['A1'] = 'Juan'
+
+        # and:
+        workbook_path = os.path.join(self.workbook_dir, 'users.xlsx')
+        workbook.save(workbook_path)
+
+        # when:
+        raw_workbook = xlsx_reader.load_workbook(workbook_path)
+
+        # then:
+        self.assertEqual(['User', 'User - Profiles'], raw_workbook.get_sheet_names())
+        user_sheet = IngestWorkbook(raw_workbook).importable_worksheets()[0]
+        self.assertEqual(['user.name', 'user.age', 'user.active', 'user.joined'],
+                         user_sheet.get_column_headers())
+
+        # and:
+        self.assertEqual([('Juan', 27, True, datetime.datetime(2018, 4, 2)), (None, 1.5)],
+                         list(user_sheet.iter_data_values()))
+        self.assertEqual([['Juan', 27, True, datetime.datetime(2018, 4, 2)], [None, 1.5]],
+                         [[cell.value for cell in row] for row in user_sheet.iter_data_rows()])
+
+    def test_get_schemas_with_gap_row(self):
+        # given:
+        workbook = Workbook()
+        schemas = workbook.active
+        schemas.title = 'Schemas'
+        schemas['A1'] = 'schema'
+        schemas['A2'] = 'https://schema.humancellatlas.org/type/project/project'
+        schemas['A4'] = 'https://schema.humancellatlas.org/type/biomaterial/donor_organism'
+        workbook_path = os.path.join(self.workbook_dir, 'schemas.xlsx')
+        workbook.save(workbook_path)
+
+        # when:
+        raw_workbook = xlsx_reader.load_workbook(workbook_path)
+
+        # then:
+        self.assertEqual(['https://schema.humancellatlas.org/type/project/project', None,
+                          'https://schema.humancellatlas.org/type/biomaterial/donor_organism'],
+                         IngestWorkbook(raw_workbook).get_schemas())
+        self.assertEqual([('schema',), ('https://schema.humancellatlas.org/type/project/project',), (None,)],
+                         list(raw_workbook['Schemas'].iter_values(max_row=3)))
+
+    def test_close_workbook(self):
+        # given:
+        workbook = Workbook()
+        workbook.active['A1'] = 'schema'
+        workbook_path = os.path.join(self.workbook_dir, 'schemas.xlsx')
+        workbook.save(workbook_path)
+        raw_workbook = xlsx_reader.load_workbook(workbook_path)
+        archive = raw_workbook.worksheets[0]._reader._archive
+
+        # when:
+        IngestWorkbook(raw_workbook).close()
+
+        # then:
+        self.assertIsNone(archive.fp)
+
+    def test_values_match_openpyxl(self):
+        # given:
+        workbook_path = os.path.join(BASE_PATH, '..', 'metadata_spleen_new_protocols.xlsx')
+
+        # when:
+        raw_workbook = xlsx_reader.load_workbook(workbook_path)
+        workbook = openpyxl.load_workbook(filename=workbook_path, read_only=True)
+
+        # then:
+        self.assertEqual(workbook.sheetnames, raw_workbook.sheetnames)
+        for title in workbook.sheetnames:
+            expected = _read_openpyxl_values(workbook[title])
+            actual = list(raw_workbook[title].iter_values(max_row=len(expected)))
+            self.assertEqual(expected, actual, title)
+
+    def _assert_values_match_openpyxl(self, workbook_path):
+        raw_workbook = xlsx_reader.load_workbook(workbook_path)
+        workbook = openpyxl.load_workbook(filename=workbook_path, read_only=True)
+        for title in workbook.sheetnames:
+            expected = _read_openpyxl_values(workbook[title])
+            actual = list(raw_workbook[title].iter_values(max_row=len(expected)))
+            self.assertEqual(expected, actual, title)
+        raw_workbook.close()
+        workbook.close()
+
+    def test_values_match_openpyxl_in_1904_date_system(self):
+        # given:
+        workbook = Workbook()
+        workbook.epoch = CALENDAR_MAC_1904
+        workbook.active['A1'] = datetime.datetime(2018, 4, 2, 13, 30)
+        workbook.active['B1'] = datetime.date(1999, 12, 31)
+        workbook.active['C1'] = 1462
+        workbook_path = os.path.join(self.workbook_dir, 'dates_1904.xlsx')
+        workbook.save(workbook_path)
+
+        # when:
+        raw_workbook = xlsx_reader.load_workbook(workbook_path)
+
+        # then:
+        self.assertEqual([(datetime.datetime(2018, 4, 2, 13, 30), datetime.datetime(1999, 12, 31), 1462)],
+                         list(raw_workbook.worksheets[0].iter_values()))
+        self._assert_values_match_openpyxl(workbook_path)
+
+    def test_values_match_openpyxl_for_iso_dates(self):
+        # given:
+        workbook = Workbook()
+        workbook.iso_dates = True
+        workbook.active['A1'] = datetime.datetime(2018, 4, 2, 13, 30)
+        workbook.active['B1'] = datetime.date(1999, 12, 31)
+        workbook.active['C1'] = 'text'
+        workbook_path = os.path.join(self.workbook_dir, 'iso_dates.xlsx')
+        workbook.save(workbook_path)
+
+        # when:
+        raw_workbook = xlsx_reader.load_workbook(workbook_path)
+
+        # then:
+        self.assertEqual([(datetime.datetime(2018, 4, 2, 13, 30), datetime.date(1999, 12, 31), 'text')],
+                         list(raw_workbook.worksheets[0].iter_values()))
+        self._assert_values_match_openpyxl(workbook_path)
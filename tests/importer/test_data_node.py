@@ -1,6 +1,6 @@
 from unittest import TestCase
 
-from ingest.importer.data_node import DataNode
+from ingest.importer.data_node import DataNode, copy_tree
 
 
 class DataNodeTest(TestCase):
@@ -51,6 +51,20 @@ class DataNodeTest(TestCase):
         self.assertIsNone(data_node['product.path.does.not.exist'])
         self.assertIsNone(data_node['simply.does.not.exist'])
 
+    def test_split_paths(self):
+        # given:
+        data_node = DataNode(defaults={'product': {'name': 'biscuit'}})
+
+        # when:
+        data_node.set_path(('product', 'batch', 'id'), '123')
+        data_node[('product', 'price')] = 12
+
+        # then:
+        self.assertEqual('biscuit', data_node.get_path(('product', 'name')))
+        self.assertEqual('123', data_node['product.batch.id'])
+        self.assertEqual(12, data_node[('product', 'price')])
+        self.assertIsNone(data_node.get_path(('product', 'does', 'not', 'exist')))
+
     # TODO in the future, it might be worth being able to remove nested keys.
     #  For now, let's remove only high level keys
     def test_remove_field(self):
@@ -64,3 +78,39 @@ class DataNodeTest(TestCase):
 
         # then:
         self.assertEqual(['id'], list(data_node.as_dict().keys()))
+
+    def test_defaults_are_copied(self):
+        # given:
+        defaults = {'product': {'name': 'biscuit', 'tags': ['snack']}}
+
+        # when:
+        data_node = DataNode(defaults=defaults)
+        data_node['product.name'] = 'cracker'
+        data_node['product.tags'].append('salty')
+
+        # then:
+        self.assertEqual({'product': {'name': 'biscuit', 'tags': ['snack']}}, defaults)
+
+    def test_adopted_defaults_are_not_copied(self):
+        # given:
+        defaults = {'product': {'name': 'biscuit'}}
+
+        # when:
+        data_node = DataNode(defaults=defaults, adopt=True)
+        data_node['product.name'] = 'cracker'
+
+        # then:
+        self.assertIs(defaults, data_node.node)
+        self.assertEqual('cracker', defaults['product']['name'])
+
+    def test_copy_tree(self):
+        # given:
+        tree = {'name': 'biscuit', 'count': 3, 'tags': [{'label': 'snack'}], 'origin': None}
+
+        # when:
+        tree_copy = copy_tree(tree)
+
+        # then:
+        self.assertEqual(tree, tree_copy)
+        self.assertIsNot(tree['tags'], tree_copy['tags'])
+        self.assertIsNot(tree['tags'][0], tree_copy['tags'][0])
@@ -1,12 +1,19 @@
 import os
+import shutil
+import tempfile
 from unittest import TestCase
 
-from mock import MagicMock, patch
+from mock import MagicMock, patch, call
 from openpyxl import Workbook
 
+from ingest.importer.conversion import data_converter
+from ingest.importer.conversion.conversion_strategy import DirectCellConversion, \
+    IdentityCellConversion, DO_NOTHING
 from ingest.importer.conversion.metadata_entity import MetadataEntity
+from ingest.importer.conversion.template_manager import RowTemplate
 from ingest.importer.importer import WorksheetImporter, WorkbookImporter, MultipleProjectsFound, \
-    NoProjectFound
+    NoProjectFound, XlsImporter
+from ingest.importer.spreadsheet import xlsx_reader
 from ingest.importer.spreadsheet.ingest_workbook import IngestWorkbook, IngestWorksheet
 from tests.importer.utils.test_utils import create_test_workbook
 
@@ -212,6 +219,108 @@ class WorkbookImporterTest(TestCase):
         self.assertTrue(thrown_exception, f'Expected to throw {NoProjectFound.__name__}.')
 
 
+    def test_do_import_in_process_pool(self):
+        # given:
+        row_templates = {
+            'Project': RowTemplate('project', 'project', [
+                DirectCellConversion('project.description', data_converter.DEFAULT)
+            ]),
+            'User': RowTemplate('user', 'user', [
+                IdentityCellConversion('user.user_id', data_converter.DEFAULT),
+                DirectCellConversion('user.user_name', data_converter.DEFAULT)
+            ], default_values={'schema_type': 'user'}),
+            'Item': RowTemplate('item', 'item', [
+                DO_NOTHING,
+                DirectCellConversion('item.name', data_converter.DEFAULT)
+            ])
+        }
+        template_mgr = MagicMock(name='template_manager')
+        template_mgr.create_row_template = MagicMock(
+            side_effect=lambda worksheet: row_templates[worksheet.title])
+
+        # and:
+        workbook = create_test_workbook('Project', 'User', 'Item')
+        workbook['Project']['A4'] = 'project.description'
+        workbook['Project']['A6'] = 'test project'
+        for worksheet in [workbook['User'], workbook['Item']]:
+            worksheet['A4'] = 'id'
+            worksheet['B4'] = 'name'
+            for row in range(6, 11):
+                worksheet[f'B{row}'] = f'{worksheet.title.lower()} {row}'
+        workbook['User']['A7'] = 'user_7'
+
+        # when:
+        serial_json = WorkbookImporter(template_mgr).do_import(IngestWorkbook(workbook))
+        parallel_json = WorkbookImporter(template_mgr, max_workers=2, chunk_size=2) \
+            .do_import(IngestWorkbook(workbook))
+
+        # then:
+        self.assertEqual(serial_json, parallel_json)
+        self.assertEqual(['_unknown_2', 'user_7', '_unknown_3', '_unknown_4', '_unknown_5'],
+                         list(parallel_json['user'].keys()))
+        self.assertEqual(['_unknown_6', '_unknown_7', '_unknown_8', '_unknown_9', '_unknown_10'],
+                         list(parallel_json['item'].keys()))
+
+    def test_do_import_same_entities_serial_in_batches_and_in_process_pool(self):
+        # given:
+        row_templates = {
+            'Project': RowTemplate('project', 'project', [
+                DirectCellConversion('project.description', data_converter.DEFAULT)
+            ]),
+            'User': RowTemplate('user', 'user', [
+                IdentityCellConversion('user.user_id', data_converter.DEFAULT),
+                DirectCellConversion('user.nicknames', data_converter.ListConverter()),
+                DirectCellConversion('user.active', data_converter.BooleanConverter()),
+                DirectCellConversion('user.user_name', data_converter.DEFAULT)
+            ]),
+            'User - SN Profiles': RowTemplate('user', 'user', [
+                IdentityCellConversion('user.user_id', data_converter.DEFAULT),
+                DirectCellConversion('user.sn_profiles.name', data_converter.DEFAULT)
+            ])
+        }
+        template_mgr = MagicMock(name='template_manager')
+        template_mgr.create_row_template = MagicMock(
+            side_effect=lambda worksheet: row_templates[worksheet.title])
+
+        # and:
+        workbook = create_test_workbook('Project', 'User', 'User - SN Profiles')
+        workbook['Project']['A4'] = 'project.description'
+        workbook['Project']['A6'] = 'test project'
+        user_sheet = workbook['User']
+        for column, header in zip('ABCD', ['id', 'nicknames', 'active', 'name']):
+            user_sheet[f'{column}4'] = header
+        user_rows = [('user_1', 'jd||jane', 'yes', 'Jane'),
+                     ('user_2', None, 'no', None),
+                     ('user_3', 'jo', None, 'Joe')]
+        for row_index, row in enumerate(user_rows, start=6):
+            for column, value in zip('ABCD', row):
+                user_sheet[f'{column}{row_index}'] = value
+        profile_sheet = workbook['User - SN Profiles']
+        profile_sheet['A4'] = 'id'
+        profile_sheet['B4'] = 'sn_profiles.name'
+        profile_rows = [('user_1', 'facebook'), ('user_1', 'instagram'), ('user_3', None)]
+        for row_index, (user_id, name) in enumerate(profile_rows, start=6):
+            profile_sheet[f'A{row_index}'] = user_id
+            profile_sheet[f'B{row_index}'] = name
+
+        # when:
+        serial_json = WorkbookImporter(template_mgr).do_import(IngestWorkbook(workbook))
+        batch_json = WorkbookImporter(template_mgr, batch_size=2).do_import(IngestWorkbook(workbook))
+        parallel_json = WorkbookImporter(template_mgr, max_workers=2, chunk_size=2) \
+            .do_import(IngestWorkbook(workbook))
+
+        # then:
+        self.assertEqual(serial_json, batch_json)
+        self.assertEqual(serial_json, parallel_json)
+
+        # and:
+        users = parallel_json['user']
+        self.assertEqual({'user_id': 'user_1', 'nicknames': ['jd', 'jane'], 'active': True,
+                          'user_name': 'Jane', 'sn_profiles': [{'name': 'facebook'}, {'name': 'instagram'}]},
+                         users['user_1']['content'])
+        self.assertEqual({'user_id': 'user_2', 'active': False}, users['user_2']['content'])
+
+
 class WorksheetImporterTest(TestCase):
 
     def test_do_import(self):
@@ -248,6 +357,129 @@ class WorksheetImporterTest(TestCase):
         # and: domain and concrete type should be set
         pass
 
+    def test_do_import_converts_rows_as_consumed(self):
+        # given:
+        row_template = MagicMock('row_template')
+        row_template.do_import = MagicMock(side_effect=[MetadataEntity(object_id='profile_1'),
+                                                        MetadataEntity(object_id='profile_2')])
+
+        # and:
+        mock_template_manager = MagicMock('template_manager')
+        mock_template_manager.create_row_template = MagicMock(return_value=row_template)
+
+        # and:
+        workbook = Workbook()
+        worksheet = workbook.create_sheet('user_profile')
+        worksheet['A4'] = 'header'
+        worksheet['A6'] = 'john'
+        worksheet['A7'] = 'emma'
+
+        # when:
+        worksheet_importer = WorksheetImporter(mock_template_manager)
+        profiles = worksheet_importer.do_import(IngestWorksheet(worksheet))
+        first_profile = next(iter(profiles))
+
+        # then:
+        self.assertEqual('profile_1', first_profile.object_id)
+        self.assertEqual(1, row_template.do_import.call_count)
+
+    def test_do_import_in_batches(self):
+        # given:
+        row_template = MagicMock('row_template')
+        row_template.import_rows = MagicMock(side_effect=[
+            [MetadataEntity(object_id='profile_1'), MetadataEntity()],
+            [MetadataEntity()]
+        ])
+
+        # and:
+        mock_template_manager = MagicMock('template_manager')
+        mock_template_manager.create_row_template = MagicMock(return_value=row_template)
+
+        # and:
+        workbook = Workbook()
+        worksheet = workbook.create_sheet('user_profile')
+        worksheet['A4'] = 'header'
+        worksheet['A6'] = 'john'
+        worksheet['A7'] = 'emma'
+        worksheet['A8'] = 'pia'
+
+        # when:
+        worksheet_importer = WorksheetImporter(mock_template_manager, batch_size=2)
+        profiles = list(worksheet_importer.do_import(IngestWorksheet(worksheet)))
+
+        # then:
+        row_template.import_rows.assert_has_calls([call([('john',), ('emma',)]), call([('pia',)])])
+        self.assertEqual(['profile_1', '_unknown_1', '_unknown_2'],
+                         [profile.object_id for profile in profiles])
+
+    def test_do_import_plain_values(self):
+        # given:
+        row_template = MagicMock('row_template')
+        row_template.do_import = MagicMock()
+        row_template.import_values = MagicMock(side_effect=[MetadataEntity(object_id='profile_1'),
+                                                            MetadataEntity()])
+
+        # and:
+        mock_template_manager = MagicMock('template_manager')
+        mock_template_manager.create_row_template = MagicMock(return_value=row_template)
+
+        # and:
+        workbook = Workbook()
+        worksheet = workbook.active
+        worksheet.title = 'user_profile'
+        worksheet['A4'] = 'header'
+        worksheet['A6'] = 'john'
+        worksheet['A7'] = 'emma'
+        workbook_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, workbook_dir)
+        workbook_path = os.path.join(workbook_dir, 'profiles.xlsx')
+        workbook.save(workbook_path)
+        raw_worksheet = xlsx_reader.load_workbook(workbook_path)['user_profile']
+
+        # when:
+        worksheet_importer = WorksheetImporter(mock_template_manager)
+        profiles = list(worksheet_importer.do_import(IngestWorksheet(raw_worksheet)))
+
+        # then:
+        row_template.import_values.assert_has_calls([call(('john',)), call(('emma',))])
+        row_template.do_import.assert_not_called()
+        self.assertEqual(['profile_1', '_unknown_1'], [profile.object_id for profile in profiles])
+
+    def test_import_chunks_bounds_pending_chunks(self):
+        # given:
+        mock_template_manager = MagicMock('template_manager')
+        mock_template_manager.create_row_template = MagicMock(return_value=MagicMock('row_template'))
+
+        # and:
+        workbook = Workbook()
+        worksheet = workbook.create_sheet('user_profile')
+        worksheet['A4'] = 'header'
+        for row in range(6, 11):
+            worksheet[f'A{row}'] = f'user {row}'
+
+        # and:
+        events = []
+
+        def submit(function, row_template, chunk):
+            events.append(f'submit {len(chunk)}')
+            conversion = MagicMock(name='conversion')
+            conversion.result = MagicMock(side_effect=lambda: events.append('result') or [
+                MetadataEntity() for _ in chunk])
+            return conversion
+
+        executor = MagicMock(name='executor')
+        executor.submit = MagicMock(side_effect=submit)
+
+        # when:
+        worksheet_importer = WorksheetImporter(mock_template_manager)
+        profiles = list(worksheet_importer.import_chunks(IngestWorksheet(worksheet), executor,
+                                                         chunk_size=2, max_pending=2))
+
+        # then:
+        self.assertEqual(['submit 2', 'submit 2', 'result', 'submit 1', 'result', 'result'], events)
+        self.assertEqual([f'_unknown_{number}' for number in range(1, 6)],
+                         [profile.object_id for profile in profiles])
+
     def test_do_import_no_id_metadata(self):
         # given:
         row_template = MagicMock('row_template')
@@ -286,3 +518,41 @@ class WorksheetImporterTest(TestCase):
         pen_id = pen_metadata.object_id
         self.assertIsNotNone(pen_id)
         self.assertNotEqual(paper_id, pen_id)
+
+
+class XlsImporterTest(TestCase):
+
+    @patch('ingest.importer.importer.WorkbookImporter')
+    @patch('ingest.importer.importer.template_manager')
+    def test_import_workbook_passes_on_conversion_options(self, template_manager, workbook_importer_constructor):
+        # given:
+        importer = XlsImporter(MagicMock(name='ingest_api'), max_workers=4, chunk_size=100)
+        workbook = MagicMock(name='workbook')
+        workbook_importer_constructor.return_value.do_import = MagicMock(return_value={'project': {}})
+
+        # when:
+        spreadsheet_json, template_mgr = importer._import_workbook(workbook)
+
+        # then:
+        workbook_importer_constructor.assert_called_once_with(template_manager.build.return_value,
+                                                              max_workers=4, chunk_size=100)
+        self.assertEqual({'project': {}}, spreadsheet_json)
+        self.assertEqual(template_manager.build.return_value, template_mgr)
+
+    @patch('ingest.importer.importer.IngestSubmitter')
+    def test_import_file_passes_on_submission_options(self, submitter_constructor):
+        # given:
+        ingest_api = MagicMock(name='ingest_api')
+        importer = XlsImporter(ingest_api, submission_workers=8, max_links_per_host=2,
+                               journal_dir='journal')
+        importer._generate_spreadsheet_json = MagicMock(return_value=({}, MagicMock()))
+        importer._process_links_from_spreadsheet = MagicMock(return_value='entity_map')
+
+        # when:
+        importer.import_file('file.xlsx', 'submission_url')
+
+        # then:
+        submitter_constructor.assert_called_once_with(ingest_api, max_workers=8, max_links_per_host=2,
+                                                      journal_dir='journal')
+        submitter_constructor.return_value.submit.assert_called_once_with('entity_map', 'submission_url')
+        ingest_api.createSubmissionError.assert_not_called()
@@ -0,0 +1,83 @@
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+from ingest.importer.journal import SubmissionJournal
+from ingest.importer.submission import Entity
+
+
+class SubmissionJournalTest(TestCase):
+
+    def setUp(self):
+        self.journal_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.journal_dir)
+
+    def test_replay(self):
+        # given:
+        submission_url = 'http://ingest.sample.com/submissionEnvelopes/1'
+        journal = SubmissionJournal.for_submission(self.journal_dir, submission_url)
+
+        # and:
+        links = {'self': {'href': 'http://ingest.sample.com/biomaterials/1'}}
+        biomaterial = Entity('biomaterial', 'biomaterial_1', {}, ingest_json={'content': {}, '_links': links})
+        project = Entity('project', 'project_1', {})
+
+        # when:
+        journal.record_manifest({'expectedLinks': 1})
+        journal.record_entity(biomaterial)
+        journal.record_links(biomaterial, [project], 'projects')
+        journal.close()
+
+        # and:
+        replayed = SubmissionJournal.for_submission(self.journal_dir, submission_url)
+
+        # then:
+        self.assertEqual({'expectedLinks': 1}, replayed.manifest)
+        self.assertEqual(1, replayed.count_entities())
+        self.assertEqual(links, replayed.get_entity_links(biomaterial))
+        self.assertIsNone(replayed.get_entity_links(project))
+        self.assertTrue(replayed.is_linked(biomaterial, [project], 'projects'))
+        self.assertFalse(replayed.is_linked(biomaterial, [project], 'derivedByProcesses'))
+        replayed.close()
+
+    def test_replay_separates_submissions(self):
+        # given:
+        journal = SubmissionJournal.for_submission(self.journal_dir, 'http://ingest.sample.com/1')
+        journal.record_entity(Entity('project', 'project_1', {}, ingest_json={'_links': {}}))
+        journal.close()
+
+        # when:
+        other_journal = SubmissionJournal.for_submission(self.journal_dir, 'http://ingest.sample.com/2')
+
+        # then:
+        self.assertEqual(0, other_journal.count_entities())
+        other_journal.close()
+
+    def test_replay_skips_incomplete_record(self):
+        # given:
+        journal_path = os.path.join(self.journal_dir, 'journal.jsonl')
+        journal = SubmissionJournal(journal_path)
+        journal.record_entity(Entity('project', 'project_1', {}, ingest_json={'_links': {}}))
+        journal.close()
+
+        # and:
+        with open(journal_path, 'a') as journal_file:
+            journal_file.write('{"event": "entity", "key": "biomat')
+
+        # when:
+        replayed = SubmissionJournal(journal_path)
+
+        # then:
+        self.assertEqual(1, replayed.count_entities())
+
+        # when:
+        replayed.record_entity(Entity('biomaterial', 'biomaterial_1', {}, ingest_json={'_links': {}}))
+        replayed.close()
+
+        # then:
+        reopened = SubmissionJournal(journal_path)
+        self.assertEqual(2, reopened.count_entities())
+        reopened.close()
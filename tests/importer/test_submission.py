@@ -1,4 +1,8 @@
 import json
+import shutil
+import tempfile
+import threading
+import time
 from unittest import TestCase
 
 import copy
@@ -7,7 +11,8 @@ from mock import MagicMock, patch, call
 from ingest.api.ingestapi import IngestApi
 from ingest.importer.data_node import DataNode
 from ingest.importer.submission import Submission, Entity, IngestSubmitter, EntityLinker, LinkedEntityNotFound, \
-    InvalidLinkInSpreadsheet, MultipleProcessesFound, EntityMap
+    InvalidLinkInSpreadsheet, MultipleProcessesFound, EntityMap, EntitiesNotCreated, LinksNotCreated, \
+    LinkScheduler, DEFAULT_MAX_LINKS_PER_HOST
 
 import ingest.api.ingestapi
 
@@ -225,20 +230,308 @@ class IngestSubmitterTest(TestCase):
         submission_constructor.assert_called_with(ingest_api, 'url')
         submission.define_manifest.assert_called_with(entity_map)
         submission.add_entity.assert_has_calls([call(user), call(linked_product)], any_order=True)
-        submission.link_entity.assert_called_with(linked_product, user, relationship='wish_list')
+        submission.link_entities.assert_called_with(linked_product, [user], relationship='wish_list')
         ingest_api.patch.assert_called_once()
 
+    @patch('ingest.importer.submission.Submission')
+    def test_submit_concurrently(self, submission_constructor):
+        # given:
+        ingest_api = MagicMock('ingest_api')
+        ingest_api.getSubmissionEnvelope = MagicMock()
+        submission = self._mock_submission(submission_constructor)
+
+        # and:
+        created = []
+        submission.add_entity = MagicMock(side_effect=lambda entity: created.append(entity))
+
+        # and:
+        products = [Entity('product', f'product_{index}', {}) for index in range(0, 20)]
+        project = Entity('project', 'id', {})
+        reference = Entity('product', 'product_ref', None, is_reference=True)
+        entity_map = EntityMap(*products, reference, project)
+
+        # when:
+        submitter = IngestSubmitter(ingest_api, max_workers=4)
+        submitter.submit(entity_map, submission_url='url')
+
+        # then:
+        self.assertEqual(project, created[0])
+        self.assertCountEqual([project] + products, created)
+
+    @patch('ingest.importer.submission.Submission')
+    def test_submit_concurrently_reports_errors_per_entity(self, submission_constructor):
+        # given:
+        ingest_api = MagicMock('ingest_api')
+        submission = self._mock_submission(submission_constructor)
+
+        # and:
+        def add_entity(entity):
+            if entity.id in ['product_1', 'product_3']:
+                raise Exception(f'{entity.id} failed')
+        submission.add_entity = MagicMock(side_effect=add_entity)
+
+        # and:
+        products = [Entity('product', f'product_{index}', {}) for index in range(0, 5)]
+        entity_map = EntityMap(Entity('project', 'id', {}), *products)
+
+        # when:
+        submitter = IngestSubmitter(ingest_api, max_workers=3)
+        with self.assertRaises(EntitiesNotCreated) as context:
+            submitter.submit(entity_map, submission_url='url')
+
+        # then:
+        failed_ids = [entity.id for entity, __ in context.exception.failures]
+        self.assertCountEqual(['product_1', 'product_3'], failed_ids)
+        self.assertEqual(6, submission.add_entity.call_count)
+
+    @patch('ingest.importer.submission.Submission')
+    def test_submit_links_concurrently(self, submission_constructor):
+        # given:
+        ingest_api = MagicMock('ingest_api')
+        ingest_api.getSubmissionEnvelope = MagicMock()
+        ingest_api.patch = MagicMock()
+        ingest_api.get_link_from_resource = MagicMock(return_value='manifest_url')
+        submission = self._mock_submission(submission_constructor)
+
+        # and:
+        user = Entity('user', 'user_1', {})
+        account = Entity('account', 'account_1', {})
+        link_to_user = {'entity': 'user', 'id': 'user_1', 'relationship': 'wish_list'}
+        link_to_account = {'entity': 'account', 'id': 'account_1', 'relationship': 'owner'}
+        products = [Entity('product', f'product_{index}', {},
+                           direct_links=[link_to_user, link_to_account, link_to_user])
+                    for index in range(0, 30)]
+        entity_map = EntityMap(Entity('project', 'id', {}), user, account, *products)
+        submission.manifest = {'expectedLinks': 90}
+
+        # when:
+        submitter = IngestSubmitter(ingest_api, max_workers=4)
+        submitter.PROGRESS_CTR = 7
+        submitter.submit(entity_map, submission_url='url')
+
+        # then:
+        self.assertEqual(60, submission.link_entities.call_count)
+        for product in products:
+            submission.link_entities.assert_any_call(product, [user, user], relationship='wish_list')
+            submission.link_entities.assert_any_call(product, [account], relationship='owner')
+
+        # and:
+        reported_progress = [args[1]['actualLinks'] for args, __ in ingest_api.patch.call_args_list]
+        self.assertEqual(sorted(reported_progress), reported_progress)
+        self.assertEqual(90, reported_progress[-1])
+
+    @patch('ingest.importer.submission.Submission')
+    def test_submit_links_concurrently_reports_errors(self, submission_constructor):
+        # given:
+        ingest_api = MagicMock('ingest_api')
+        ingest_api.getSubmissionEnvelope = MagicMock()
+        ingest_api.patch = MagicMock()
+        ingest_api.get_link_from_resource = MagicMock()
+        submission = self._mock_submission(submission_constructor)
+
+        # and:
+        def link_entities(from_entity, to_entities, relationship=None):
+            if from_entity.id == 'product_2':
+                raise Exception('link failed')
+        submission.link_entities = MagicMock(side_effect=link_entities)
+
+        # and:
+        user = Entity('user', 'user_1', {})
+        link_to_user = {'entity': 'user', 'id': 'user_1', 'relationship': 'wish_list'}
+        products = [Entity('product', f'product_{index}', {}, direct_links=[link_to_user])
+                    for index in range(0, 5)]
+        entity_map = EntityMap(Entity('project', 'id', {}), user, *products)
+
+        # when:
+        submitter = IngestSubmitter(ingest_api, max_workers=3)
+        with self.assertRaises(LinksNotCreated) as context:
+            submitter.submit(entity_map, submission_url='url')
+
+        # then:
+        failures = context.exception.failures
+        self.assertEqual(1, len(failures))
+        self.assertEqual('product_2', failures[0][0].id)
+
+    @patch('ingest.importer.submission.Submission')
+    def test_submit_links_queue_at_default_cap_per_host(self, submission_constructor):
+        # given:
+        ingest_api = MagicMock('ingest_api')
+        ingest_api.getSubmissionEnvelope = MagicMock()
+        ingest_api.patch = MagicMock()
+        ingest_api.get_link_from_resource = MagicMock()
+        submission = self._mock_submission(submission_constructor)
+
+        # and:
+        in_flight = {'current': 0, 'max': 0}
+        lock = threading.Lock()
+
+        def link_entities(from_entity, to_entities, relationship=None):
+            with lock:
+                in_flight['current'] += 1
+                in_flight['max'] = max(in_flight['max'], in_flight['current'])
+            time.sleep(0.01)
+            with lock:
+                in_flight['current'] -= 1
+        submission.link_entities = MagicMock(side_effect=link_entities)
+
+        # and:
+        user = Entity('user', 'user_1', {})
+        link_to_user = {'entity': 'user', 'id': 'user_1', 'relationship': 'wish_list'}
+        ingest_json = {'_links': {'wish_list': {'href': 'http://ingest.sample.com/products/1/wish_list'}}}
+        products = [Entity('product', f'product_{index}', {}, ingest_json=ingest_json,
+                           direct_links=[link_to_user]) for index in range(0, 16)]
+        entity_map = EntityMap(Entity('project', 'id', {}), user, *products)
+
+        # when:
+        submitter = IngestSubmitter(ingest_api, max_workers=DEFAULT_MAX_LINKS_PER_HOST * 2)
+        submitter.submit(entity_map, submission_url='url')
+
+        # then:
+        self.assertEqual(16, submission.link_entities.call_count)
+        self.assertEqual(DEFAULT_MAX_LINKS_PER_HOST, in_flight['max'])
+
+    def test_link_entities_in_batch(self):
+        # given:
+        ingest_api = MagicMock(name='ingest_api')
+        submission = Submission(ingest_api, 'url')
+
+        # and:
+        process = Entity('process', 'process_1', {}, ingest_json={'process': 'json'})
+        protocols = [Entity('protocol', f'protocol_{index}', {}, ingest_json={'protocol': index})
+                     for index in range(0, 3)]
+        reference = Entity('protocol', 'uuid_1', None, is_reference=True)
+        ingest_api.getEntityByUuid = MagicMock(return_value={'protocol': 'reference'})
+
+        # when:
+        submission.link_entities(process, protocols + [reference], 'protocols')
+
+        # then:
+        ingest_api.getEntityByUuid.assert_called_once_with('protocols', 'uuid_1')
+        expected_targets = [{'protocol': 0}, {'protocol': 1}, {'protocol': 2}, {'protocol': 'reference'}]
+        ingest_api.link_entities.assert_called_once_with({'process': 'json'}, expected_targets, 'protocols')
+
+    def test_submit_resumes_from_journal(self):
+        # given:
+        ingest_api = MagicMock(name='ingest_api')
+        ingest_api.createSubmissionManifest = MagicMock(return_value={'expectedLinks': 2})
+        ingest_api.getSubmissionEnvelope = MagicMock(return_value={'_links': {}})
+        ingest_api.createEntity = MagicMock(
+            side_effect=lambda url, content, link_name: {'_links': {'self': {'href': content}}})
+        ingest_api.createProject = MagicMock(return_value={'_links': {'self': {'href': 'project'}}})
+
+        # and:
+        def build_entity_map():
+            link_to_project = {'entity': 'project', 'id': 'project_1', 'relationship': 'projects'}
+            return EntityMap(Entity('project', 'project_1', {}),
+                             Entity('biomaterial', 'biomaterial_1', {'index': 1}, direct_links=[link_to_project]),
+                             Entity('biomaterial', 'biomaterial_2', {'index': 2}, direct_links=[link_to_project]))
+
+        # and:
+        def link_entities(from_entity, to_entities, relationship):
+            if from_entity == {'_links': {'self': {'href': '{"index": 2}'}}}:
+                raise Exception('link failed')
+        ingest_api.link_entities = MagicMock(side_effect=link_entities)
+
+        # and:
+        journal_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, journal_dir)
+        submitter = IngestSubmitter(ingest_api, journal_dir=journal_dir)
+
+        # when:
+        with self.assertRaises(Exception):
+            submitter.submit(build_entity_map(), 'url')
+
+        # then:
+        self.assertEqual(2, ingest_api.createEntity.call_count)
+        self.assertEqual(2, ingest_api.link_entities.call_count)
+
+        # when:
+        ingest_api.link_entities = MagicMock()
+        submission = submitter.submit(build_entity_map(), 'url')
+
+        # then:
+        ingest_api.createSubmissionManifest.assert_called_once()
+        ingest_api.createProject.assert_called_once()
+        self.assertEqual(2, ingest_api.createEntity.call_count)
+        ingest_api.linkEntity.assert_called_once()
+        ingest_api.link_entities.assert_called_once_with({'_links': {'self': {'href': '{"index": 2}'}}},
+                                                         [{'_links': {'self': {'href': 'project'}}}],
+                                                         'projects')
+        self.assertEqual({'_links': {'self': {'href': '{"index": 1}'}}},
+                         submission.get_entity('biomaterial', 'biomaterial_1').ingest_json)
+
     @staticmethod
     def _mock_submission(submission_constructor):
         submission = MagicMock('submission')
         submission.define_manifest = MagicMock()
         submission.add_entity = MagicMock()
         submission.link_entity = MagicMock()
+        submission.link_entities = MagicMock()
+        submission.resolve_reference = MagicMock()
         submission.manifest = {}
         submission_constructor.return_value = submission
         return submission
 
 
+class LinkSchedulerTest(TestCase):
+
+    def test_run_caps_requests_per_host(self):
+        # given:
+        in_flight = {'current': 0, 'max': 0}
+        lock = threading.Lock()
+
+        def apply_links(from_entity, to_entities, relationship):
+            with lock:
+                in_flight['current'] += 1
+                in_flight['max'] = max(in_flight['max'], in_flight['current'])
+            time.sleep(0.01)
+            with lock:
+                in_flight['current'] -= 1
+
+        # and:
+        ingest_json = {'_links': {'projects': {'href': 'http://ingest.sample.com/products/1/projects'}}}
+        project = Entity('project', 'project_1', {})
+        link_chains = [[(Entity('product', f'product_{index}', {}, ingest_json=ingest_json), [project],
+                         'projects')] for index in range(0, 12)]
+
+        # when:
+        scheduler = LinkScheduler(max_workers=6, max_requests_per_host=2)
+        failures = scheduler.run(link_chains, apply_links)
+
+        # then:
+        self.assertEqual([], failures)
+        self.assertEqual(2, in_flight['max'])
+
+    def test_run_applies_chain_in_order(self):
+        # given:
+        applied = []
+        product = Entity('product', 'product_1', {})
+        chain = [(product, [Entity('user', f'user_{index}', {})], 'wish_list') for index in range(0, 10)]
+
+        # when:
+        scheduler = LinkScheduler(max_workers=4, max_requests_per_host=4)
+        scheduler.run([chain], lambda from_entity, to_entities, relationship: applied.append(to_entities[0].id))
+
+        # then:
+        self.assertEqual([f'user_{index}' for index in range(0, 10)], applied)
+
+    def test_resolve_references(self):
+        # given:
+        submission = MagicMock(name='submission')
+        reference = Entity('biomaterial', 'uuid_1', None, is_reference=True)
+        resolved = Entity('biomaterial', 'uuid_2', None, is_reference=True, ingest_json={'_links': {}})
+        product = Entity('product', 'product_1', {})
+        link_chains = [[(product, [reference, resolved], 'inputs')],
+                       [(reference, [product], 'outputs')]]
+
+        # when:
+        scheduler = LinkScheduler(max_workers=2, max_requests_per_host=2)
+        scheduler.resolve_references(link_chains, submission)
+
+        # then:
+        submission.resolve_reference.assert_called_once_with(reference)
+
+
 class EntityMapTest(TestCase):
 
     def test_load(self):
@@ -313,6 +606,124 @@ class EntityMapTest(TestCase):
         entity_map.add_entity(Entity('product', 'product_2', {}, direct_links=[{}, {}, {}, {}]))
         self.assertEqual(entity_map.count_links(), 7)
 
+    def test_count_links_tracks_direct_link_changes(self):
+        # given:
+        product = Entity('product', 'product_1', {}, direct_links=[{}])
+        entity_map = EntityMap(product)
+
+        # when:
+        product.direct_links.append({})
+        product.direct_links.extend([{}, {}])
+
+        # then:
+        self.assertEqual(4, entity_map.count_links())
+
+        # when:
+        product.direct_links.pop()
+        del product.direct_links[0]
+        product.direct_links = [{}]
+
+        # then:
+        self.assertEqual(1, entity_map.count_links())
+
+        # when:
+        entity_map.add_entity(Entity('product', 'product_1', {}, direct_links=[{}, {}]))
+        product.direct_links.append({})
+
+        # then:
+        self.assertEqual(2, entity_map.count_links())
+
+    def test_count_entities_of_type(self):
+        # given:
+        entity_map = EntityMap(Entity('product', 'product_1', {}),
+                               Entity('product', 'product_2', {}),
+                               Entity('product', 'uuid_1', None, is_reference=True),
+                               Entity('user', 'user_1', {}))
+
+        # when:
+        entity_map.add_entity(Entity('product', 'product_2', {}))
+
+        # then:
+        self.assertEqual(4, entity_map.count_total())
+        self.assertEqual(2, entity_map.count_entities_of_type('product'))
+        self.assertEqual(0, entity_map.count_entities_of_type('profile'))
+        self.assertEqual(2, len(entity_map.get_new_entities_of_type('product')))
+        self.assertEqual(3, len(entity_map.get_entities_of_type('product')))
+        self.assertEqual(3, len(entity_map.get_new_entities()))
+
+    def test_get_entities_is_a_view(self):
+        # given:
+        entity_map = EntityMap(Entity('product', 'product_1', {}))
+        entities = entity_map.get_entities()
+
+        # when:
+        user = Entity('user', 'user_1', {})
+        entity_map.add_entity(user)
+
+        # then:
+        self.assertEqual(2, len(entities))
+        self.assertIn(user, list(entities))
+        self.assertEqual(list(entities), list(entities))
+
+    def test_copied_direct_links_are_not_tracked(self):
+        # given:
+        product = Entity('product', 'product_1', {}, direct_links=[{}])
+        entity_map = EntityMap(product)
+
+        # when:
+        copied_links = copy.deepcopy(product.direct_links)
+        copied_links.append({})
+
+        # then:
+        self.assertEqual(1, entity_map.count_links())
+
+    def test_copied_entity_is_not_tracked(self):
+        # given:
+        product = Entity('product', 'product_1', {'name': 'product'}, direct_links=[{}],
+                         links_by_entity={'user': ['user_1']})
+        entity_map = EntityMap(product)
+
+        # when:
+        copied_product = copy.deepcopy(product)
+        copied_product.direct_links.append({})
+
+        # then:
+        self.assertEqual({'name': 'product'}, copied_product.content)
+        self.assertEqual({'user': ['user_1']}, copied_product.links_by_entity)
+        self.assertEqual(2, copied_product.count_direct_links())
+        self.assertEqual(1, entity_map.count_links())
+
+
+class EntityTest(TestCase):
+
+    def test_link_containers_allocated_lazily(self):
+        # given:
+        entity = Entity('product', 'product_1', {})
+
+        # expect:
+        self.assertFalse(hasattr(entity, '__dict__'))
+        self.assertEqual({}, entity.links_by_entity)
+        self.assertEqual({}, entity.linking_details)
+        self.assertEqual(0, entity.count_direct_links())
+        self.assertIsNone(entity._direct_links)
+
+    def test_direct_links_notify_listeners(self):
+        # given:
+        entity = Entity('product', 'product_1', {})
+        changes = []
+        entity.add_link_listener(changes.append)
+
+        # when:
+        entity.direct_links.append({'entity': 'user'})
+        entity.direct_links = [{}, {}, {}]
+
+        # and:
+        entity.remove_link_listener(changes.append)
+        entity.direct_links.pop()
+
+        # then:
+        self.assertEqual([1, 2], changes)
+        self.assertEqual(2, entity.count_direct_links())
 
 
 class EntityLinkerTest(TestCase):
@@ -0,0 +1,132 @@
+import os
+import shutil
+import tempfile
+import time
+from unittest import TestCase
+from unittest.mock import MagicMock, patch
+
+from ingest.template.schema_cache import SchemaCache, SchemaNotCached, is_versioned
+from ingest.template.schema_template import SchemaTemplate
+
+VERSIONED_URL = 'https://schema.humancellatlas.org/type/project/5.1.0/project'
+LATEST_URL = 'https://schema.humancellatlas.org/type/project/latest/project'
+
+
+class SchemaCacheTest(TestCase):
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir)
+
+    def _expire(self, cache, key, age):
+        cache_path = cache._cache_path(key)
+        past = time.time() - age
+        os.utime(cache_path, (past, past))
+
+    def test_is_versioned(self):
+        self.assertTrue(is_versioned(VERSIONED_URL))
+        self.assertFalse(is_versioned(LATEST_URL))
+
+    def test_get_versioned_schema_is_kept(self):
+        # given:
+        cache = SchemaCache(self.cache_dir, latest_ttl=60)
+        fetch = MagicMock(return_value={'id': VERSIONED_URL})
+
+        # when:
+        cache.get(VERSIONED_URL, fetch)
+        self._expire(cache, VERSIONED_URL, 3600)
+        schema = SchemaCache(self.cache_dir, latest_ttl=60).get(VERSIONED_URL, fetch)
+
+        # then:
+        self.assertEqual({'id': VERSIONED_URL}, schema)
+        fetch.assert_called_once()
+
+    def test_get_latest_schema_expires(self):
+        # given:
+        cache = SchemaCache(self.cache_dir, latest_ttl=60)
+        fetch = MagicMock(side_effect=[{'version': 1}, {'version': 2}])
+
+        # when:
+        first = cache.get(LATEST_URL, fetch)
+        second = cache.get(LATEST_URL, fetch)
+
+        # then:
+        self.assertEqual({'version': 1}, first)
+        self.assertEqual({'version': 1}, second)
+
+        # when:
+        self._expire(cache, LATEST_URL, 120)
+        third = cache.get(LATEST_URL, fetch)
+
+        # then:
+        self.assertEqual({'version': 2}, third)
+        self.assertEqual(2, fetch.call_count)
+
+    def test_get_offline(self):
+        # given:
+        SchemaCache(self.cache_dir, latest_ttl=60).get(LATEST_URL, lambda: {'version': 1})
+        offline_cache = SchemaCache(self.cache_dir, latest_ttl=60, offline=True)
+        self._expire(offline_cache, LATEST_URL, 120)
+        fetch = MagicMock()
+
+        # expect:
+        self.assertEqual({'version': 1}, offline_cache.get(LATEST_URL, fetch))
+        with self.assertRaises(SchemaNotCached):
+            offline_cache.get(VERSIONED_URL, fetch)
+        fetch.assert_not_called()
+
+    def test_get_does_not_store_empty_result(self):
+        # given:
+        cache = SchemaCache(self.cache_dir)
+        fetch = MagicMock(side_effect=[None, {'id': VERSIONED_URL}])
+
+        # when:
+        first = cache.get(VERSIONED_URL, fetch)
+        second = cache.get(VERSIONED_URL, fetch)
+
+        # then:
+        self.assertIsNone(first)
+        self.assertEqual({'id': VERSIONED_URL}, second)
+
+    @patch('urllib.request.urlopen')
+    def test_schema_template_loads_through_cache(self, mock_urlopen):
+        # given:
+        response = MagicMock()
+        response.read.return_value = ('{"id": "' + VERSIONED_URL + '", "properties": {}}').encode()
+        response.__enter__.return_value = response
+        mock_urlopen.return_value = response
+
+        # and:
+        cache = SchemaCache(self.cache_dir)
+
+        # when:
+        SchemaTemplate(list_of_schema_urls=[VERSIONED_URL], cache=cache)
+        template = SchemaTemplate(list_of_schema_urls=[VERSIONED_URL], cache=cache)
+
+        # then:
+        self.assertEqual('project', template.lookup('project.schema.module'))
+        mock_urlopen.assert_called_once_with(VERSIONED_URL)
+
+    @patch('urllib.request.urlopen')
+    def test_schema_template_restored_from_cached_snapshot(self, mock_urlopen):
+        # given:
+        response = MagicMock()
+        response.read.return_value = ('{"id": "' + VERSIONED_URL + '", "properties": {}}').encode()
+        response.__enter__.return_value = response
+        mock_urlopen.return_value = response
+
+        # and:
+        cache = SchemaCache(self.cache_dir)
+        compiled = SchemaTemplate(list_of_schema_urls=[VERSIONED_URL], cache=False)
+        cache.get('schema-template:' + VERSIONED_URL, compiled.snapshot)
+
+        # when:
+        with patch('ingest.template.schema_template.SchemaParser._load_schema') as load_schema:
+            template = SchemaTemplate(list_of_schema_urls=[VERSIONED_URL], cache=cache)
+
+        # then:
+        self.assertEqual('project', template.lookup('project.schema.module'))
+        self.assertEqual('project', template.get_tab_key('Project'))
+        load_schema.assert_not_called()
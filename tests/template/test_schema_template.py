@@ -7,14 +7,20 @@ __author__ = "jupp"
 __license__ = "Apache 2.0"
 __date__ = "01/05/2018"
 
+import json
 import os
+import shutil
+import tempfile
 import unittest
+from concurrent.futures import ThreadPoolExecutor
 from unittest import TestCase
+from unittest.mock import MagicMock, patch
 
 import tests.template.schema_mock_utils as schema_mock
 from ingest.template.schema_template import RootSchemaException
 from ingest.template.schema_template import SchemaParser
 from ingest.template.schema_template import UnknownKeyException
+from ingest.template.schema_template import SchemaTemplate, SnapshotVersionException
 
 
 class TestSchemaTemplate(TestCase):
@@ -23,6 +29,7 @@ class TestSchemaTemplate(TestCase):
         self.longMessage = True
         self.dummyProjectUri = "https://schema.humancellatlas.org/type/project/5.1.0/project"
         self.dummyDonorUri = "https://schema.humancellatlas.org/type/biomaterial/5.1.0/donor_organism"
+        self.dummySpecimenUri = "https://schema.humancellatlas.org/type/biomaterial/5.1.0/specimen_from_organism"
         pass
 
     def test_schema_lookup(self):
@@ -45,6 +52,43 @@ class TestSchemaTemplate(TestCase):
         with self.assertRaises(UnknownKeyException):
                 template.lookup('foo')
 
+    def test_find(self):
+        data = '{"id" : "' + self.dummyDonorUri + '", "properties": {"foo_bar": {"user_friendly" : "Foo bar"}} }'
+        template = schema_mock.get_template_for_json(data=data)
+
+        self.assertEqual("Foo bar", template.find("donor_organism.foo_bar.user_friendly"))
+        self.assertEqual("biomaterial", template.find("donor_organism.schema.domain_entity"))
+        self.assertIsNone(template.find("donor_organism.foo_bar.example", "default"))
+        self.assertIsNone(template.find("donor_organism.unknown"))
+        self.assertEqual("default", template.find("donor_organism.foo_bar.example.unknown", "default"))
+
+    def test_lookup_after_put(self):
+        data = '{"id" : "' + self.dummyDonorUri + '", "properties": {}}'
+        template = schema_mock.get_template_for_json(data=data)
+        self.assertIsNone(template.find("extra.user_friendly"))
+
+        template.put("extra", {"user_friendly": "Extra"})
+
+        self.assertEqual("Extra", template.lookup("extra.user_friendly"))
+
+    def test_find_uses_key_index_built_on_load(self):
+        # given:
+        data = '{"id" : "' + self.dummyDonorUri + '", "properties": {"foo_bar": {"user_friendly" : "Foo bar"}} }'
+        snapshot = schema_mock.get_template_for_json(data=data).snapshot()
+        template = SchemaTemplate.from_snapshot(snapshot)
+
+        # when:
+        with patch.object(template, '_build_key_index', wraps=template._build_key_index) as build_key_index:
+            found = [template.find("donor_organism.foo_bar.user_friendly") for _ in range(0, 3)]
+            template.put("extra", {"user_friendly": "Extra"})
+            with ThreadPoolExecutor(max_workers=4) as executor:
+                extras = list(executor.map(template.find, ["extra.user_friendly"] * 8))
+
+        # then:
+        self.assertEqual(["Foo bar"] * 3, found)
+        self.assertEqual(["Extra"] * 8, extras)
+        build_key_index.assert_called_once()
+
     def test_get_tab_name(self):
         data = '{"id" : "' + self.dummyDonorUri + '", "properties": {"foo_bar": {"user_friendly" : "Foo bar"}} }'
         template = schema_mock.get_template_for_json(data=data)
@@ -62,6 +106,14 @@ class TestSchemaTemplate(TestCase):
         with self.assertRaises(UnknownKeyException):
             template.get_key_for_label("Bar foo", "Donor organism")
 
+    def test_find_key_in_tab(self):
+        data = '{"id" : "' + self.dummyDonorUri + '", "properties": {"foo_bar": {"user_friendly" : "Foo bar"}} }'
+        template = schema_mock.get_template_for_json(data=data)
+
+        self.assertEqual("donor_organism.foo_bar", template.find_key_for_label("Foo bar", "Donor organism"))
+        self.assertIsNone(template.find_key_for_label("Bar foo", "Donor organism"))
+        self.assertIsNone(template.find_key_for_label("Foo bar", "Unknown tab"))
+
     def test_required_fields(self):
         data = '{"id" : "' + self.dummyDonorUri + '", "required": ["foo_bar"], "properties": { "foo_bar": {"user_friendly" : "Foo bar"}, "bar_foo" : {}} }'
         template = schema_mock.get_template_for_json(data=data)
@@ -189,6 +241,82 @@ class TestSchemaTemplate(TestCase):
         self.assertEqual("biomaterial id", template.lookup("donor_organism.biomaterial_core.biomaterial_id.user_friendly"))
         self.assertEqual("a biomaterial id", template.lookup("donor_organism.biomaterial_core.biomaterial_id.description"))
 
+    @patch('urllib.request.urlopen')
+    def test_referenced_schemas_fetched_once(self, mock_urlopen):
+        # given:
+        core_uri = 'https://schema.humancellatlas.org/core/biomaterial/5.1.0/biomaterial_core'
+        ontology_uri = 'https://schema.humancellatlas.org/module/ontology/5.1.0/species_ontology'
+        schemas = {
+            self.dummyDonorUri: {'id': self.dummyDonorUri, 'properties': {
+                'biomaterial_core': {'$ref': core_uri}}},
+            self.dummySpecimenUri: {'id': self.dummySpecimenUri, 'properties': {
+                'biomaterial_core': {'$ref': core_uri}}},
+            core_uri: {'properties': {
+                'biomaterial_id': {'user_friendly': 'biomaterial id'},
+                'ncbi_taxon': {'$ref': ontology_uri + '#/properties/text'}}},
+            ontology_uri: {'properties': {'text': {'user_friendly': 'species'}}}
+        }
+
+        # and:
+        def open_schema(uri):
+            response = MagicMock()
+            response.read.return_value = json.dumps(schemas[uri]).encode()
+            response.__enter__.return_value = response
+            return response
+        mock_urlopen.side_effect = open_schema
+
+        # when:
+        template = SchemaTemplate(list_of_schema_urls=[self.dummyDonorUri, self.dummySpecimenUri],
+                                  cache=False)
+
+        # then:
+        self.assertEqual('biomaterial id',
+                         template.lookup('donor_organism.biomaterial_core.biomaterial_id.user_friendly'))
+        self.assertEqual('biomaterial id',
+                         template.lookup('specimen_from_organism.biomaterial_core.biomaterial_id.user_friendly'))
+        self.assertEqual('species',
+                         template.lookup('donor_organism.biomaterial_core.ncbi_taxon.user_friendly'))
+
+        # and:
+        fetched_uris = [fetch_call[0][0] for fetch_call in mock_urlopen.call_args_list]
+        self.assertCountEqual(schemas.keys(), fetched_uris)
+
+    def test_snapshot_round_trip(self):
+        # given:
+        data = '{"id" : "' + self.dummyDonorUri + '", "properties": {"foo_bar": {"user_friendly" : "Foo bar"}} }'
+        template = schema_mock.get_template_for_json(data=data)
+
+        # and:
+        snapshot_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, snapshot_dir)
+        snapshot_path = os.path.join(snapshot_dir, 'template.json')
+
+        # when:
+        template.dump_snapshot(snapshot_path)
+        restored = SchemaTemplate.load_snapshot(snapshot_path)
+
+        # then:
+        self.assertEqual(['test_url'], restored.get_schema_urls())
+        self.assertEqual("biomaterial", restored.lookup("donor_organism.schema.domain_entity"))
+        self.assertEqual("Foo bar", restored.lookup("donor_organism.foo_bar.user_friendly"))
+        self.assertEqual("donor_organism.foo_bar", restored.get_key_for_label("Foo bar", "Donor organism"))
+        self.assertEqual("donor_organism", restored.get_tabs_config().get_key_for_label("Donor organism"))
+
+        # and:
+        donor_schema = restored.lookup("donor_organism").schema
+        self.assertEqual("donor_organism", donor_schema.module)
+        self.assertEqual(template.json_dump(), restored.json_dump())
+
+    def test_snapshot_of_unknown_version(self):
+        # given:
+        data = '{"id" : "' + self.dummyDonorUri + '", "properties": {}}'
+        snapshot = schema_mock.get_template_for_json(data=data).snapshot()
+        snapshot['snapshot_version'] = 0
+
+        # expect:
+        with self.assertRaises(SnapshotVersionException):
+            SchemaTemplate.from_snapshot(snapshot)
+
     def test_example(self):
         data = '{"id" : "' + self.dummyDonorUri + '", "properties": {"foo_bar": {"example" : "Foo is a bar"}} }'
         template = schema_mock.get_template_for_json(data=data)